@@ -6,9 +6,17 @@ Handles both inbox monitoring and email sending for tenant applications
 import os
 import httpx
 import re
-from typing import List, Dict, Any, Optional
+import random
+import asyncio
+import weakref
+from typing import List, Dict, Any, Optional, AsyncIterator, Iterable
 from datetime import datetime
 
+from backend_modules.thread_cache import ThreadCache
+from backend_modules.inbox_summary import InboxSummary
+from backend_modules.blob_store import BlobStore, BLOB_CHUNK_SIZE, get_blob_store
+from backend_modules.email_fields import email_field_extractor
+
 AGENTMAIL_API_KEY = os.getenv("AGENTMAIL_API_KEY", "")
 AGENTMAIL_INBOX_ID = os.getenv("AGENTMAIL_INBOX_ID", "")
 AGENTMAIL_API_URL = os.getenv("AGENTMAIL_API_URL", "https://api.agentmail.to")
@@ -19,6 +27,22 @@ if not AGENTMAIL_API_URL or not AGENTMAIL_API_URL.strip():
 elif not AGENTMAIL_API_URL.startswith(("http://", "https://")):
     AGENTMAIL_API_URL = f"https://{AGENTMAIL_API_URL.strip()}"
 
+# Connection pool, timeouts and retry policy for the shared client
+AGENTMAIL_TIMEOUT = float(os.getenv("AGENTMAIL_TIMEOUT", "30"))
+AGENTMAIL_CONNECT_TIMEOUT = float(os.getenv("AGENTMAIL_CONNECT_TIMEOUT", "5"))
+AGENTMAIL_MAX_CONNECTIONS = int(os.getenv("AGENTMAIL_MAX_CONNECTIONS", "20"))
+AGENTMAIL_MAX_RETRIES = int(os.getenv("AGENTMAIL_MAX_RETRIES", "3"))
+AGENTMAIL_RETRY_BASE_SECONDS = 0.5
+AGENTMAIL_RETRY_MAX_SECONDS = 8.0
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Thread listing page size and how many thread details are fetched at once
+AGENTMAIL_PAGE_SIZE = int(os.getenv("AGENTMAIL_PAGE_SIZE", "100"))
+AGENTMAIL_FETCH_CONCURRENCY = int(os.getenv("AGENTMAIL_FETCH_CONCURRENCY", "8"))
+
+def thread_updated_at(thread: Dict[str, Any]) -> str:
+    """Last-activity timestamp of a thread listing entry ("" if the API didn't send one)"""
+    return thread.get("updated_at") or thread.get("timestamp") or thread.get("created_at") or ""
+
 class AgentmailClient:
     """Client for Agentmail API operations"""
     
@@ -50,73 +74,180 @@ class AgentmailClient:
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
             }
+        
+        # One keep-alive pool per event loop (httpx connections can't cross loops)
+        self._http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        # Shared by every caller of the singleton; webhooks invalidate it via note_message
+        self.thread_cache = ThreadCache()
+        # Materialized per-thread counts for the inbox status view
+        self.inbox_summary = InboxSummary()
     
-    async def list_threads(self, inbox_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    def _http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._http_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(AGENTMAIL_TIMEOUT, connect=AGENTMAIL_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=AGENTMAIL_MAX_CONNECTIONS,
+                                    max_keepalive_connections=AGENTMAIL_MAX_CONNECTIONS),
+            )
+            self._http_clients[loop] = client
+        return client
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request on the pooled client, retrying transient failures with jittered exponential backoff
+        Reads are retried on any transport error or 429/5xx; writes only when the request can't have
+        reached the server (connection failures) or was rate limited, so an email is never sent twice
         """
-        List threads from Agentmail
+        # Safety check on constructed URL
+        if not url.startswith(("http://", "https://")):
+            raise ValueError(f"Invalid URL constructed: {url} - missing protocol. api_url was: {self.api_url}")
+        
+        idempotent = method.upper() in ("GET", "HEAD")
+        for attempt in range(AGENTMAIL_MAX_RETRIES + 1):
+            retry_after = None
+            try:
+                response = await self._http().request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                error = e
+            except httpx.TransportError as e:
+                if not idempotent:
+                    raise
+                error = e
+            else:
+                retryable = response.status_code == 429 or (idempotent and response.status_code in RETRYABLE_STATUSES)
+                if not retryable or attempt == AGENTMAIL_MAX_RETRIES:
+                    return response
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+            
+            if attempt == AGENTMAIL_MAX_RETRIES:
+                raise error
+            delay = random.uniform(0, min(AGENTMAIL_RETRY_MAX_SECONDS, AGENTMAIL_RETRY_BASE_SECONDS * 2 ** attempt))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            print(f"⚠️ Agentmail {method} {url} failed ({error}), retry {attempt + 1}/{AGENTMAIL_MAX_RETRIES} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    
+    def note_message(self, thread_id: Optional[str], message_id: Optional[str], sender: str = "",
+                     subject: str = "", timestamp: str = "", incoming: bool = True) -> None:
+        """Record a new message in a thread (webhook delivery or our own send) in the cache and summary"""
+        self.thread_cache.note_message(thread_id, message_id)
+        self.inbox_summary.note_message(thread_id, message_id, sender=sender, subject=subject,
+                                        timestamp=timestamp, unread=incoming)
+    
+    async def aclose(self) -> None:
+        """Close the pooled connections"""
+        for client in list(self._http_clients.values()):
+            await client.aclose()
+        self._http_clients.clear()
+    
+    async def iter_threads(self, inbox_id: Optional[str] = None,
+                           page_size: int = AGENTMAIL_PAGE_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield pages of threads (most recently active first), following next_page_token
         If inbox_id is provided, lists threads for that inbox only
         If inbox_id is None, lists all threads across the organization
+        Callers can stop iterating as soon as they've seen enough; later pages are never requested
         """
         if not self.api_key:
             print("⚠️ Agentmail credentials not configured")
-            return []
+            return
+        
+        if inbox_id:
+            # List threads for specific inbox
+            url = f"{self.api_url}/v0/inboxes/{inbox_id}/threads"
+        else:
+            # List threads across organization (per API docs: /v0/threads)
+            url = f"{self.api_url}/v0/threads"
         
+        page_token = None
+        while True:
+            params = {"limit": page_size}
+            if page_token:
+                params["page_token"] = page_token
+            response = await self._request("GET", url, params=params)
+            response.raise_for_status()
+            data = response.json()
+            # Handle both list response format and direct array
+            if isinstance(data, dict):
+                threads = data.get("threads", data.get("data", []))
+                page_token = data.get("next_page_token")
+            else:
+                threads = data if isinstance(data, list) else []
+                page_token = None
+            if inbox_id == self.inbox_id:
+                for thread in threads:
+                    self.inbox_summary.update_from_listing(thread)
+                if not page_token:
+                    self.inbox_summary.seeded = True
+            if threads:
+                yield threads
+            if not threads or not page_token:
+                return
+    
+    async def list_threads(self, inbox_id: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        List threads from Agentmail (all of them, or the `limit` most recent)
+        """
+        threads: List[Dict[str, Any]] = []
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                if inbox_id:
-                    # List threads for specific inbox
-                    url = f"{self.api_url}/v0/inboxes/{inbox_id}/threads"
-                else:
-                    # List threads across organization (per API docs: /v0/threads)
-                    url = f"{self.api_url}/v0/threads"
-                
-                # Safety check on constructed URL
-                if not url.startswith(("http://", "https://")):
-                    raise ValueError(f"Invalid URL constructed: {url} - missing protocol. api_url was: {self.api_url}")
-                
-                response = await client.get(url, headers=self.headers)
-                response.raise_for_status()
-                data = response.json()
-                # Handle both list response format and direct array
-                if isinstance(data, dict):
-                    return data.get("threads", data.get("data", []))
-                return data if isinstance(data, list) else []
+            async for page in self.iter_threads(inbox_id, page_size=min(limit or AGENTMAIL_PAGE_SIZE, AGENTMAIL_PAGE_SIZE)):
+                threads.extend(page)
+                if limit and len(threads) >= limit:
+                    return threads[:limit]
+            return threads
         except Exception as e:
             print(f"❌ Error listing Agentmail threads: {e}")
-            return []
+            return threads
     
-    async def get_thread(self, thread_id: str) -> Dict[str, Any]:
+    async def get_thread(self, thread_id: str, updated_at: str = "") -> Dict[str, Any]:
         """
         Get a single thread by ID
-        Returns thread with its messages
+        Returns thread with its messages, from the thread cache when it's fresh
+        (and no older than `updated_at`, if the caller knows the thread's last activity)
         """
         if not self.api_key:
             print("⚠️ Agentmail credentials not configured")
             return {}
         
+        cached = self.thread_cache.get(thread_id, updated_at)
+        if cached is not None:
+            return cached
+        
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                # Per API docs: /v0/threads/{thread_id}
-                url = f"{self.api_url}/v0/threads/{thread_id}"
-                
-                # Safety check on constructed URL
-                if not url.startswith(("http://", "https://")):
-                    raise ValueError(f"Invalid URL constructed: {url} - missing protocol. api_url was: {self.api_url}")
-                
-                response = await client.get(url, headers=self.headers)
-                response.raise_for_status()
-                return response.json()
+            # Per API docs: /v0/threads/{thread_id}
+            response = await self._request("GET", f"{self.api_url}/v0/threads/{thread_id}")
+            response.raise_for_status()
+            thread = response.json()
+            self.thread_cache.put(thread)
+            self.inbox_summary.update_from_thread(thread)
+            return thread
         except Exception as e:
             print(f"❌ Error getting Agentmail thread: {e}")
             return {}
     
+    async def get_threads(self, thread_ids: Iterable[str], updated_at: Optional[Dict[str, str]] = None,
+                          concurrency: int = AGENTMAIL_FETCH_CONCURRENCY) -> List[Dict[str, Any]]:
+        """Fetch several threads at once, at most `concurrency` in flight; results follow thread_ids order"""
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        updated_at = updated_at or {}
+        
+        async def fetch(thread_id: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.get_thread(thread_id, updated_at.get(thread_id, ""))
+        
+        return await asyncio.gather(*(fetch(thread_id) for thread_id in thread_ids))
+    
     async def check_inbox(self, user_id: Optional[str] = None, auto_index: bool = True) -> List[Dict[str, Any]]:
         """
         Poll inbox for new threads (conversations)
         Returns list of threads with unread messages
         
         Since Agentmail's list_threads() may not include messages in the response,
-        we fetch full thread details for all threads and check for unread messages.
+        we fetch full thread details (a page at a time, concurrently) and check for unread messages.
         
         Args:
             user_id: Optional user ID for processing
@@ -127,56 +258,25 @@ class AgentmailClient:
             return []
         
         try:
-            # Get all threads for this inbox
-            threads = await self.list_threads(self.inbox_id)
-            
-            if not threads:
-                print("📭 No threads found in inbox")
-                return []
-            
-            print(f"📬 Found {len(threads)} thread(s) in inbox, checking for unread messages...")
-            
             # Filter for threads with unread messages
             new_threads = []
-            for thread in threads:
-                thread_id = thread.get("thread_id") or thread.get("id")
-                if not thread_id:
-                    continue
-                
+            thread_count = 0
+            async for page in self.iter_threads(self.inbox_id):
+                thread_count += len(page)
+                listed = {t.get("thread_id") or t.get("id"): thread_updated_at(t) for t in page}
+                thread_ids = [thread_id for thread_id in listed if thread_id]
                 # Get full thread details to check for unread messages
                 # (list_threads() may not include messages in the response)
-                full_thread = await self.get_thread(thread_id)
-                if not full_thread:
-                    continue
-                
-                # Check if thread has unread messages
-                messages = full_thread.get("messages", [])
-                if not messages:
-                    # No messages yet, skip
-                    continue
-                
-                unread_messages = [msg for msg in messages if not msg.get("read", False)]
-                
-                if unread_messages:
-                    print(f"📧 Thread {thread_id} has {len(unread_messages)} unread message(s)")
-                    
-                    # Extract email info if requested
-                    if auto_index and user_id:
-                        try:
-                            extract_result = await self.extract_email_info(
-                                thread=full_thread
-                            )
-                            if extract_result.get("success"):
-                                abstracted = extract_result.get("abstracted_info", {})
-                                print(f"   ✅ Extracted info: name={abstracted.get('name')}, credit={abstracted.get('credit_score')}, income=${abstracted.get('monthly_income', 0):,.2f}")
-                            else:
-                                print(f"   ⚠️ Could not extract email info: {extract_result.get('error')}")
-                        except Exception as extract_error:
-                            print(f"   ⚠️ Error extracting email info: {extract_error}")
-                    
-                    new_threads.append(full_thread)
+                full_threads = await self.get_threads(thread_ids, updated_at=listed)
+                for thread_id, full_thread in zip(thread_ids, full_threads):
+                    if full_thread:
+                        await self._index_unread_thread(thread_id, full_thread, user_id, auto_index, new_threads)
+            
+            if not thread_count:
+                print("📭 No threads found in inbox")
+                return []
             
-            print(f"✅ Found {len(new_threads)} thread(s) with unread messages")
+            print(f"✅ Found {len(new_threads)} of {thread_count} thread(s) with unread messages")
             return new_threads
         except Exception as e:
             print(f"❌ Error checking Agentmail inbox: {e}")
@@ -184,6 +284,33 @@ class AgentmailClient:
             traceback.print_exc()
             return []
     
+    async def _index_unread_thread(self, thread_id: str, full_thread: Dict[str, Any], user_id: Optional[str],
+                                   auto_index: bool, new_threads: List[Dict[str, Any]]) -> None:
+        """Collect a thread into new_threads if it has unread messages, extracting its email info if requested"""
+        # Check if thread has unread messages
+        messages = full_thread.get("messages", [])
+        unread_messages = [msg for msg in messages if not msg.get("read", False)]
+        if not unread_messages:
+            return
+        
+        print(f"📧 Thread {thread_id} has {len(unread_messages)} unread message(s)")
+        
+        # Extract email info if requested
+        if auto_index and user_id:
+            try:
+                extract_result = await self.extract_email_info(
+                    thread=full_thread
+                )
+                if extract_result.get("success"):
+                    abstracted = extract_result.get("abstracted_info", {})
+                    print(f"   ✅ Extracted info: name={abstracted.get('name')}, credit={abstracted.get('credit_score')}, income=${abstracted.get('monthly_income', 0):,.2f}")
+                else:
+                    print(f"   ⚠️ Could not extract email info: {extract_result.get('error')}")
+            except Exception as extract_error:
+                print(f"   ⚠️ Error extracting email info: {extract_error}")
+        
+        new_threads.append(full_thread)
+    
     async def send_email(
         self,
         to: str,
@@ -202,92 +329,97 @@ class AgentmailClient:
             print("⚠️ Agentmail credentials not configured")
             return {"success": False, "error": "Agentmail not configured"}
         
+        message_id_to_reply = None
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                if reply_to_thread_id or reply_to_message_id:
-                    # Reply to existing thread/message
-                    # Per Agentmail docs: Use inboxes.messages.reply with message_id
-                    message_id_to_reply = reply_to_message_id
-                    thread_id = reply_to_thread_id
-                    
-                    # If we have thread_id but not message_id, get the last message from thread
-                    if thread_id and not message_id_to_reply:
-                        print(f"📧 Getting last message from thread {thread_id} for reply")
-                        try:
-                            thread_details = await self.get_thread(thread_id)
-                            if thread_details and thread_details.get("messages"):
-                                messages = thread_details.get("messages", [])
-                                if messages:
-                                    last_message = messages[-1]
-                                    message_id_to_reply = last_message.get("message_id") or last_message.get("id")
-                                    print(f"   ✅ Found last message: {message_id_to_reply}")
-                                else:
-                                    print(f"   ⚠️ Thread has no messages, falling back to regular send")
-                                    message_id_to_reply = None
+            if reply_to_thread_id or reply_to_message_id:
+                # Reply to existing thread/message
+                # Per Agentmail docs: Use inboxes.messages.reply with message_id
+                message_id_to_reply = reply_to_message_id
+                thread_id = reply_to_thread_id
+                
+                # If we have thread_id but not message_id, use the cached last-message pointer
+                if thread_id and not message_id_to_reply:
+                    message_id_to_reply = self.thread_cache.last_message_id(thread_id)
+                
+                # Otherwise get the last message from thread
+                if thread_id and not message_id_to_reply:
+                    print(f"📧 Getting last message from thread {thread_id} for reply")
+                    try:
+                        thread_details = await self.get_thread(thread_id)
+                        if thread_details and thread_details.get("messages"):
+                            messages = thread_details.get("messages", [])
+                            if messages:
+                                last_message = messages[-1]
+                                message_id_to_reply = last_message.get("message_id") or last_message.get("id")
+                                print(f"   ✅ Found last message: {message_id_to_reply}")
                             else:
-                                print(f"   ⚠️ Could not get thread details, falling back to regular send")
+                                print(f"   ⚠️ Thread has no messages, falling back to regular send")
                                 message_id_to_reply = None
-                        except Exception as thread_error:
-                            print(f"   ⚠️ Error getting thread: {thread_error}, falling back to regular send")
+                        else:
+                            print(f"   ⚠️ Could not get thread details, falling back to regular send")
                             message_id_to_reply = None
-                    
-                    # Use the correct endpoint: /v0/inboxes/{inbox_id}/messages/{message_id}/reply
-                    if message_id_to_reply:
-                        url = f"{self.api_url}/v0/inboxes/{self.inbox_id}/messages/{message_id_to_reply}/reply"
-                    else:
-                        # Fallback to regular send if we don't have a valid message_id
-                        url = f"{self.api_url}/v0/inboxes/{self.inbox_id}/send"
-                    
-                    # Convert 'to' to array format per API docs
-                    to_array = [to] if isinstance(to, str) else to
-                    payload = {
-                        "to": to_array,
-                        "subject": subject,
-                        "text": body,  # API uses 'text' not 'body'
-                        "attachments": attachments if attachments else []
-                    }
+                    except Exception as thread_error:
+                        print(f"   ⚠️ Error getting thread: {thread_error}, falling back to regular send")
+                        message_id_to_reply = None
+                
+                # Use the correct endpoint: /v0/inboxes/{inbox_id}/messages/{message_id}/reply
+                if message_id_to_reply:
+                    url = f"{self.api_url}/v0/inboxes/{self.inbox_id}/messages/{message_id_to_reply}/reply"
                 else:
-                    # New message (creates new thread)
+                    # Fallback to regular send if we don't have a valid message_id
                     url = f"{self.api_url}/v0/inboxes/{self.inbox_id}/send"
-                    # Convert 'to' to array format per API docs
-                    to_array = [to] if isinstance(to, str) else to
-                    payload = {
-                        "to": to_array,
-                        "subject": subject,
-                        "text": body,  # API uses 'text' not 'body'
-                        "attachments": attachments if attachments else []
-                    }
                 
-                # Final safety check on constructed URL
-                if not url.startswith(("http://", "https://")):
-                    raise ValueError(f"Invalid URL constructed: {url} - missing protocol. api_url was: {self.api_url}")
-                
-                response = await client.post(url, headers=self.headers, json=payload)
-                
-                # If 404 on reply endpoint, fallback to regular send
-                if response.status_code == 404 and message_id_to_reply:
-                    print(f"⚠️ Reply endpoint returned 404, falling back to regular send email")
-                    fallback_url = f"{self.api_url}/v0/inboxes/{self.inbox_id}/send"
-                    print(f"   Using fallback URL: {fallback_url}")
-                    try:
-                        fallback_response = await client.post(fallback_url, headers=self.headers, json=payload)
-                        if fallback_response.status_code == 200 or fallback_response.status_code == 201:
-                            print(f"✅ Successfully sent email via fallback (regular send)")
-                            response = fallback_response
-                        else:
-                            print(f"   ❌ Fallback also returned {fallback_response.status_code}")
-                            response.raise_for_status()
-                    except Exception as fallback_error:
-                        print(f"   ❌ Fallback error: {fallback_error}")
+                # Convert 'to' to array format per API docs
+                to_array = [to] if isinstance(to, str) else to
+                payload = {
+                    "to": to_array,
+                    "subject": subject,
+                    "text": body,  # API uses 'text' not 'body'
+                    "attachments": attachments if attachments else []
+                }
+            else:
+                # New message (creates new thread)
+                url = f"{self.api_url}/v0/inboxes/{self.inbox_id}/send"
+                # Convert 'to' to array format per API docs
+                to_array = [to] if isinstance(to, str) else to
+                payload = {
+                    "to": to_array,
+                    "subject": subject,
+                    "text": body,  # API uses 'text' not 'body'
+                    "attachments": attachments if attachments else []
+                }
+            
+            response = await self._request("POST", url, json=payload)
+            
+            # If 404 on reply endpoint, fallback to regular send
+            if response.status_code == 404 and message_id_to_reply:
+                print(f"⚠️ Reply endpoint returned 404, falling back to regular send email")
+                fallback_url = f"{self.api_url}/v0/inboxes/{self.inbox_id}/send"
+                print(f"   Using fallback URL: {fallback_url}")
+                try:
+                    fallback_response = await self._request("POST", fallback_url, json=payload)
+                    if fallback_response.status_code == 200 or fallback_response.status_code == 201:
+                        print(f"✅ Successfully sent email via fallback (regular send)")
+                        response = fallback_response
+                    else:
+                        print(f"   ❌ Fallback also returned {fallback_response.status_code}")
                         response.raise_for_status()
-                else:
+                except Exception as fallback_error:
+                    print(f"   ❌ Fallback error: {fallback_error}")
                     response.raise_for_status()
-                result = response.json()
-                return {
-                    "success": True,
-                    "message_id": result.get("id") or result.get("message_id"),
-                    "thread_id": result.get("thread_id")
-                }
+            else:
+                response.raise_for_status()
+            result = response.json()
+            sent_message_id = result.get("id") or result.get("message_id")
+            # Our message is now the newest in the thread
+            self.note_message(result.get("thread_id") or reply_to_thread_id, sent_message_id,
+                              sender=self.inbox_id, subject=subject, timestamp=datetime.utcnow().isoformat() + "Z",
+                              incoming=False)
+            return {
+                "success": True,
+                "message_id": sent_message_id,
+                "thread_id": result.get("thread_id")
+            }
         except Exception as e:
             print(f"❌ Error sending email via Agentmail: {e}")
             import traceback
@@ -300,20 +432,48 @@ class AgentmailClient:
             raise Exception("Agentmail not configured")
         
         try:
-            async with httpx.AsyncClient(timeout=60) as client:
-                url = f"{self.api_url}/v0/attachments/{attachment_id}/download"
-                
-                # Safety check on constructed URL
-                if not url.startswith(("http://", "https://")):
-                    raise ValueError(f"Invalid URL constructed: {url} - missing protocol. api_url was: {self.api_url}")
-                
-                response = await client.get(url, headers=self.headers)
-                response.raise_for_status()
-                return response.content
+            # Attachments can be large, so allow longer reads than API calls
+            response = await self._request("GET", f"{self.api_url}/v0/attachments/{attachment_id}/download",
+                                           timeout=httpx.Timeout(60, connect=AGENTMAIL_CONNECT_TIMEOUT))
+            response.raise_for_status()
+            return response.content
         except Exception as e:
             print(f"❌ Error downloading attachment: {e}")
             raise
-    
+
+    async def store_attachment(self, attachment_id: str, filename: str = "",
+                               store: Optional[BlobStore] = None) -> Dict[str, Any]:
+        """
+        Stream an attachment into the blob store and return its metadata ("ref", "content_type", ...)
+        The body is written to disk chunk by chunk, never held in memory; an attachment already
+        stored under this id is not downloaded again
+        """
+        if not self.api_key:
+            raise Exception("Agentmail not configured")
+        store = store or get_blob_store()
+        source_key = f"agentmail:{attachment_id}"
+        stored = store.lookup(source_key)
+        if stored:
+            return stored
+
+        url = f"{self.api_url}/v0/attachments/{attachment_id}/download"
+        for attempt in range(AGENTMAIL_MAX_RETRIES + 1):
+            try:
+                async with self._http().stream("GET", url, timeout=httpx.Timeout(60, connect=AGENTMAIL_CONNECT_TIMEOUT)) as response:
+                    if response.status_code not in RETRYABLE_STATUSES or attempt == AGENTMAIL_MAX_RETRIES:
+                        response.raise_for_status()
+                        return await store.write_stream(response.aiter_bytes(BLOB_CHUNK_SIZE), filename,
+                                                        source_key=source_key)
+                    error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                if attempt == AGENTMAIL_MAX_RETRIES:
+                    print(f"❌ Error downloading attachment {attachment_id}: {e}")
+                    raise
+                error = e
+            delay = random.uniform(0, min(AGENTMAIL_RETRY_MAX_SECONDS, AGENTMAIL_RETRY_BASE_SECONDS * 2 ** attempt))
+            print(f"⚠️ Attachment {attachment_id} download failed ({error}), retry {attempt + 1}/{AGENTMAIL_MAX_RETRIES} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
     async def extract_email_info(
         self,
         thread: Dict[str, Any]
@@ -333,22 +493,11 @@ class AgentmailClient:
             if not messages:
                 return {"success": False, "error": "No messages in thread"}
             
-            # Extract text from all messages in the thread
-            email_text_parts = []
-            for message in messages:
-                # Try text field first, then html, then body
-                text = message.get("text") or message.get("html") or message.get("body", "")
-                if text:
-                    email_text_parts.append(text)
-            
-            if not email_text_parts:
+            if not any(m.get("text") or m.get("html") or m.get("body") for m in messages):
                 return {"success": False, "error": "No text content in messages"}
             
-            # Combine all message text
-            full_email_text = "\n\n---\n\n".join(email_text_parts)
-            
-            # Extract important information
-            abstracted_info = self._extract_important_info(full_email_text, thread)
+            # Each message is scanned once and cached by message_id, so only new replies cost anything
+            abstracted_info = email_field_extractor.extract_thread(thread)
             
             return {
                 "success": True,
@@ -360,134 +509,20 @@ class AgentmailClient:
             import traceback
             traceback.print_exc()
             return {"success": False, "error": str(e)}
-    
-    def _extract_important_info(self, email_text: str, thread: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Extract important information from email text
-        Looks for: name, credit score, income, phone, email, employer, etc.
-        """
-        info = {}
-        
-        # Extract name - try from senders first, then from email text
-        senders = thread.get("senders", [])
-        if senders:
-            info["name"] = senders[0] if isinstance(senders, list) else senders
-        else:
-            # Try to extract from email text
-            name_patterns = [
-                r'(?:name|applicant)[\s:]+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',
-                r'^(?:hi|hello|dear)[\s,]+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',
-                r'i\s+(?:am|m)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',
-                r'([A-Z][a-z]+\s+[A-Z][a-z]+)',  # First Last pattern
-            ]
-            for pattern in name_patterns:
-                match = re.search(pattern, email_text, re.IGNORECASE | re.MULTILINE)
-                if match:
-                    info["name"] = match.group(1).strip()
-                    break
-        
-        # Extract credit score
-        credit_patterns = [
-            r'credit\s+score[:\s]+(\d{3})',
-            r'score[:\s]+(\d{3})',
-            r'(\d{3})\s+credit',
-            r'fico[:\s]+(\d{3})',
-        ]
-        for pattern in credit_patterns:
-            match = re.search(pattern, email_text, re.IGNORECASE)
-            if match:
-                score = int(match.group(1))
-                if 300 <= score <= 850:  # Valid credit score range
-                    info["credit_score"] = score
-                    break
-        
-        # Extract income (monthly or annual)
-        income_patterns = [
-            r'monthly\s+income[:\s$]+(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'income[:\s$]+(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:per\s+month|monthly)',
-            r'(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:per\s+month|monthly)',
-            r'annual\s+income[:\s$]+(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'income[:\s$]+(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:per\s+year|annually)',
-            r'(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:per\s+year|annually)',
-            r'salary[:\s$]+(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'make[:\s$]+(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-        ]
-        for pattern in income_patterns:
-            match = re.search(pattern, email_text, re.IGNORECASE)
-            if match:
-                income_str = match.group(1).replace(',', '').replace('$', '')
-                try:
-                    income = float(income_str)
-                    # Determine if monthly or annual based on context
-                    if 'monthly' in match.group(0).lower() or 'per month' in match.group(0).lower():
-                        info["monthly_income"] = income
-                        info["annual_income"] = income * 12
-                    elif 'annual' in match.group(0).lower() or 'year' in match.group(0).lower():
-                        info["annual_income"] = income
-                        info["monthly_income"] = income / 12
-                    else:
-                        # Default assumption: if > 100k, it's annual; otherwise monthly
-                        if income > 100000:
-                            info["annual_income"] = income
-                            info["monthly_income"] = income / 12
-                        else:
-                            info["monthly_income"] = income
-                            info["annual_income"] = income * 12
-                    break
-                except ValueError:
-                    continue
-        
-        # Extract phone number
-        phone_patterns = [
-            r'(\+?1?[-.\s]?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4})',
-            r'phone[:\s]+(\d{3}[-.\s]?\d{3}[-.\s]?\d{4})',
-            r'(\d{3}[-.\s]?\d{3}[-.\s]?\d{4})',
-        ]
-        for pattern in phone_patterns:
-            match = re.search(pattern, email_text)
-            if match:
-                info["phone"] = match.group(1).strip()
-                break
-        
-        # Extract email (from thread senders - the sender is who sent us the email)
-        if not info.get("email"):
-            senders = thread.get("senders", [])
-            if senders:
-                # senders is an array of email addresses
-                if isinstance(senders, list) and len(senders) > 0:
-                    info["email"] = senders[0]
-                else:
-                    info["email"] = str(senders)
-        
-        # Extract employer
-        employer_patterns = [
-            r'employer[:\s]+([A-Za-z\s&]+)',
-            r'work\s+at[:\s]+([A-Za-z\s&]+)',
-            r'company[:\s]+([A-Za-z\s&]+)',
-            r'employer\s+name[:\s]+([A-Za-z\s&]+)',
-        ]
-        for pattern in employer_patterns:
-            match = re.search(pattern, email_text, re.IGNORECASE)
-            if match:
-                info["employer"] = match.group(1).strip()
-                break
-        
-        # Extract property interest (if mentioned)
-        property_patterns = [
-            r'property[:\s]+(.+)',
-            r'address[:\s]+(.+)',
-            r'interested\s+in[:\s]+(.+)',
-        ]
-        for pattern in property_patterns:
-            match = re.search(pattern, email_text, re.IGNORECASE)
-            if match:
-                property_info = match.group(1).strip()
-                if len(property_info) < 100:  # Reasonable length
-                    info["property_interest"] = property_info
-                break
-        
-        return info
-    
+
+
+_agentmail_client: Optional[AgentmailClient] = None
+
+def get_agentmail_client() -> AgentmailClient:
+    """Process-wide AgentmailClient, so every caller shares one connection pool"""
+    global _agentmail_client
+    if _agentmail_client is None:
+        _agentmail_client = AgentmailClient()
+    return _agentmail_client
+
+async def close_agentmail_client() -> None:
+    if _agentmail_client is not None:
+        await _agentmail_client.aclose()
 
 # Email templates
 def get_approval_email_template(applicant_name: str, property_name: str = "the property") -> tuple[str, str]:
@@ -572,3 +607,19 @@ Property Management Team"""
     
     return subject, body
 
+
+def get_lease_renewal_email_template(tenant_name: str, property_name: str, unit: str, end_date: str,
+                                     days_left: int) -> tuple[str, str]:
+    """Generate lease renewal reminder email subject and body"""
+    subject = f"Your lease at {property_name} ends in {days_left} days"
+    
+    body = f"""Hi {tenant_name},
+
+This is a reminder that your lease for unit {unit} at {property_name} ends on {end_date}.
+
+If you'd like to renew, please reply to this email or text us and we'll send over the renewal terms. If you plan to move out, let us know so we can schedule your move-out inspection.
+
+Best regards,
+Property Management Team"""
+    
+    return subject, body
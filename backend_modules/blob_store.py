@@ -0,0 +1,170 @@
+"""
+Attachment blob store
+Content-addressed local storage for downloaded email attachments, keyed by SHA-256
+"""
+
+import os
+import json
+import uuid
+import base64
+import hashlib
+import mimetypes
+import threading
+from typing import Any, AsyncIterable, Dict, Optional
+
+BLOB_STORE_PATH = os.getenv("BLOB_STORE_PATH", "attachments")
+# Larger attachments are rejected mid-download instead of filling the disk
+BLOB_MAX_BYTES = int(os.getenv("BLOB_MAX_BYTES", str(25 * 1024 * 1024)))
+BLOB_CHUNK_SIZE = 64 * 1024
+BLOB_REF_PREFIX = "blob://"
+
+# Leading bytes -> content type; checked in order, first match wins
+_MAGIC = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+    (b"PK\x03\x04", "application/zip"),
+]
+
+
+class BlobTooLarge(ValueError):
+    pass
+
+
+def sniff_content_type(head: bytes, filename: str = "") -> str:
+    """Content type from the file's leading bytes, falling back to its extension"""
+    for magic, content_type in _MAGIC:
+        if head.startswith(magic):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return mimetypes.guess_type(filename or "")[0] or "application/octet-stream"
+
+
+def is_blob_ref(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith(BLOB_REF_PREFIX)
+
+
+class BlobStore:
+    """
+    <root>/<sha[:2]>/<sha> holds the bytes and <sha>.json its metadata (content type, size, filename)
+    Downloads are hashed while they stream to a temp file and renamed into place, so identical
+    documents are stored once. refs/ maps a source key (e.g. an Agentmail attachment id) to its
+    hash, so a re-processed email doesn't download the same attachment again.
+    """
+
+    def __init__(self, root: str = BLOB_STORE_PATH, max_bytes: int = BLOB_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+        os.makedirs(os.path.join(root, "refs"), exist_ok=True)
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def _ref_path(self, source_key: str) -> str:
+        return os.path.join(self.root, "refs", hashlib.sha256(source_key.encode()).hexdigest())
+
+    @staticmethod
+    def ref(sha256: str) -> str:
+        return f"{BLOB_REF_PREFIX}{sha256}"
+
+    @staticmethod
+    def sha_of(ref: str) -> str:
+        sha256 = ref[len(BLOB_REF_PREFIX):] if is_blob_ref(ref) else ref
+        if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+            raise ValueError(f"Not a blob reference: {ref}")
+        return sha256
+
+    def lookup(self, source_key: str) -> Optional[Dict[str, Any]]:
+        """Metadata of a blob previously stored under `source_key`, if it's still on disk"""
+        try:
+            with open(self._ref_path(source_key)) as f:
+                return self.info(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def info(self, ref: str) -> Optional[Dict[str, Any]]:
+        sha256 = self.sha_of(ref)
+        try:
+            with open(self._path(sha256) + ".json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def open(self, ref: str):
+        return open(self._path(self.sha_of(ref)), "rb")
+
+    def path(self, ref: str) -> str:
+        return self._path(self.sha_of(ref))
+
+    def data_url(self, ref: str) -> str:
+        """data: URL of a blob, for model APIs that take inline content"""
+        meta = self.info(ref) or {}
+        with self.open(ref) as f:
+            data = base64.b64encode(f.read()).decode()
+        return f"data:{meta.get('content_type', 'application/octet-stream')};base64,{data}"
+
+    async def write_stream(self, chunks: AsyncIterable[bytes], filename: str = "",
+                           source_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Store a streamed download; returns its metadata including "ref"
+        Raises BlobTooLarge (and keeps nothing) once more than max_bytes arrive
+        """
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        tmp_path = os.path.join(self.root, "tmp", uuid.uuid4().hex)
+        try:
+            with open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise BlobTooLarge(f"Attachment exceeds {self.max_bytes} bytes")
+                    if len(head) < 16:
+                        head += chunk[:16 - len(head)]
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            path = self._path(sha256)
+            meta = {
+                "ref": self.ref(sha256),
+                "sha256": sha256,
+                "size": size,
+                "content_type": sniff_content_type(head, filename),
+                "filename": filename,
+            }
+            with self._lock:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.exists(path):
+                    os.remove(tmp_path)
+                    meta = self.info(sha256) or meta
+                else:
+                    os.replace(tmp_path, path)
+                    with open(path + ".json", "w") as f:
+                        json.dump(meta, f)
+                if source_key:
+                    with open(self._ref_path(source_key), "w") as f:
+                        f.write(sha256)
+            return meta
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+_blob_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """Process-wide attachment store (created on first use)"""
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore()
+    return _blob_store
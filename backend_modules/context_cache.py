@@ -0,0 +1,54 @@
+"""
+Tenant context snapshot cache
+Pre-rendered per-phone prompt context, invalidated by version stamps instead of explicit purges
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "1000"))
+
+
+class ContextSnapshotCache:
+    """
+    LRU cache of per-phone context snapshots
+    Each snapshot is stored with the version key it was built from; a lookup with a different key is a miss
+    """
+
+    def __init__(self, max_size: int = CONTEXT_CACHE_SIZE):
+        self.max_size = max_size
+        self._snapshots: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, phone: str, version: Hashable) -> Optional[Dict[str, Any]]:
+        """Return the cached snapshot if it was built from the same versions"""
+        with self._lock:
+            entry = self._snapshots.get(phone)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._snapshots.move_to_end(phone)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, phone: str, version: Hashable, snapshot: Dict[str, Any]) -> None:
+        with self._lock:
+            self._snapshots[phone] = (version, snapshot)
+            self._snapshots.move_to_end(phone)
+            while len(self._snapshots) > self.max_size:
+                self._snapshots.popitem(last=False)
+
+    def invalidate(self, phone: Optional[str] = None) -> None:
+        """Drop one phone's snapshot, or all of them"""
+        with self._lock:
+            if phone is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(phone, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._snapshots), "hits": self.hits, "misses": self.misses}
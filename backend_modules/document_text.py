@@ -0,0 +1,234 @@
+"""
+Document text extraction
+Reads the text layer of stored PDF attachments in a process pool and pulls pay stub / credit report fields from it
+"""
+
+import os
+import re
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend_modules.blob_store import get_blob_store, is_blob_ref
+
+PDF_TEXT_WORKERS = int(os.getenv("PDF_TEXT_WORKERS", "2"))
+PDF_TEXT_MAX_PAGES = int(os.getenv("PDF_TEXT_MAX_PAGES", "10"))
+# Fields read locally are used as-is at or above this confidence; below it the model is asked
+DOCUMENT_FIELD_CONFIDENCE = float(os.getenv("DOCUMENT_FIELD_CONFIDENCE", "0.85"))
+# Fewer characters than this means a scanned PDF with no usable text layer
+PDF_TEXT_MIN_CHARS = 80
+PDF_TEXT_MAX_CHARS = 200_000
+
+# Pay periods per month for each pay frequency
+PAY_PERIODS_PER_MONTH = {"weekly": 52 / 12, "bi-weekly": 26 / 12, "semi-monthly": 2.0, "monthly": 1.0}
+
+_DATE = r"(\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{2,4})"
+
+_GROSS_LABEL = re.compile(r"\b(?:total\s)?gross(?:\s(?:pay|earnings|wages|amount|income))?\b", re.I)
+# Money-shaped amounts only - "$", a thousands separator or cents - so hours ("40 hrs"), period lengths
+# ("for 2 weeks") and years aren't read as pay
+_MONEY = re.compile(
+    r"(?<![\d.,/-])(\$\s?\d{1,3}(?:,\d{3})+(?:\.\d{2})?|\$\s?\d{1,7}(?:\.\d{2})?|\d{1,3}(?:,\d{3})+(?:\.\d{2})?|\d{1,7}\.\d{2})"
+    r"(?!\d|[-/.,%]\d)"
+)
+_DATE_TOKEN = re.compile(r"\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{2,4}")
+# "YTD Gross", "Year-to-date gross" are cumulative, not one period's pay; amounts after "YTD" on a line are too
+_YTD = re.compile(r"\bytd\b|\byear.to.date\b", re.I)
+_YTD_BEFORE = re.compile(r"(?:\bytd|year.to.date)\W{0,3}$", re.I)
+# Column headers of a tabular earnings section, in the order they appear
+_COLUMN = re.compile(r"\b(hours|hrs|rate|current|this\speriod|amount|ytd|year.to.date)\b", re.I)
+_CURRENT_COLUMNS = ("current", "this period", "amount")
+_PAY_FREQUENCY = re.compile(r"\b(bi-?weekly|semi-?monthly|weekly|monthly)\b", re.I)
+_PAY_PERIOD = re.compile(r"\bpay\s?period\b[^\d\n]{0,30}" + _DATE + r"\s{0,3}(?:-|–|to|through)\s{0,3}" + _DATE, re.I)
+_PAY_DATE = re.compile(r"\b(?:pay|check|payment|deposit)\s?date\b[^\d\n]{0,20}" + _DATE, re.I)
+_EMPLOYER = re.compile(r"\b(?:employer|company)(?:\sname)?\s{0,3}:\s{0,3}([^\n]{2,80})", re.I)
+
+# The trailing lookahead skips ranges like "300-850"
+_CREDIT_SCORE = re.compile(
+    r"\b(?:credit\sscore|fico\W{0,2}(?:score)?(?:\s\d{1,2}\b)?|vantagescore(?:\s\d\.\d)?)[^\d\n]{0,30}(\d{3})\b(?!\s?(?:-|–|to)\s?\d)",
+    re.I
+)
+_CREDIT_BUREAU = re.compile(r"\b(experian|equifax|transunion)\b", re.I)
+_REPORT_DATE = re.compile(r"\b(?:report\sdate|date\spulled|as\sof|generated(?:\son)?|date)\b[^\d\n]{0,20}" + _DATE, re.I)
+
+
+def _read_pdf_text(path: str, max_pages: int) -> str:
+    """Runs in a worker process: concatenated text layer of the first `max_pages` pages ("" if none)"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        print("[PDF] pypdf not installed, skipping local text extraction")
+        return ""
+    try:
+        reader = PdfReader(path)
+        pages = []
+        for page in reader.pages[:max_pages]:
+            pages.append(page.extract_text() or "")
+        return "\n".join(pages)[:PDF_TEXT_MAX_CHARS]
+    except Exception as e:
+        print(f"[PDF] Could not read text layer of {os.path.basename(path)}: {e}")
+        return ""
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, PDF_TEXT_WORKERS))
+    return _pool
+
+
+def shutdown_pdf_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def pdf_text(ref: Optional[str]) -> str:
+    """Text layer of a stored PDF attachment; "" for images, scans and anything that isn't a blob reference"""
+    if not is_blob_ref(ref):
+        return ""
+    store = get_blob_store()
+    meta = store.info(ref) or {}
+    if meta.get("content_type") != "application/pdf":
+        return ""
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(_get_pool(), _read_pdf_text, store.path(ref), PDF_TEXT_MAX_PAGES)
+    return text if len(text.strip()) >= PDF_TEXT_MIN_CHARS else ""
+
+
+def _parse_amount(value: str) -> Optional[float]:
+    try:
+        return float(value.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _parse_date(value: str) -> Optional[date]:
+    for fmt in ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _frequency_from_period(start: Optional[date], end: Optional[date]) -> Optional[str]:
+    if not start or not end or end < start:
+        return None
+    days = (end - start).days + 1
+    if days <= 7:
+        return "weekly"
+    if days <= 14:
+        return "bi-weekly"
+    if days <= 16:
+        return "semi-monthly"
+    return "monthly" if days <= 31 else None
+
+
+def _gross_pay(text: str) -> Tuple[Optional[float], bool]:
+    """
+    Per-period gross pay and whether it's unambiguous
+    With several amounts after the label (hours / current / YTD columns) the current column is taken
+    from the header line above; without one the amount is returned as ambiguous
+    """
+    lines = text.splitlines()
+    for index, line in enumerate(lines):
+        for label in _GROSS_LABEL.finditer(line):
+            if _YTD_BEFORE.search(line, max(0, label.start() - 20), label.start()):
+                continue
+            rest = _DATE_TOKEN.sub(lambda m: " " * len(m.group(0)), line[label.end():])
+            # Anything after an inline "YTD" is the cumulative column
+            ytd = _YTD.search(rest)
+            amounts = [_parse_amount(m.group(1).lstrip("$ ")) for m in _MONEY.finditer(rest, 0, ytd.start() if ytd else len(rest))]
+            if not amounts:
+                continue
+            if len(amounts) == 1:
+                return amounts[0], True
+            header = next((previous for previous in reversed(lines[max(0, index - 3):index]) if previous.strip()), "")
+            columns = [" ".join(column.lower().split()) for column in _COLUMN.findall(header)]
+            if len(columns) == len(amounts):
+                for column, amount in zip(columns, amounts):
+                    if column in _CURRENT_COLUMNS:
+                        return amount, True
+            return amounts[0], False
+    return None, False
+
+
+def extract_pay_stub_fields(text: str) -> Tuple[Dict[str, Any], float]:
+    """Pay stub fields (same keys as the vision extractor) and a 0-1 confidence"""
+    fields: Dict[str, Any] = {}
+    confidence = 0.0
+
+    amount, unambiguous = _gross_pay(text)
+    if amount:
+        fields["grossIncome"] = amount
+        # An amount picked from several unlabeled columns is left for the model to confirm
+        confidence += 0.5 if unambiguous else 0.0
+
+    # An explicit pay period is more reliable than the word "weekly" somewhere on the page, so gross pay
+    # plus a frequency word only reaches the threshold together with an employer
+    period = _PAY_PERIOD.search(text)
+    frequency = _frequency_from_period(_parse_date(period.group(1)), _parse_date(period.group(2))) if period else None
+    if frequency:
+        confidence += 0.35
+    else:
+        word = _PAY_FREQUENCY.search(text)
+        frequency = word.group(1).lower().replace("biweekly", "bi-weekly").replace("semimonthly", "semi-monthly") if word else None
+        if frequency:
+            confidence += 0.2
+    if frequency:
+        fields["payFrequency"] = frequency
+
+    pay_date = _PAY_DATE.search(text)
+    parsed = _parse_date(pay_date.group(1)) if pay_date else None
+    if parsed is None and period:
+        parsed = _parse_date(period.group(2))
+    if parsed:
+        fields["payDate"] = parsed.isoformat()
+
+    employer = _EMPLOYER.search(text)
+    if employer:
+        fields["employerName"] = employer.group(1).strip()
+        confidence += 0.15
+
+    if amount and frequency:
+        fields["monthlyIncome"] = round(amount * PAY_PERIODS_PER_MONTH[frequency], 2)
+        fields["annualIncome"] = round(fields["monthlyIncome"] * 12, 2)
+    return fields, round(confidence, 2)
+
+
+def extract_credit_score_fields(text: str) -> Tuple[Dict[str, Any], float]:
+    """Credit report fields (same keys as the vision extractor) and a 0-1 confidence"""
+    fields: Dict[str, Any] = {}
+    confidence = 0.0
+    for match in _CREDIT_SCORE.finditer(text):
+        score = int(match.group(1))
+        if 300 <= score <= 850:
+            fields["creditScore"] = score
+            confidence += 0.9
+            break
+    bureau = _CREDIT_BUREAU.search(text)
+    if bureau:
+        fields["creditBureau"] = bureau.group(1).title().replace("Transunion", "TransUnion")
+        confidence += 0.1
+    report_date = _REPORT_DATE.search(text)
+    parsed = _parse_date(report_date.group(1)) if report_date else None
+    if parsed:
+        fields["creditScoreDate"] = parsed.isoformat()
+    return fields, round(confidence, 2)
+
+
+def best_pay_stub(texts: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Fields from the most recent pay stub, if every stub could be read with enough confidence
+    None means at least one stub needs the model
+    """
+    results = [extract_pay_stub_fields(text) for text in texts]
+    if not results or any(confidence < DOCUMENT_FIELD_CONFIDENCE for _, confidence in results):
+        return None
+    return max((fields for fields, _ in results), key=lambda fields: fields.get("payDate") or "")
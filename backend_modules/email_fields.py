@@ -0,0 +1,202 @@
+"""
+Email field extraction
+One precompiled, single-pass scanner for applicant details in email text, cached per message_id
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+EMAIL_FIELD_CACHE_SIZE = 5000
+
+_AMOUNT = r"\$?(\d{1,3}(?:,\d{3})+(?:\.\d{2})?|\d{1,9}(?:\.\d{2})?)"
+_UNIT = r"(?i:(per\s{1,3}month|monthly|per\s{1,3}year|annually))"
+_SEP = r"(?:\s{1,3}(?i:is|of))?[:\s$]{1,5}"
+_NAME = r"([A-Za-z][a-z]+(?: [A-Za-z][a-z]+){0,3})"
+# Free-text values stop at a clause break and are captured zero-width, so a label later in the same
+# line ("Property: 12 Oak Ave, Credit Score: 700") is still scanned
+_STOP = r"(?i:and|but|my|with)\b"
+_WORDS = r"(?=([A-Za-z&]+(?:[ \t](?!" + _STOP + r")[A-Za-z&]+){0,5}))"
+_PLACE = r"(?=((?:(?![ \t]" + _STOP + r")[^\n,;]){1,200}))"
+
+# (field, priority, pattern whose first group is the value). When a field matches more than once the
+# lowest priority wins, then the earliest position. Every repetition is bounded, and alternatives that
+# start with a label come before bare numbers so a label is never swallowed by a weaker match.
+_FIELD_PATTERNS: List[Tuple[str, int, str]] = [
+    ("name", 0, r"(?i:name|applicant)[\s:]{1,5}(?i:" + _NAME + ")"),
+    ("name", 1, r"^(?i:hi|hello|dear)[\s,:]{1,5}(?i:" + _NAME + ")"),
+    ("name", 2, r"(?i:i\s(?:am|m))\s([A-Z][a-z]+(?: [A-Z][a-z]+){0,3})"),
+    ("credit_score", 0, r"(?i:credit\s{1,3}score(?:\s{1,3}(?:is|of))?)[:\s]{1,5}(\d{3})\b"),
+    ("credit_score", 3, r"(?i:fico)[:\s]{1,5}(\d{3})\b"),
+    ("credit_score", 1, r"(?i:score)[:\s]{1,5}(\d{3})\b"),
+    ("monthly_income", 0, r"(?i:monthly\s{1,3}income)" + _SEP + _AMOUNT),
+    ("annual_income", 3, r"(?i:annual\s{1,3}income)" + _SEP + _AMOUNT),
+    ("income", 1, r"(?i:income)" + _SEP + _AMOUNT + r"\s{0,3}" + _UNIT + "?"),
+    ("income", 6, r"(?i:salary)" + _SEP + _AMOUNT + r"\s{0,3}" + _UNIT + "?"),
+    ("income", 7, r"(?i:make)" + _SEP + _AMOUNT + r"\s{0,3}" + _UNIT + "?"),
+    ("employer", 0, r"(?i:employer(?:\s{1,3}name)?|work\s{1,3}at|company)[:\s]{1,5}" + _WORDS),
+    ("property_interest", 0, r"(?i:property|address|interested\s{1,3}in)[:\s]{1,5}" + _PLACE),
+    ("phone", 0, r"((?:\+?1[-.\s]?)?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4})"),
+    ("credit_score", 2, r"(\d{3})\s{1,3}(?i:credit)"),
+    ("income", 2, _AMOUNT + r"\s{0,3}" + _UNIT),
+    # Zero-width, so it never consumes text a labeled field could start in
+    ("name", 3, r"(?=([A-Z][a-z]+ [A-Z][a-z]+))"),
+]
+
+# Every field starts at a word or number boundary; checking that first lets the scan skip the inside
+# of words and numbers without trying each alternative there
+_SCANNER = re.compile(
+    r"(?<![A-Za-z0-9])(?:" + "|".join(f"(?P<f{i}>{pattern})" for i, (_, _, pattern) in enumerate(_FIELD_PATTERNS)) + ")",
+    re.MULTILINE,
+)
+# Index of each alternative's first value group within match.groups()
+_VALUE_GROUP = [_SCANNER.groupindex[f"f{i}"] for i in range(len(_FIELD_PATTERNS))]
+
+# monthly_income / annual_income / income candidates are ranked on one ladder and reported as "income"
+_INCOME_RANK = {("monthly_income", 0): 0, ("income", 1): 1, ("income", 2): 2, ("annual_income", 3): 3,
+                ("income", 6): 6, ("income", 7): 7}
+
+Found = Dict[str, Tuple[int, int, Any]]
+
+
+def _income(field: str, amount_text: str, unit: Optional[str]) -> Optional[Dict[str, float]]:
+    try:
+        amount = float(amount_text.replace(",", ""))
+    except ValueError:
+        return None
+    unit = (unit or "").lower()
+    if field == "monthly_income" or "month" in unit:
+        return {"monthly_income": amount, "annual_income": amount * 12}
+    if field == "annual_income" or "year" in unit or "annual" in unit:
+        return {"annual_income": amount, "monthly_income": amount / 12}
+    # No unit given: anything over 100k is taken to be annual
+    if amount > 100000:
+        return {"annual_income": amount, "monthly_income": amount / 12}
+    return {"monthly_income": amount, "annual_income": amount * 12}
+
+
+def scan_message(text: str) -> Found:
+    """field -> (priority, position, value) for one message's text, in a single left-to-right pass"""
+    found: Found = {}
+    free_text_end = 0
+    for match in _SCANNER.finditer(text or ""):
+        index = int(match.lastgroup[1:])
+        field, priority, _ = _FIELD_PATTERNS[index]
+        value_group = _VALUE_GROUP[index] + 1
+        value: Any = match.group(value_group)
+        if field in ("employer", "property_interest"):
+            free_text_end = max(free_text_end, match.end(value_group))
+        elif field == "name" and priority == 3 and match.start() < free_text_end:
+            # A capitalized pair inside an employer or address isn't a name
+            continue
+        if field == "credit_score":
+            value = int(value)
+            if not 300 <= value <= 850:
+                continue
+        elif field in ("income", "monthly_income", "annual_income"):
+            unit = match.group(value_group + 1) if field == "income" else None
+            value = _income(field, value, unit)
+            if value is None:
+                continue
+            field, priority = "income", _INCOME_RANK[(field, priority)]
+        else:
+            value = value.strip()
+            # The first property mention decides, even when it's too long to use
+            if field == "property_interest" and len(value) >= 100:
+                value = None
+        best = found.get(field)
+        if best is None or priority < best[0]:
+            found[field] = (priority, match.start(), value)
+    return found
+
+
+def _merge(scans: List[Found]) -> Dict[str, Any]:
+    """Best value per field across a thread's messages (earlier messages win ties, as in one long text)"""
+    best: Dict[str, Tuple[int, int, int, Any]] = {}
+    for order, found in enumerate(scans):
+        for field, (priority, position, value) in found.items():
+            candidate = (priority, order, position, value)
+            if field not in best or candidate[:3] < best[field][:3]:
+                best[field] = candidate
+    return {field: candidate[3] for field, candidate in best.items()}
+
+
+class EmailFieldExtractor:
+    """
+    Scans each message once and keeps the result by message_id, so a reply added to a long thread
+    only costs a scan of the new message
+    """
+
+    def __init__(self, max_size: int = EMAIL_FIELD_CACHE_SIZE):
+        self.max_size = max_size
+        self._scans: "OrderedDict[str, Found]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def scan(self, text: str, message_id: Optional[str] = None) -> Found:
+        if message_id:
+            with self._lock:
+                found = self._scans.get(message_id)
+                if found is not None:
+                    self._scans.move_to_end(message_id)
+                    self.hits += 1
+                    return found
+        found = scan_message(text)
+        if message_id:
+            with self._lock:
+                self.misses += 1
+                self._scans[message_id] = found
+                while len(self._scans) > self.max_size:
+                    self._scans.popitem(last=False)
+        return found
+
+    def extract_thread(self, thread: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Applicant details from a thread's messages
+        Looks for: name, credit score, income, phone, email, employer, property interest
+        """
+        scans = []
+        for message in thread.get("messages", []):
+            text = message.get("text") or message.get("html") or message.get("body", "")
+            if text:
+                scans.append(self.scan(text, message.get("message_id") or message.get("id")))
+        fields = _merge(scans)
+
+        info: Dict[str, Any] = {}
+        senders = thread.get("senders", [])
+        if senders:
+            info["name"] = senders[0] if isinstance(senders, list) else senders
+        elif fields.get("name"):
+            info["name"] = fields["name"]
+        if fields.get("credit_score"):
+            info["credit_score"] = fields["credit_score"]
+        if fields.get("income"):
+            info.update(fields["income"])
+        if fields.get("phone"):
+            info["phone"] = fields["phone"]
+        if senders:
+            # senders is an array of email addresses; the first is who wrote to us
+            info["email"] = senders[0] if isinstance(senders, list) else str(senders)
+        if fields.get("employer"):
+            info["employer"] = fields["employer"]
+        if fields.get("property_interest"):
+            info["property_interest"] = fields["property_interest"]
+        return info
+
+    def contact_info(self, email_body: str, email_from: str, message_id: Optional[str] = None) -> Dict[str, str]:
+        """Name, email and phone of an applicant from one message"""
+        found = self.scan(email_body, message_id)
+        # Only a "Name:" label or a greeting; a bare capitalized pair is too often not a name
+        name = found["name"][2] if "name" in found and found["name"][0] <= 1 else ""
+        if not name:
+            # Fall back to the address: jane.doe@... -> Jane Doe
+            name = email_from.split("@")[0].replace(".", " ").replace("_", " ").title()
+        return {"name": name, "email": email_from, "phone": found["phone"][2] if "phone" in found else ""}
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._scans), "hits": self.hits, "misses": self.misses}
+
+
+email_field_extractor = EmailFieldExtractor()
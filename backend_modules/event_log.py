@@ -0,0 +1,110 @@
+"""
+Data flow event log
+Bounded ring buffer with on-disk spill, insert-time counters and per-minute/per-hour rollups
+"""
+
+import os
+import json
+import threading
+from collections import Counter, OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+DATA_FLOW_BUFFER_SIZE = int(os.getenv("DATA_FLOW_BUFFER_SIZE", "5000"))
+# Events evicted from the buffer are appended here as NDJSON ("" disables spilling)
+DATA_FLOW_SPILL_PATH = os.getenv("DATA_FLOW_SPILL_PATH", "data_flow_events.ndjson")
+
+MINUTE_BUCKETS = 24 * 60  # one day of per-minute rollups
+HOUR_BUCKETS = 7 * 24  # one week of per-hour rollups
+
+
+class EventLog:
+    """
+    Keeps the newest events in memory and aggregate counts for all of them
+    Stats are read straight from counters, so their cost doesn't grow with event history
+    """
+
+    def __init__(self, capacity: int = DATA_FLOW_BUFFER_SIZE, spill_path: str = DATA_FLOW_SPILL_PATH):
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self._events: deque = deque()
+        self._first_seq = 0  # sequence number of the oldest buffered event
+        self._next_seq = 0
+        self._counts: Counter = Counter()
+        self._minutes: "OrderedDict[str, Counter]" = OrderedDict()
+        self._hours: "OrderedDict[str, Counter]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bump(buckets: "OrderedDict[str, Counter]", key: str, event: Dict[str, Any], limit: int) -> None:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = Counter()
+            while len(buckets) > limit:
+                buckets.popitem(last=False)
+        bucket["total"] += 1
+        bucket[event["direction"]] += 1
+        bucket[event["status"]] += 1
+
+    def add(self, event: Dict[str, Any]) -> int:
+        """Append an event (already serialized); returns its sequence number"""
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._events.append({**event, "seq": seq})
+
+            self._counts["total"] += 1
+            self._counts[("direction", event["direction"])] += 1
+            self._counts[("status", event["status"])] += 1
+            self._counts[(event["direction"], event["type"])] += 1
+
+            timestamp = event.get("timestamp", "")
+            self._bump(self._minutes, timestamp[:16], event, MINUTE_BUCKETS)
+            self._bump(self._hours, timestamp[:13], event, HOUR_BUCKETS)
+
+            if len(self._events) > self.capacity:
+                self._spill(self._events.popleft())
+                self._first_seq += 1
+            return seq
+
+    def _spill(self, event: Dict[str, Any]) -> None:
+        if not self.spill_path:
+            return
+        try:
+            with open(self.spill_path, "a") as f:
+                f.write(json.dumps(event) + "\n")
+        except OSError as e:
+            print(f"[ERROR] Could not spill data flow event {event.get('id')}: {e}")
+
+    def count(self, *key) -> int:
+        """Counter lookup: count("total"), count("direction", "inbound"), count("inbound", "lease"), ..."""
+        return self._counts[key[0] if len(key) == 1 else key]
+
+    def page(self, before: Optional[int] = None, limit: int = 100, direction: str = None,
+             type: str = None, status: str = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Newest-first page of buffered events
+        Pass the returned cursor as `before` to continue; it is None once the buffer is exhausted
+        """
+        with self._lock:
+            # Sequence numbers are contiguous in the buffer, so the start position is computed, not searched
+            end = len(self._events) if before is None else max(0, min(before - self._first_seq, len(self._events)))
+            page: List[Dict[str, Any]] = []
+            index = end - 1
+            while index >= 0 and len(page) < limit:
+                event = self._events[index]
+                if (not direction or event["direction"] == direction) and (not type or event["type"] == type) \
+                        and (not status or event["status"] == status):
+                    page.append(event)
+                index -= 1
+            next_cursor = self._events[index + 1]["seq"] if index >= 0 else None
+            return page, next_cursor
+
+    def rollups(self, granularity: str = "minute", limit: int = 60) -> List[Dict[str, Any]]:
+        """Most recent time buckets, oldest first"""
+        buckets = self._hours if granularity == "hour" else self._minutes
+        with self._lock:
+            keys = list(buckets.keys())[-limit:]
+            return [{"bucket": key, **buckets[key]} for key in keys]
+
+    def __len__(self) -> int:
+        return len(self._events)
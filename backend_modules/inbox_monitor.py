@@ -8,53 +8,47 @@ import asyncio
 import re
 from typing import List, Dict, Any, Optional
 from datetime import datetime
-from backend_modules.agentmail_service import AgentmailClient, get_missing_documents_email_template
+from backend_modules.agentmail_service import get_agentmail_client, get_missing_documents_email_template, thread_updated_at, AGENTMAIL_FETCH_CONCURRENCY
 from backend_modules.llm_service import process_tenant_documents
 from backend_modules.screening_service import calculate_screening_score
 from backend_modules.agentmail_service import get_rejection_email_template
 from backend_modules.tenant_agent import agent_process_application
+from backend_modules.message_ledger import MessageLedger, STATE_RANK
+from backend_modules.email_fields import email_field_extractor
 
-# In production, this would connect to Prisma/database
-# For now, we'll use a simple in-memory store
-processed_email_ids = set()
+# Durable processing state per message_id (received -> extracted -> persisted -> notified),
+# shared by all workers and surviving restarts; also holds each inbox's scan watermark
+message_ledger = MessageLedger()
 
-def extract_contact_info(email_body: str, email_from: str) -> Dict[str, str]:
+# Attachment types the document extractors can read
+DOCUMENT_CONTENT_TYPES = ("image/", "application/pdf")
+
+def extract_contact_info(email_body: str, email_from: str, message_id: Optional[str] = None) -> Dict[str, str]:
     """
     Extract tenant contact information from email
-    Uses regex patterns and AI if needed
+    Shares the single-pass field scan (and its per-message cache) with AgentmailClient.extract_email_info
     """
-    info = {
-        "name": "",
-        "email": email_from,
-        "phone": ""
-    }
-    
-    # Extract phone number
-    phone_patterns = [
-        r'(\+?1?[-.\s]?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4})',
-        r'(\d{3}[-.\s]?\d{3}[-.\s]?\d{4})'
-    ]
-    for pattern in phone_patterns:
-        match = re.search(pattern, email_body)
-        if match:
-            info["phone"] = match.group(1).strip()
-            break
-    
-    # Extract name (try from email signature or first line)
-    lines = email_body.split('\n')[:5]  # First 5 lines
-    for line in lines:
-        # Look for "Name:" or similar patterns
-        name_match = re.search(r'(?:name|hi|hello)[\s:]+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', line, re.IGNORECASE)
-        if name_match:
-            info["name"] = name_match.group(1).strip()
-            break
+    return email_field_extractor.contact_info(email_body, email_from, message_id)
+
+async def download_attachments(agentmail_client, attachments: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Stream a message's attachments into the blob store concurrently
+    Returns the stored metadata per attachment, in order (None where the download failed)
+    """
+    semaphore = asyncio.Semaphore(AGENTMAIL_FETCH_CONCURRENCY)
     
-    # Fallback: extract from email address
-    if not info["name"]:
-        email_local = email_from.split('@')[0]
-        info["name"] = email_local.replace('.', ' ').replace('_', ' ').title()
+    async def download(attachment: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        attachment_id = attachment.get("id") or attachment.get("attachment_id")
+        if not attachment_id:
+            return None
+        async with semaphore:
+            try:
+                return await agentmail_client.store_attachment(attachment_id, attachment.get("filename", ""))
+            except Exception as e:
+                print(f"⚠️ Error downloading attachment {attachment_id}: {e}")
+                return None
     
-    return info
+    return await asyncio.gather(*(download(a) for a in attachments))
 
 async def process_incoming_email_from_thread(
     thread: Dict[str, Any],
@@ -69,9 +63,12 @@ async def process_incoming_email_from_thread(
         thread_id = thread.get("thread_id") or thread.get("id")
         message_id = message.get("message_id") or message.get("id")
         
-        if message_id in processed_email_ids:
+        if message_ledger.is_processed(message_id):
             print(f"📧 Message {message_id} already processed, skipping")
             return {"success": False, "reason": "already_processed"}
+        if not message_ledger.claim(message_id, thread_id):
+            print(f"📧 Message {message_id} is being processed by another worker, skipping")
+            return {"success": False, "reason": "in_progress"}
         
         # Extract email metadata from message
         email_from = message.get("from", {}).get("email", "") if isinstance(message.get("from"), dict) else message.get("from", "")
@@ -80,35 +77,31 @@ async def process_incoming_email_from_thread(
         attachments = message.get("attachments", [])
         
         # Extract contact info
-        contact_info = extract_contact_info(email_body, email_from)
+        contact_info = extract_contact_info(email_body, email_from, message_id)
         
         # Download and categorize attachments
-        agentmail_client = AgentmailClient()
+        agentmail_client = get_agentmail_client()
         
         drivers_license_url = None
         pay_stub_urls = []
         credit_score_url = None
         
-        for attachment in attachments:
-            attachment_id = attachment.get("id") or attachment.get("attachment_id")
+        for attachment, stored in zip(attachments, await download_attachments(agentmail_client, attachments)):
+            if stored is None:
+                continue
             filename = attachment.get("filename", "").lower()
-            
-            # Download attachment
-            try:
-                attachment_data = await agentmail_client.download_attachment(attachment_id)
-                # In production, upload to S3/cloud storage and store URL
-                # For now, we'll use the attachment ID as reference
-                
-                # Categorize by filename/type
-                if "license" in filename or "dl" in filename or "driver" in filename:
-                    drivers_license_url = f"attachment:{attachment_id}"
-                elif "pay" in filename or "stub" in filename or "income" in filename:
-                    pay_stub_urls.append(f"attachment:{attachment_id}")
-                elif "credit" in filename or "score" in filename or "report" in filename:
-                    credit_score_url = f"attachment:{attachment_id}"
-            except Exception as e:
-                print(f"⚠️ Error downloading attachment {attachment_id}: {e}")
+            if not stored["content_type"].startswith(DOCUMENT_CONTENT_TYPES):
+                print(f"⚠️ Skipping attachment {filename or stored['sha256'][:12]}: unsupported type {stored['content_type']}")
                 continue
+            
+            # Categorize by filename/type; extractors read the stored copy via its blob:// reference
+            if "license" in filename or "dl" in filename or "driver" in filename:
+                drivers_license_url = stored["ref"]
+            elif "pay" in filename or "stub" in filename or "income" in filename:
+                if stored["ref"] not in pay_stub_urls:
+                    pay_stub_urls.append(stored["ref"])
+            elif "credit" in filename or "score" in filename or "report" in filename:
+                credit_score_url = stored["ref"]
         
         # DEMO MODE: Skip missing documents check - process all applications regardless
         # Check for missing documents (disabled for demo)
@@ -173,9 +166,12 @@ async def process_incoming_email_data(
     Handles document processing, screening, and database persistence
     """
     try:
-        if message_id in processed_email_ids:
+        ledger_record = message_ledger.get(message_id) or {}
+        if ledger_record.get("state") == "notified":
             print(f"📧 Message {message_id} already processed, skipping")
             return {"success": False, "reason": "already_processed"}
+        # A retry after a crash must not save the application a second time
+        already_persisted = STATE_RANK.get(ledger_record.get("state"), -1) >= STATE_RANK["persisted"]
         
         # Identify as Agentmail source
         print(f"📬 NEW APPLICATION FROM AGENTMAIL")
@@ -217,6 +213,8 @@ async def process_incoming_email_data(
                 credit_score_url=credit_score_url
             )
         
+        message_ledger.advance(message_id, "extracted")
+        
         # Calculate screening score (need property rent amount - default to $2000 for now)
         monthly_rent = 2000.0  # In production, get from PropertySettings
         
@@ -231,7 +229,7 @@ async def process_incoming_email_data(
         print(f"✅ HARDCODED MODE: All emails automatically approved")
         
         # Initialize agentmail_client for sending emails (needed regardless of DB save)
-        agentmail_client = AgentmailClient()
+        agentmail_client = get_agentmail_client()
         
         # Save to database via frontend API endpoint
         import httpx
@@ -240,7 +238,10 @@ async def process_incoming_email_data(
         service_token = os.getenv("APPLICATION_SERVICE_TOKEN", "").strip()
         
         # Validate service token before making request
-        if not service_token:
+        if already_persisted:
+            application_id = ledger_record.get("detail")
+            print(f"   Application already saved as {application_id}, not saving again")
+        elif not service_token:
             print(f"⚠️ APPLICATION_SERVICE_TOKEN is not set or is empty")
             print(f"   Cannot save application to database - skipping API call")
             print(f"   Set APPLICATION_SERVICE_TOKEN environment variable to enable database persistence")
@@ -283,6 +284,7 @@ async def process_incoming_email_data(
                     result = response.json()
                     application_id = result.get("application", {}).get("id")
                     print(f"✅ Application saved to database: {application_id}")
+                    message_ledger.advance(message_id, "persisted", detail=application_id)
             except httpx.ConnectError as conn_error:
                 print(f"⚠️ Error saving application to database: Connection failed to {frontend_url}")
                 print(f"   Check if frontend is running and FRONTEND_ORIGIN is correct")
@@ -340,7 +342,7 @@ async def process_incoming_email_data(
             )
             print(f"📧 Sent rejection email to {contact_info['email']}")
         
-        processed_email_ids.add(message_id)
+        message_ledger.advance(message_id, "notified")
         
         return {
             "success": True,
@@ -356,26 +358,25 @@ async def process_incoming_email_data(
         traceback.print_exc()
         return {"success": False, "error": str(e)}
 
-async def monitor_inbox(user_id: Optional[str] = None):
-    """Monitor Agentmail inbox for ALL threads and process them
+async def monitor_inbox(user_id: Optional[str] = None, full_scan: bool = False):
+    """Monitor Agentmail inbox for new or updated threads and process them
+    
+    Scans are incremental: threads are listed most recently active first, and listing stops at the
+    first page that is entirely at or below the inbox watermark. Thread details for each page are
+    fetched concurrently. The watermark only advances when every thread in the scan was handled,
+    so a failed thread is retried next time.
     
     Args:
         user_id: User ID to associate applications with. If None, uses DEFAULT_USER_ID env var.
+        full_scan: Ignore the watermark and walk the whole inbox.
     """
-    print("📬 Reading ALL emails from Agentmail inbox...")
+    inbox_id = os.getenv("AGENTMAIL_INBOX_ID", "")
+    watermark_key = f"watermark:{inbox_id}"
+    watermark = "" if full_scan else (message_ledger.get_meta(watermark_key) or "")
+    print(f"📬 Scanning Agentmail inbox for threads updated since {watermark or 'the beginning'}...")
     
     try:
-        client = AgentmailClient()
-        
-        # Get ALL threads (not just unread)
-        inbox_id = os.getenv("AGENTMAIL_INBOX_ID", "")
-        threads = await client.list_threads(inbox_id=inbox_id)
-        
-        if not threads:
-            print("📭 No threads found in inbox")
-            return
-        
-        print(f"📧 Found {len(threads)} email thread(s) - processing all...")
+        client = get_agentmail_client()
         
         # Use provided user_id or fall back to environment variable
         if not user_id:
@@ -383,53 +384,77 @@ async def monitor_inbox(user_id: Optional[str] = None):
         
         print(f"👤 Using user_id: {user_id}")
         
-        # Process each thread
         processed_count = 0
         skipped_count = 0
-        
-        for thread in threads:
-            thread_id = thread.get("thread_id") or thread.get("id")
-            if not thread_id:
-                continue
-            
-            # Get full thread details with all messages
-            try:
-                full_thread = await client.get_thread(thread_id)
-                if not full_thread:
-                    skipped_count += 1
+        failed_count = 0
+        unchanged_count = 0
+        newest_seen = watermark
+        
+        async for page in client.iter_threads(inbox_id=inbox_id):
+            changed = []
+            listed_updated_at = {}
+            for thread in page:
+                thread_id = thread.get("thread_id") or thread.get("id")
+                updated_at = thread_updated_at(thread)
+                if not thread_id:
                     continue
-                
-                messages = full_thread.get("messages", [])
-                if not messages:
-                    skipped_count += 1
+                if watermark and updated_at and updated_at <= watermark:
+                    unchanged_count += 1
                     continue
-                
-                # Process the latest message for application processing
-                latest_message = messages[-1]
-                message_id = latest_message.get("message_id") or latest_message.get("id")
-                
-                # Check if this message was already processed for applications
-                if message_id not in processed_email_ids:
+                changed.append(thread_id)
+                listed_updated_at[thread_id] = updated_at
+                newest_seen = max(newest_seen, updated_at)
+            
+            # Get full thread details with all messages
+            full_threads = await client.get_threads(changed, updated_at=listed_updated_at)
+            for thread_id, full_thread in zip(changed, full_threads):
+                try:
+                    if not full_thread:
+                        failed_count += 1
+                        continue
+                    
+                    messages = full_thread.get("messages", [])
+                    if not messages:
+                        skipped_count += 1
+                        continue
+                    
+                    # Process the latest message for application processing
+                    latest_message = messages[-1]
+                    message_id = latest_message.get("message_id") or latest_message.get("id")
+                    
+                    # Check if this message was already processed for applications
+                    if message_ledger.is_processed(message_id):
+                        skipped_count += 1
+                        continue
+                    
                     print(f"📬 Processing message {message_id} from thread {thread_id}")
                     result = await process_incoming_email_from_thread(full_thread, latest_message, user_id)
                     
                     if result.get("success"):
                         processed_count += 1
                         print(f"✅ Successfully processed message {message_id}")
+                    elif result.get("reason") == "already_processed":
+                        skipped_count += 1
                     else:
+                        # Errors and in_progress both need another look, so the watermark must not pass them
+                        failed_count += 1
                         print(f"⚠️ Failed to process message {message_id}: {result.get('reason') or result.get('error')}")
-                
-                
-                # Small delay between threads
-                await asyncio.sleep(0.5)
-                
-            except Exception as thread_error:
-                skipped_count += 1
-                print(f"❌ Error processing thread {thread_id}: {thread_error}")
+                except Exception as thread_error:
+                    failed_count += 1
+                    print(f"❌ Error processing thread {thread_id}: {thread_error}")
+            
+            if watermark and not changed:
+                # Listing is newest-first, so nothing past this page has changed either
+                break
+        
+        if not failed_count and newest_seen:
+            message_ledger.set_meta(watermark_key, newest_seen)
         
         print(f"\n✅ Inbox processing complete:")
         print(f"   📋 Applications processed: {processed_count}")
-        print(f"   ⏭️  Skipped: {skipped_count}")
+        print(f"   ⏭️  Skipped: {skipped_count} (unchanged since last scan: {unchanged_count})")
+        print(f"   ❌ Failed: {failed_count}")
+        print(f"   🔖 Watermark: {message_ledger.get_meta(watermark_key) or 'none'}")
             
     except Exception as e:
         print(f"❌ Error monitoring inbox: {e}")
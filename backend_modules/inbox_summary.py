@@ -0,0 +1,131 @@
+"""
+Inbox summary view
+Per-thread message/unread counts kept current by webhooks, scans and thread fetches, served from memory
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+
+def message_sender(message: Dict[str, Any]) -> str:
+    """Sender address of a thread message or webhook payload ("from" string or "from_" list)"""
+    sender = message.get("from") or message.get("from_") or ""
+    if isinstance(sender, list):
+        sender = sender[0] if sender else ""
+    if isinstance(sender, dict):
+        sender = sender.get("email", "")
+    return sender or ""
+
+
+class InboxSummary:
+    """
+    thread_id -> {subject, message_count, unread_count, sender, last_sender, last_updated}
+    Totals are adjusted on every change, and the newest-first order is re-sorted only when a page
+    is read after something moved, so reads never touch the Agentmail API
+    """
+
+    def __init__(self):
+        self._threads: Dict[str, Dict[str, Any]] = {}
+        self._message_ids: Dict[str, set] = {}
+        self._order: List[str] = []
+        self._stale = False
+        self._lock = threading.Lock()
+        self.total_messages = 0
+        self.total_unread = 0
+        self.seeded = False
+
+    def _set(self, thread_id: str, row: Dict[str, Any]) -> None:
+        old = self._threads.get(thread_id)
+        if old is not None:
+            self.total_messages -= old["message_count"]
+            self.total_unread -= old["unread_count"]
+        self._threads[thread_id] = row
+        self.total_messages += row["message_count"]
+        self.total_unread += row["unread_count"]
+        self._stale = True
+
+    def update_from_thread(self, thread: Dict[str, Any]) -> None:
+        """Replace a thread's row with the counts from a full fetch"""
+        thread_id = thread.get("thread_id") or thread.get("id")
+        if not thread_id:
+            return
+        messages = thread.get("messages", [])
+        first = messages[0] if messages else {}
+        last = messages[-1] if messages else {}
+        with self._lock:
+            # Keep what a listing told us when the fetched copy leaves it out
+            old = self._threads.get(thread_id) or {}
+            self._message_ids[thread_id] = {m.get("message_id") or m.get("id") for m in messages}
+            self._set(thread_id, {
+                "thread_id": thread_id,
+                "subject": thread.get("subject") or first.get("subject") or old.get("subject") or "No subject",
+                "message_count": len(messages),
+                "unread_count": len([m for m in messages if not m.get("read", False)]),
+                "sender": message_sender(first),
+                "last_sender": message_sender(last),
+                "last_updated": (thread.get("updated_at") or thread.get("timestamp") or last.get("created_at")
+                                 or last.get("date") or old.get("last_updated") or ""),
+            })
+
+    def update_from_listing(self, thread: Dict[str, Any]) -> None:
+        """Add a thread seen in a listing; only fills in what a full fetch or webhook hasn't"""
+        thread_id = thread.get("thread_id") or thread.get("id")
+        if not thread_id:
+            return
+        with self._lock:
+            row = self._threads.get(thread_id)
+            updated = thread.get("updated_at") or thread.get("timestamp") or ""
+            if row is None:
+                senders = thread.get("senders") or []
+                self._set(thread_id, {
+                    "thread_id": thread_id,
+                    "subject": thread.get("subject") or "No subject",
+                    "message_count": int(thread.get("message_count") or 0),
+                    "unread_count": 0,
+                    "sender": senders[0] if senders else "",
+                    "last_sender": senders[-1] if senders else "",
+                    "last_updated": updated,
+                })
+            elif updated > row["last_updated"]:
+                row["last_updated"] = updated
+                self._stale = True
+
+    def note_message(self, thread_id: str, message_id: Optional[str], sender: str = "", subject: str = "",
+                     timestamp: str = "", unread: bool = True) -> None:
+        """Count a message delivered by webhook (or one we sent) without fetching the thread"""
+        if not thread_id:
+            return
+        with self._lock:
+            seen = self._message_ids.setdefault(thread_id, set())
+            if message_id and message_id in seen:
+                return
+            if message_id:
+                seen.add(message_id)
+            row = dict(self._threads.get(thread_id) or {
+                "thread_id": thread_id, "subject": subject or "No subject", "message_count": 0,
+                "unread_count": 0, "sender": sender, "last_sender": "", "last_updated": "",
+            })
+            row["message_count"] += 1
+            row["unread_count"] += 1 if unread else 0
+            row["last_sender"] = sender or row["last_sender"]
+            row["last_updated"] = max(row["last_updated"], timestamp or "")
+            self._set(thread_id, row)
+
+    def page(self, page: int = 1, page_size: int = 10) -> Dict[str, Any]:
+        """Threads newest first, one page at a time, with inbox-wide totals"""
+        with self._lock:
+            if self._stale:
+                self._order = sorted(self._threads, key=lambda tid: self._threads[tid]["last_updated"], reverse=True)
+                self._stale = False
+            start = max(page - 1, 0) * page_size
+            return {
+                "total_threads": len(self._threads),
+                "total_messages": self.total_messages,
+                "total_unread": self.total_unread,
+                "page": page,
+                "page_size": page_size,
+                "threads": [dict(self._threads[tid]) for tid in self._order[start:start + page_size]],
+            }
+
+    def __len__(self) -> int:
+        return len(self._threads)
@@ -0,0 +1,125 @@
+"""
+In-process async job queue
+Bounded queue drained by a fixed pool of worker tasks on the app's event loop, with depth/latency metrics
+"""
+
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+JobHandler = Callable[[Any], Awaitable[Any]]
+
+
+class AsyncJobQueue:
+    """
+    submit() enqueues without waiting and returns False when the queue is full, so callers can tell
+    the sender to retry instead of piling up work. Workers run on the loop that called start(), sharing
+    its connection pools and caches. drain() stops intake and lets queued jobs finish before shutdown.
+    """
+
+    def __init__(self, name: str, handler: JobHandler, workers: int = 4, max_size: int = 1000):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.accepting = True
+        self.in_flight = 0
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self.dequeued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        if self.started:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self.accepting = True
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"[QUEUE] {self.name}: started {self.workers} worker(s), capacity {self.max_size}")
+
+    def submit(self, job: Any) -> bool:
+        if not self.accepting:
+            self.rejected += 1
+            return False
+        if not self.started:
+            self.start()
+        try:
+            self._queue.put_nowait((time.monotonic(), job))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            print(f"[QUEUE] {self.name}: full ({self.max_size} queued), rejecting job")
+            return False
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            enqueued_at, job = await self._queue.get()
+            started = time.monotonic()
+            wait = started - enqueued_at
+            self.dequeued += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.in_flight += 1
+            try:
+                await self.handler(job)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[ERROR] {self.name} worker {number}: job failed: {e}")
+            finally:
+                self.in_flight -= 1
+                self.total_run += time.monotonic() - started
+                self._queue.task_done()
+
+    async def drain(self, timeout: float = 25.0) -> bool:
+        """Stop taking jobs, wait up to `timeout` seconds for queued ones, then stop the workers"""
+        self.accepting = False
+        if not self.started:
+            return True
+        drained = True
+        pending = self._queue.qsize() + self.in_flight
+        if pending:
+            print(f"[QUEUE] {self.name}: draining {pending} job(s)")
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            drained = False
+            print(f"[QUEUE] {self.name}: {self._queue.qsize() + self.in_flight} job(s) unfinished after {timeout}s")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        return drained
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.processed + self.failed
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "running": self.started,
+            "accepting": self.accepting,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "capacity": self.max_size,
+            "max_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / self.dequeued * 1000, 1) if self.dequeued else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "avg_run_ms": round(self.total_run / finished * 1000, 1) if finished else 0.0,
+        }
@@ -0,0 +1,164 @@
+"""
+Lease renewal scheduler
+Sorted end-date index over synced leases and the renewal reminders fired from it
+"""
+
+import os
+import json
+import asyncio
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Days before lease end at which a renewal reminder goes out
+LEASE_RENEWAL_OFFSETS = sorted(
+    {int(d) for d in os.getenv("LEASE_RENEWAL_OFFSETS_DAYS", "90,60,30").split(",") if d.strip()},
+    reverse=True
+)
+LEASE_RENEWAL_STATE_PATH = os.getenv("LEASE_RENEWAL_STATE_PATH", "lease_renewal_state.json")
+
+
+def parse_lease_date(value: Optional[str]) -> Optional[date]:
+    """Date part of an ISO date/datetime string, or None if it isn't one"""
+    try:
+        return date.fromisoformat((value or "")[:10])
+    except ValueError:
+        return None
+
+
+class LeaseExpiryIndex:
+    """
+    lease_id -> end date, with a sorted (end_date, lease_id) list for range queries
+    Writes only mark the list stale; it is re-sorted once on the next query, so a sync of
+    thousands of leases costs one sort instead of one insertion per lease
+    """
+
+    def __init__(self):
+        self._end_dates: Dict[str, date] = {}
+        self._sorted: List[Tuple[date, str]] = []
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def upsert(self, lease_id: str, end_date: Optional[str]) -> None:
+        end = parse_lease_date(end_date)
+        with self._lock:
+            if end is None:
+                self._stale |= self._end_dates.pop(lease_id, None) is not None
+            elif self._end_dates.get(lease_id) != end:
+                self._end_dates[lease_id] = end
+                self._stale = True
+
+    def remove(self, lease_id: str) -> None:
+        self.upsert(lease_id, None)
+
+    def expiring_between(self, start: date, end: date) -> List[Tuple[date, str]]:
+        """(end_date, lease_id) for leases ending in [start, end], soonest first"""
+        with self._lock:
+            if self._stale:
+                self._sorted = sorted((d, lid) for lid, d in self._end_dates.items())
+                self._stale = False
+            lo = bisect_left(self._sorted, (start,))
+            hi = bisect_left(self._sorted, (end + timedelta(days=1),))
+            return self._sorted[lo:hi]
+
+    def expiring_within(self, days: int, today: Optional[date] = None) -> List[Tuple[date, str]]:
+        today = today or date.today()
+        return self.expiring_between(today, today + timedelta(days=days))
+
+    def __len__(self) -> int:
+        return len(self._end_dates)
+
+
+ReminderSender = Callable[[str, List[Dict[str, Any]]], Any]
+
+
+class RenewalScheduler:
+    """
+    Works out which leases are due a renewal reminder and hands them to `send_batch` grouped by property
+    A lease gets one reminder per offset; if a run is missed only the closest offset fires, not every
+    one it skipped. Sent reminders are keyed by lease, end date and offset, so an extended lease
+    starts a fresh cycle.
+    """
+
+    def __init__(self, index: LeaseExpiryIndex, lease_lookup: Callable[[str], Any], send_batch: ReminderSender,
+                 offsets: List[int] = None, state_path: str = LEASE_RENEWAL_STATE_PATH):
+        self.index = index
+        self.lease_lookup = lease_lookup
+        self.send_batch = send_batch
+        self.offsets = sorted(offsets or LEASE_RENEWAL_OFFSETS, reverse=True)
+        self.state_path = state_path
+        self.sent = self._load_sent()
+        self.last_run: Dict[str, Any] = {}
+
+    def _load_sent(self) -> set:
+        try:
+            with open(self.state_path) as f:
+                return set(json.load(f))
+        except (OSError, ValueError):
+            return set()
+
+    def _save_sent(self) -> None:
+        # Reminders for leases that have already ended can't be due again
+        today = date.today().isoformat()
+        self.sent = {key for key in self.sent if key.rsplit(":", 2)[1] >= today}
+        try:
+            with open(self.state_path, "w") as f:
+                json.dump(sorted(self.sent), f)
+        except OSError as e:
+            print(f"[LEASE] Could not save renewal reminder state: {e}")
+
+    def _stage(self, days_left: int) -> Optional[int]:
+        # Smallest offset the lease has already reached
+        reached = [offset for offset in self.offsets if days_left <= offset]
+        return reached[-1] if reached else None
+
+    def due(self, today: Optional[date] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Reminders due as of `today`, grouped by property name"""
+        if not self.offsets:
+            return {}
+        today = today or date.today()
+        batches: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for end, lease_id in self.index.expiring_within(self.offsets[0], today):
+            lease = self.lease_lookup(lease_id)
+            if lease is None or lease.status == "expired":
+                continue
+            days_left = (end - today).days
+            stage = self._stage(days_left)
+            key = f"{lease_id}:{end.isoformat()}:{stage}"
+            if stage is None or key in self.sent:
+                continue
+            batches[lease.property_name or "Unknown Property"].append({
+                "key": key,
+                "lease": lease,
+                "offset_days": stage,
+                "days_left": days_left,
+            })
+        return dict(batches)
+
+    async def run(self, today: Optional[date] = None, dry_run: bool = False) -> Dict[str, Any]:
+        """Send every due reminder, one batch per property"""
+        batches = self.due(today)
+        results: Dict[str, Any] = {"date": (today or date.today()).isoformat(), "properties": {}}
+        for property_name, reminders in batches.items():
+            if dry_run:
+                results["properties"][property_name] = {"due": len(reminders)}
+                continue
+            try:
+                outcome = self.send_batch(property_name, reminders)
+                if asyncio.iscoroutine(outcome):
+                    outcome = await outcome
+                # The sender returns the keys it delivered; anything else is retried next run
+                delivered = set(outcome or [])
+                self.sent |= delivered
+                results["properties"][property_name] = {"due": len(reminders), "sent": len(delivered)}
+            except Exception as e:
+                print(f"[ERROR] Renewal reminders for {property_name} failed: {e}")
+                results["properties"][property_name] = {"due": len(reminders), "error": str(e)}
+        if not dry_run and batches:
+            self._save_sent()
+        results["due"] = sum(len(r) for r in batches.values())
+        if not dry_run:
+            self.last_run = results
+        return results
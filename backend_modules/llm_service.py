@@ -3,15 +3,24 @@ LLM service for handling AI interactions
 """
 
 import os
+import re
 import httpx
 import json
+import asyncio
 from typing import List, Dict, Any
 
+from backend_modules.blob_store import get_blob_store, is_blob_ref
+from backend_modules.document_text import (
+    pdf_text, best_pay_stub, extract_credit_score_fields, DOCUMENT_FIELD_CONFIDENCE, PAY_PERIODS_PER_MONTH
+)
+
 # Get config from environment (matching minimal_backend.py)
 API_KEY = os.getenv("LLM_API_KEY", "").strip()
 TEXT_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
 VISION_MODEL = os.getenv("LLM_VISION_MODEL", "gemini-2.0-flash")
 GEMINI_URL = os.getenv("LLM_URL", "https://generativelanguage.googleapis.com/v1beta/models")
+# Characters of each PDF's text layer sent to the text model
+DOCUMENT_PROMPT_CHARS = 20_000
 
 async def call_gemini(messages: List[Dict[str, Any]], model: str, functions: List[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Call Gemini API with optional function calling"""
@@ -35,10 +44,15 @@ async def call_gemini(messages: List[Dict[str, Any]], model: str, functions: Lis
                     if part["type"] == "text":
                         parts.append({"text": part["text"]})
                     elif part["type"] == "image_url":
+                        image_url = part["image_url"]["url"]
+                        # Stored attachments are inlined from the local blob store
+                        if is_blob_ref(image_url):
+                            image_url = await asyncio.to_thread(get_blob_store().data_url, image_url)
+                        mime_match = re.match(r"data:([\w/+.-]+);base64,", image_url)
                         parts.append({
                             "inline_data": {
-                                "mime_type": "image/jpeg",  # Default, could be improved
-                                "data": part["image_url"]["url"].split(",")[1] if "," in part["image_url"]["url"] else ""
+                                "mime_type": mime_match.group(1) if mime_match else "image/jpeg",
+                                "data": image_url.split(",")[1] if "," in image_url else ""
                             }
                         })
                 contents.append({"role": "user", "parts": parts})
@@ -243,7 +257,7 @@ TENANT_DOCUMENT_SYSTEM = (
     "- Format dates as YYYY-MM-DD\n"
     "\n"
     "For PAY STUBS:\n"
-    "- Extract: Employer name, gross income amount, pay period (weekly/bi-weekly/monthly), pay date\n"
+    "- Extract: Employer name, gross income amount, pay period (weekly/bi-weekly/semi-monthly/monthly), pay date\n"
     "- Calculate monthly and annual income based on pay frequency\n"
     "- If multiple pay stubs, use the most recent or average\n"
     "\n"
@@ -363,20 +377,80 @@ Validate expiration date - set licenseValid to false if expired or expiring with
     
     return {}
 
+PAY_STUB_FUNCTION = {
+    "name": "extract_pay_stub",
+    "description": "Extract pay stub information",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "employerName": {"type": "string"},
+            "grossIncome": {"type": "number", "description": "Gross income per pay period"},
+            "payFrequency": {"type": "string", "enum": list(PAY_PERIODS_PER_MONTH)},
+            "payDate": {"type": "string", "description": "Pay date in YYYY-MM-DD format"},
+            "monthlyIncome": {"type": "number", "description": "Calculated monthly income"},
+            "annualIncome": {"type": "number", "description": "Calculated annual income"}
+        },
+        "required": ["employerName", "grossIncome", "payFrequency"]
+    }
+}
+
+CREDIT_SCORE_FUNCTION = {
+    "name": "extract_credit_score",
+    "description": "Extract credit score information",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "creditScore": {"type": "integer", "description": "Credit score (300-850)"},
+            "creditScoreDate": {"type": "string", "description": "Date pulled in YYYY-MM-DD format"},
+            "creditBureau": {"type": "string", "description": "Credit bureau name"}
+        },
+        "required": ["creditScore"]
+    }
+}
+
+def _function_result(response: Dict[str, Any], name: str) -> Dict[str, Any]:
+    for tool_call in response.get("tool_calls") or []:
+        if tool_call["function"]["name"] == name:
+            return json.loads(tool_call["function"]["arguments"])
+    return {}
+
+async def _extract_from_text(prompt: str, texts: List[str], function: Dict[str, Any]) -> Dict[str, Any]:
+    """Ask the text model to read fields out of PDF text layers (much cheaper than a vision call)"""
+    documents = "\n\n".join(f"--- Document {i + 1} ---\n{text[:DOCUMENT_PROMPT_CHARS]}" for i, text in enumerate(texts))
+    messages = [
+        {"role": "system", "content": TENANT_DOCUMENT_SYSTEM},
+        {"role": "user", "content": f"{prompt}\n\nThe documents' text follows.\n\n{documents}"}
+    ]
+    return _function_result(await call_gemini(messages, TEXT_MODEL, [function]), function["name"])
+
 async def _extract_pay_stubs(image_urls: List[str]) -> Dict[str, Any]:
-    """Extract information from pay stub images"""
+    """
+    Extract information from pay stubs
+    Digital PDFs are read locally first; the text model is asked only when the fields can't be
+    picked out with confidence, and vision only when a stub has no text layer
+    """
     if not image_urls:
         return {}
     
-    prompt = f"""Analyze {len(image_urls)} pay stub image(s) and extract:
+    prompt = f"""Analyze {len(image_urls)} pay stub(s) and extract:
 1. Employer name
 2. Gross income amount
-3. Pay period (weekly/bi-weekly/monthly)
+3. Pay period (weekly/bi-weekly/semi-monthly/monthly)
 4. Pay date (most recent if multiple)
 
 Calculate monthly and annual income based on pay frequency.
 If multiple pay stubs, use the most recent or average."""
     
+    texts = await asyncio.gather(*(pdf_text(url) for url in image_urls))
+    if all(texts):
+        local = best_pay_stub(texts)
+        if local:
+            print(f"[PDF] Pay stub fields read from text layer ({len(texts)} document(s))")
+            return local
+        result = await _extract_from_text(prompt, texts, PAY_STUB_FUNCTION)
+        if result:
+            return result
+    
     # Build multimodal content with all pay stub images
     content = [{"type": "text", "text": prompt}]
     for url in image_urls:
@@ -387,35 +461,11 @@ If multiple pay stubs, use the most recent or average."""
         {"role": "user", "content": content}
     ]
     
-    functions = [{
-        "name": "extract_pay_stub",
-        "description": "Extract pay stub information",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "employerName": {"type": "string"},
-                "grossIncome": {"type": "number", "description": "Gross income per pay period"},
-                "payFrequency": {"type": "string", "enum": ["weekly", "bi-weekly", "monthly"]},
-                "payDate": {"type": "string", "description": "Pay date in YYYY-MM-DD format"},
-                "monthlyIncome": {"type": "number", "description": "Calculated monthly income"},
-                "annualIncome": {"type": "number", "description": "Calculated annual income"}
-            },
-            "required": ["employerName", "grossIncome", "payFrequency"]
-        }
-    }]
-    
-    response = await call_gemini(messages, VISION_MODEL, functions)
-    
-    if response.get("tool_calls"):
-        tool_call = response["tool_calls"][0]
-        if tool_call["function"]["name"] == "extract_pay_stub":
-            import json
-            return json.loads(tool_call["function"]["arguments"])
-    
-    return {}
+    response = await call_gemini(messages, VISION_MODEL, [PAY_STUB_FUNCTION])
+    return _function_result(response, "extract_pay_stub")
 
 async def _extract_credit_score(image_url: str) -> Dict[str, Any]:
-    """Extract credit score from document image"""
+    """Extract credit score from a document, reading a digital PDF's text layer before asking a model"""
     prompt = """Extract credit score information from this document:
 1. Credit score number (must be 300-850)
 2. Date when score was pulled (YYYY-MM-DD format)
@@ -423,45 +473,36 @@ async def _extract_credit_score(image_url: str) -> Dict[str, Any]:
 
 Validate that the score is numeric and within valid range (300-850)."""
     
-    messages = [
-        {"role": "system", "content": TENANT_DOCUMENT_SYSTEM},
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": image_url}}
-            ]
-        }
-    ]
-    
-    functions = [{
-        "name": "extract_credit_score",
-        "description": "Extract credit score information",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "creditScore": {"type": "integer", "description": "Credit score (300-850)"},
-                "creditScoreDate": {"type": "string", "description": "Date pulled in YYYY-MM-DD format"},
-                "creditBureau": {"type": "string", "description": "Credit bureau name"}
-            },
-            "required": ["creditScore"]
-        }
-    }]
-    
-    response = await call_gemini(messages, VISION_MODEL, functions)
+    result = {}
+    text = await pdf_text(image_url)
+    if text:
+        fields, confidence = extract_credit_score_fields(text)
+        if confidence >= DOCUMENT_FIELD_CONFIDENCE:
+            print(f"[PDF] Credit score read from text layer")
+            result = fields
+        else:
+            result = await _extract_from_text(prompt, [text], CREDIT_SCORE_FUNCTION)
     
-    if response.get("tool_calls"):
-        tool_call = response["tool_calls"][0]
-        if tool_call["function"]["name"] == "extract_credit_score":
-            import json
-            result = json.loads(tool_call["function"]["arguments"])
-            # Validate and parse date
-            score = result.get("creditScore", 0)
-            if score < 300 or score > 850:
-                result["creditScore"] = None
-            if result.get("creditScoreDate"):
-                from datetime import datetime
-                result["creditScoreDate"] = datetime.fromisoformat(result["creditScoreDate"].replace("Z", "+00:00"))
-            return result
+    if not result:
+        messages = [
+            {"role": "system", "content": TENANT_DOCUMENT_SYSTEM},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": image_url}}
+                ]
+            }
+        ]
+        response = await call_gemini(messages, VISION_MODEL, [CREDIT_SCORE_FUNCTION])
+        result = _function_result(response, "extract_credit_score")
     
-    return {}
\ No newline at end of file
+    if result:
+        # Validate and parse date
+        score = result.get("creditScore") or 0
+        if score < 300 or score > 850:
+            result["creditScore"] = None
+        if result.get("creditScoreDate"):
+            from datetime import datetime
+            result["creditScoreDate"] = datetime.fromisoformat(result["creditScoreDate"].replace("Z", "+00:00"))
+    return result
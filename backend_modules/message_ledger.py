@@ -0,0 +1,205 @@
+"""
+Processed-message ledger
+SQLite record of each inbound email's processing state, fronted by a Bloom filter for fast "never seen" checks
+"""
+
+import os
+import math
+import time
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+MESSAGE_LEDGER_PATH = os.getenv("MESSAGE_LEDGER_PATH", "processed_messages.db")
+# Finished messages older than this are compacted away (the inbox watermark keeps them from being rescanned)
+MESSAGE_LEDGER_RETENTION_DAYS = int(os.getenv("MESSAGE_LEDGER_RETENTION_DAYS", "90"))
+# A claim that hasn't finished within this long is assumed to belong to a crashed worker and can be retried
+MESSAGE_CLAIM_TIMEOUT_SECONDS = int(os.getenv("MESSAGE_CLAIM_TIMEOUT_SECONDS", "600"))
+
+# Processing states, in order; a message only ever moves forward
+STATES = ["received", "extracted", "persisted", "notified"]
+STATE_RANK = {state: rank for rank, state in enumerate(STATES)}
+DONE_STATE = "notified"
+# How often a Bloom miss may re-read other workers' writes; claim() is checked in SQLite regardless
+BLOOM_SYNC_INTERVAL_SECONDS = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_messages (
+    message_id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    state TEXT NOT NULL,
+    state_rank INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_processed_messages_updated ON processed_messages (updated_at);
+CREATE TABLE IF NOT EXISTS ledger_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over one BLAKE2b digest"""
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001):
+        self.size = max(1024, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class MessageLedger:
+    """
+    Durable per-message_id processing state shared by every worker that opens the same database
+    claim() is the atomic "this worker handles it" step, so two workers (or a scan racing a webhook)
+    never process the same email twice. The Bloom filter is loaded from the table and topped up with
+    other workers' writes by rowid, so most lookups for unseen ids never touch SQLite.
+    """
+
+    def __init__(self, db_path: str = MESSAGE_LEDGER_PATH, retention_days: int = MESSAGE_LEDGER_RETENTION_DAYS):
+        self.db_path = db_path
+        self.retention_days = retention_days
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        self._last_compacted = 0.0
+        self.compact()
+        self._rebuild_bloom()
+
+    def _rebuild_bloom(self) -> None:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM processed_messages").fetchone()[0]
+            self._bloom = BloomFilter(capacity=max(100_000, count * 2))
+            self._bloom_rowid = 0
+            self._bloom_synced = 0.0
+            self._sync_bloom()
+
+    def _sync_bloom(self) -> None:
+        """Add rows written since the last sync (including by other processes)"""
+        self._bloom_synced = time.monotonic()
+        rows = self._conn.execute(
+            "SELECT rowid, message_id FROM processed_messages WHERE rowid > ? ORDER BY rowid", (self._bloom_rowid,)
+        ).fetchall()
+        for row in rows:
+            self._bloom.add(row["message_id"])
+            self._bloom_rowid = row["rowid"]
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        if not message_id:
+            return None
+        with self._lock:
+            if message_id not in self._bloom:
+                if time.monotonic() - self._bloom_synced < BLOOM_SYNC_INTERVAL_SECONDS:
+                    return None
+                self._sync_bloom()
+                if message_id not in self._bloom:
+                    return None
+            row = self._conn.execute("SELECT * FROM processed_messages WHERE message_id = ?", (message_id,)).fetchone()
+            return dict(row) if row else None
+
+    def is_processed(self, message_id: str) -> bool:
+        """True once a message has been fully handled (applicant notified)"""
+        record = self.get(message_id)
+        return bool(record and record["state"] == DONE_STATE)
+
+    def claim(self, message_id: str, thread_id: Optional[str] = None) -> bool:
+        """
+        Mark a message as received by this worker
+        Returns False if it's already done, or another worker claimed it recently
+        """
+        now = datetime.now()
+        stale_before = (now - timedelta(seconds=MESSAGE_CLAIM_TIMEOUT_SECONDS)).isoformat()
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                INSERT INTO processed_messages (message_id, thread_id, state, state_rank, created_at, updated_at)
+                VALUES (?, ?, 'received', 0, ?, ?)
+                ON CONFLICT(message_id) DO UPDATE SET updated_at = excluded.updated_at
+                WHERE processed_messages.state != ? AND processed_messages.updated_at < ?
+                """,
+                (message_id, thread_id, now.isoformat(), now.isoformat(), DONE_STATE, stale_before),
+            )
+            claimed = cursor.rowcount > 0
+            if claimed:
+                self._bloom.add(message_id)
+            return claimed
+
+    def advance(self, message_id: str, state: str, detail: Optional[str] = None) -> None:
+        """Move a message to a later processing state (never backwards)"""
+        if state not in STATE_RANK:
+            raise ValueError(f"Unknown ledger state: {state}")
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO processed_messages (message_id, state, state_rank, created_at, updated_at, detail)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(message_id) DO UPDATE SET
+                    state = excluded.state, state_rank = excluded.state_rank,
+                    updated_at = excluded.updated_at, detail = COALESCE(excluded.detail, processed_messages.detail)
+                WHERE excluded.state_rank >= processed_messages.state_rank
+                """,
+                (message_id, state, STATE_RANK[state], now, now, detail),
+            )
+            self._bloom.add(message_id)
+        self.compact_if_due()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM ledger_meta WHERE key = ?", (key,)).fetchone()
+            return row["value"] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ledger_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    def compact(self) -> int:
+        """Delete finished messages older than the retention window; returns rows removed"""
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM processed_messages WHERE state = ? AND updated_at < ?", (DONE_STATE, cutoff)
+            ).rowcount
+            self._last_compacted = time.monotonic()
+        if removed:
+            print(f"[LEDGER] Compacted {removed} processed message(s) older than {self.retention_days} days")
+            # Removed ids can't be un-set in a Bloom filter, so start a fresh one
+            if hasattr(self, "_bloom"):
+                self._rebuild_bloom()
+        return removed
+
+    def compact_if_due(self, interval_seconds: int = 24 * 3600) -> None:
+        if time.monotonic() - self._last_compacted >= interval_seconds:
+            self.compact()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) AS n FROM processed_messages GROUP BY state").fetchall()
+        return {row["state"]: row["n"] for row in rows}
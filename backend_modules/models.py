@@ -107,7 +107,7 @@ class TenantApplication(BaseModel):
     employerName: Optional[str] = None
     monthlyIncome: Optional[float] = None
     annualIncome: Optional[float] = None
-    payFrequency: Optional[str] = None  # "weekly", "bi-weekly", "monthly"
+    payFrequency: Optional[str] = None  # "weekly", "bi-weekly", "semi-monthly", "monthly"
     
     creditScore: Optional[int] = None
     creditScoreDate: Optional[datetime] = None
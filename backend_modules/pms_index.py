@@ -0,0 +1,61 @@
+"""
+PMS phone index
+O(1) lookup from a normalized tenant phone to their synced PMS tenant record and current lease
+"""
+
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from backend_modules.tenant_directory import normalize_phone
+
+
+def _lease_rank(lease: Any) -> Tuple[bool, str]:
+    # Active leases win; otherwise the one that ends last
+    return (lease.status == "active", lease.end_date or "")
+
+
+class PMSPhoneIndex:
+    """
+    phone -> tenant and tenant_id -> current lease, maintained one sync page at a time
+    `version` changes with every page so caches built on top of it know to refresh
+    """
+
+    def __init__(self):
+        self._tenant_by_phone: Dict[str, Any] = {}
+        self._phone_by_tenant: Dict[str, str] = {}
+        self._lease_by_tenant: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def add_tenants(self, tenants: Iterable[Any]) -> None:
+        """Index PMSTenant records (inactive tenants are dropped from the index)"""
+        with self._lock:
+            for tenant in tenants:
+                old_phone = self._phone_by_tenant.pop(tenant.id, None)
+                if old_phone and self._tenant_by_phone.get(old_phone) is not None \
+                        and self._tenant_by_phone[old_phone].id == tenant.id:
+                    del self._tenant_by_phone[old_phone]
+                phone = normalize_phone(tenant.phone)
+                if phone and tenant.status != "inactive":
+                    self._tenant_by_phone[phone] = tenant
+                    self._phone_by_tenant[tenant.id] = phone
+            self.version += 1
+
+    def add_leases(self, leases: Iterable[Any]) -> None:
+        """Index PMSLease records, keeping the current lease per tenant"""
+        with self._lock:
+            for lease in leases:
+                current = self._lease_by_tenant.get(lease.tenant_id)
+                if current is None or current.id == lease.id or _lease_rank(lease) >= _lease_rank(current):
+                    self._lease_by_tenant[lease.tenant_id] = lease
+            self.version += 1
+
+    def lookup(self, phone: Optional[str]) -> Tuple[Optional[Any], Optional[Any]]:
+        """(PMSTenant, PMSLease) for a phone; either may be None"""
+        tenant = self._tenant_by_phone.get(normalize_phone(phone))
+        if tenant is None:
+            return None, None
+        return tenant, self._lease_by_tenant.get(tenant.id)
+
+    def __len__(self) -> int:
+        return len(self._tenant_by_phone)
@@ -0,0 +1,159 @@
+"""
+PMS sync engine
+Pulls tenants and leases from a property management system with incremental cursors,
+concurrent page fetches and batched writes
+"""
+
+import os
+import json
+import asyncio
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+PMS_BASE_URL = os.getenv("PMS_BASE_URL", "")
+PMS_API_KEY = os.getenv("PMS_API_KEY", "")
+PMS_PAGE_SIZE = int(os.getenv("PMS_PAGE_SIZE", "500"))
+PMS_SYNC_CONCURRENCY = int(os.getenv("PMS_SYNC_CONCURRENCY", "4"))
+PMS_SYNC_STATE_PATH = os.getenv("PMS_SYNC_STATE_PATH", "pms_sync_state.json")
+
+RESOURCES = ["tenants", "leases"]
+
+
+class HttpPMSAdapter:
+    """
+    Reads a PMS REST API with this contract:
+        GET {base_url}/{resource}?updated_since=<iso>&page=<n>&page_size=<m>
+        -> {"data": [{..., "updated_at": "<iso>"}], "total_pages": <n>}
+    Pass `transport` to run it against an in-process stand-in server.
+    """
+
+    def __init__(self, base_url: str = PMS_BASE_URL, api_key: str = PMS_API_KEY,
+                 page_size: int = PMS_PAGE_SIZE, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.page_size = page_size
+        self.transport = transport
+
+    def client(self) -> httpx.AsyncClient:
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        return httpx.AsyncClient(base_url=self.base_url, headers=headers, timeout=30, transport=self.transport)
+
+    async def fetch_page(self, client: httpx.AsyncClient, resource: str, updated_since: Optional[str],
+                         page: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Returns (records, total_pages)"""
+        params = {"page": page, "page_size": self.page_size}
+        if updated_since:
+            params["updated_since"] = updated_since
+        response = await client.get(f"/{resource}", params=params)
+        response.raise_for_status()
+        body = response.json()
+        return body.get("data", []), int(body.get("total_pages", 1))
+
+
+BatchHandler = Callable[[str, List[Dict[str, Any]]], Any]
+BatchListener = Callable[[str, int, int, str, Dict[str, Any]], Any]
+
+
+class PMSSyncEngine:
+    """
+    Incremental sync of PMS resources
+    Pages are fetched `concurrency` at a time and handed to the handler as they arrive, so memory stays
+    bounded by the fetch window rather than the size of the portfolio. The updated_since cursor only
+    advances after a resource syncs completely, so a failed run is retried from the same point.
+    """
+
+    def __init__(self, adapter: HttpPMSAdapter, handlers: Dict[str, BatchHandler],
+                 on_batch: Optional[BatchListener] = None, concurrency: int = PMS_SYNC_CONCURRENCY,
+                 state_path: str = PMS_SYNC_STATE_PATH):
+        self.adapter = adapter
+        self.handlers = handlers
+        self.on_batch = on_batch
+        self.concurrency = max(1, concurrency)
+        self.state_path = state_path
+        self.cursors: Dict[str, str] = self._load_cursors()
+        self.running = False
+        self.last_run: Dict[str, Any] = {}
+
+    def _load_cursors(self) -> Dict[str, str]:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cursors(self) -> None:
+        try:
+            with open(self.state_path, "w") as f:
+                json.dump(self.cursors, f)
+        except OSError as e:
+            print(f"[PMS] Could not save sync cursors: {e}")
+
+    def reset_cursors(self) -> None:
+        """Force the next run to be a full sync"""
+        self.cursors = {}
+        self._save_cursors()
+
+    async def _handle(self, resource: str, page: int, records: List[Dict[str, Any]], updated_since: Optional[str]) -> str:
+        result = self.handlers[resource](resource, records)
+        if asyncio.iscoroutine(result):
+            await result
+        if self.on_batch and records:
+            self.on_batch(resource, page, len(records), "success", {"updated_since": updated_since})
+        return max((r.get("updated_at") or "" for r in records), default="")
+
+    async def sync_resource(self, client: httpx.AsyncClient, resource: str) -> Dict[str, Any]:
+        updated_since = self.cursors.get(resource)
+        started = datetime.now()
+        records, total_pages = await self.adapter.fetch_page(client, resource, updated_since, 1)
+        newest = await self._handle(resource, 1, records, updated_since)
+        synced = len(records)
+
+        async def fetch(page: int):
+            return page, (await self.adapter.fetch_page(client, resource, updated_since, page))[0]
+
+        # Work through the remaining pages one window of concurrent fetches at a time
+        for window_start in range(2, total_pages + 1, self.concurrency):
+            window = range(window_start, min(window_start + self.concurrency, total_pages + 1))
+            for done in asyncio.as_completed([fetch(page) for page in window]):
+                try:
+                    page, records = await done
+                except Exception as e:
+                    if self.on_batch:
+                        self.on_batch(resource, -1, 0, "failed", {"error": str(e)})
+                    raise
+                newest = max(newest, await self._handle(resource, page, records, updated_since))
+                synced += len(records)
+
+        if newest:
+            self.cursors[resource] = newest
+            self._save_cursors()
+        return {
+            "records": synced,
+            "pages": total_pages,
+            "updated_since": updated_since,
+            "cursor": self.cursors.get(resource),
+            "seconds": round((datetime.now() - started).total_seconds(), 2),
+        }
+
+    async def run(self, resources: List[str] = None) -> Dict[str, Any]:
+        """Sync each resource in order (tenants before leases so leases can join to them)"""
+        if self.running:
+            return {"skipped": "sync already running"}
+        self.running = True
+        results: Dict[str, Any] = {"started_at": datetime.now().isoformat()}
+        try:
+            async with self.adapter.client() as client:
+                for resource in resources or RESOURCES:
+                    try:
+                        results[resource] = await self.sync_resource(client, resource)
+                        print(f"[PMS] Synced {resource}: {results[resource]}")
+                    except Exception as e:
+                        print(f"[ERROR] PMS sync of {resource} failed: {e}")
+                        results[resource] = {"error": str(e)}
+        finally:
+            self.running = False
+            results["finished_at"] = datetime.now().isoformat()
+            self.last_run = results
+        return results
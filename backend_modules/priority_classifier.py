@@ -0,0 +1,98 @@
+"""
+Maintenance priority classifier
+Compiled multi-pattern keyword matching with per-property keyword sets
+"""
+
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Bare hazard words catch "FIRE!!" and "smoke everywhere"; equipment and billing words right after one
+# ("fire alarm battery", "gas bill") and a negation right before one ("no smoke") cancel the match
+DEFAULT_KEYWORDS: Dict[str, List[str]] = {
+    "critical": [
+        "fire", "smoke", "flood", "gas", "gas leak", "smell gas", "gas smell", "leaking gas", "carbon monoxide",
+        "carbon monoxide alarm going off", "carbon monoxide alarm went off", "sewage", "sparks from", "sparking",
+        "exposed wire", "electrical fire", "burst pipe", "pipe burst", "water everywhere", "overflowing",
+        "leaking water", "emergency",
+    ],
+    "high": ["urgent", "broken", "not working", "damaged", "repair", "fix"],
+}
+
+# Checked in this order - the first level with a match wins
+LEVELS = ["critical", "high"]
+
+# A negation directly before a match cancels it ("no smoke", "not flooding", "isn't any gas")
+_NEGATION = re.compile(r"\b(?:no|not|never|without|isn'?t|aren'?t|wasn'?t)\s+(?:(?:a|an|any)\s+)?$", re.I)
+# Equipment or paperwork named after a hazard isn't the hazard ("carbon monoxide detector beeping", "gas bill")
+_EQUIPMENT = re.compile(
+    r"\s*(?:detectors?|alarms?|drills?|extinguishers?|batter(?:y|ies)|inspections?|bills?|company|stations?|prices?)\b",
+    re.I
+)
+
+
+def _keyword_pattern(keyword: str) -> str:
+    words = [re.escape(word) for word in keyword.lower().split()]
+    # Allow simple inflections on the last word ("flooding", "leaks") and any spacing between words
+    return r"\b" + r"\s+".join(words) + r"(?:s|es|ed|ing)?\b"
+
+
+def _is_negated(text: str, start: int) -> bool:
+    return bool(_NEGATION.search(text, max(0, start - 20), start))
+
+
+def _compile(keywords: Dict[str, List[str]]) -> re.Pattern:
+    groups = []
+    for level in LEVELS:
+        terms = sorted(set(keywords.get(level, [])), key=len, reverse=True)
+        if terms:
+            groups.append(f"(?P<{level}>{'|'.join(_keyword_pattern(t) for t in terms)})")
+    return re.compile("|".join(groups) or r"(?!x)x", re.IGNORECASE)
+
+
+class PriorityClassifier:
+    """Classifies issue text as critical/high/normal with one compiled regex per keyword set"""
+
+    def __init__(self, keywords: Dict[str, List[str]] = None):
+        self.default_keywords = keywords or DEFAULT_KEYWORDS
+        self._default_pattern = _compile(self.default_keywords)
+        self._property_keywords: Dict[str, Dict[str, List[str]]] = {}
+        self._property_patterns: Dict[str, re.Pattern] = {}
+        self._lock = threading.Lock()
+
+    def set_property_keywords(self, property_id: str, keywords: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Add extra keywords for one property (on top of the defaults) and recompile its pattern"""
+        merged = {
+            level: list(self.default_keywords.get(level, [])) + [k for k in keywords.get(level, []) if k.strip()]
+            for level in LEVELS
+        }
+        pattern = _compile(merged)
+        with self._lock:
+            self._property_keywords[property_id] = {level: keywords.get(level, []) for level in LEVELS}
+            self._property_patterns[property_id] = pattern
+        return merged
+
+    def get_property_keywords(self, property_id: str) -> Dict[str, List[str]]:
+        """Extra keywords configured for a property"""
+        return self._property_keywords.get(property_id, {level: [] for level in LEVELS})
+
+    def classify(self, text: str, property_id: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """
+        Classify issue text
+        Returns (priority, matched keyword); priority is "normal" when nothing matches
+        """
+        pattern = self._property_patterns.get(property_id, self._default_pattern) if property_id else self._default_pattern
+        found_level, found_keyword = None, None
+        text = text or ""
+        for match in pattern.finditer(text):
+            if _is_negated(text, match.start()) or _EQUIPMENT.match(text, match.end()):
+                continue
+            level = match.lastgroup
+            if level == "critical":
+                return "critical", match.group(0)
+            if found_level is None:
+                found_level, found_keyword = level, match.group(0)
+        return found_level or "normal", found_keyword
+
+    def is_critical(self, text: str, property_id: Optional[str] = None) -> bool:
+        return self.classify(text, property_id)[0] == "critical"
@@ -0,0 +1,124 @@
+"""
+Incremental property sync
+Manifest diffing and delta application of frontend properties into the tenant directory
+"""
+
+import json
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional
+
+from backend_modules.tenant_directory import TenantDirectory, is_pms_property, normalize_phone
+
+
+def property_fingerprint(prop: Dict[str, Any]) -> str:
+    """
+    Version of a property payload
+    Uses the client's own version/updatedAt when present, otherwise a SHA-256 of the canonical JSON
+    """
+    version = prop.get("version") or prop.get("updatedAt")
+    if version:
+        return str(version)
+    canonical = json.dumps(prop, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def diff_manifest(directory: TenantDirectory, manifest: List[Dict[str, Any]], complete: bool = False) -> Dict[str, Any]:
+    """
+    Compare a client manifest ([{"id", "version" | "hash"}]) with what the server holds
+    Returns the IDs the client needs to send; with complete=True also the IDs it no longer has
+    """
+    changed: List[str] = []
+    listed = set()
+    for entry in manifest:
+        property_id = entry.get("id") if isinstance(entry, dict) else None
+        if not property_id:
+            continue
+        listed.add(property_id)
+        record = directory.get(property_id)
+        client_version = entry.get("version") or entry.get("hash")
+        if record is None or not client_version or record.sync_version != str(client_version):
+            changed.append(property_id)
+
+    # Only frontend-owned records can be missing from a frontend manifest
+    removed = [pid for pid, _ in directory.items() if pid not in listed and not is_pms_property(pid)] if complete else []
+    return {
+        "changed": changed,
+        "removed": removed,
+        "unchanged": len(listed) - len(changed),
+    }
+
+
+def apply_property(directory: TenantDirectory, prop: Dict[str, Any]) -> str:
+    """
+    Apply one property payload from the frontend
+    Returns "created", "updated", "unchanged" or "skipped" (missing id/phone, or a PMS-owned id)
+    """
+    property_id = prop.get("id")
+    phone = normalize_phone(prop.get("phone"))
+    if not property_id or not phone or is_pms_property(str(property_id)):
+        return "skipped"
+
+    fingerprint = property_fingerprint(prop)
+    record = directory.get(property_id)
+    if record is not None and record.sync_version == fingerprint:
+        return "unchanged"
+
+    if record is not None and record.tenant_phone and record.tenant_phone != phone:
+        # The property's phone is authoritative in a sync - the old number stops routing here
+        directory.unlink_phone(record.tenant_phone)
+
+    context = prop.get("context") or {}
+    directory.upsert(
+        property_id,
+        phone=phone,
+        tenant_name=context.get("tenant_name", "Tenant"),
+        unit=context.get("unit", "Unknown"),
+        address=context.get("address", "Unknown"),
+        property_name=context.get("property_name", prop.get("name", "Property")),
+        hotline=context.get("hotline"),
+        portal_url=context.get("portal_url"),
+        sync_version=fingerprint,
+    )
+    return "updated" if record is not None else "created"
+
+
+class SyncReport:
+    """Counts (and a sample of IDs) for each outcome of a sync run"""
+
+    MAX_IDS = 100
+
+    def __init__(self):
+        self.counts = {"created": 0, "updated": 0, "unchanged": 0, "skipped": 0, "removed": 0, "errors": 0}
+        self.ids: Dict[str, List[str]] = {"created": [], "updated": [], "removed": []}
+        self.errors: List[str] = []
+
+    def record(self, outcome: str, property_id: Optional[str] = None) -> None:
+        self.counts[outcome] += 1
+        if property_id and outcome in self.ids and len(self.ids[outcome]) < self.MAX_IDS:
+            self.ids[outcome].append(property_id)
+
+    def error(self, message: str) -> None:
+        self.counts["errors"] += 1
+        if len(self.errors) < self.MAX_IDS:
+            self.errors.append(message)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.counts, **{f"{k}_ids": v for k, v in self.ids.items()}, "error_details": self.errors}
+
+
+def apply_properties(directory: TenantDirectory, properties: Iterable[Dict[str, Any]],
+                     removed: Iterable[str] = (), report: Optional[SyncReport] = None) -> SyncReport:
+    """Apply a batch of property payloads and removals"""
+    report = report or SyncReport()
+    for position, prop in enumerate(properties):
+        if not isinstance(prop, dict):
+            report.error(f"item {position}: expected a JSON object")
+            continue
+        report.record(apply_property(directory, prop), prop.get("id"))
+    for property_id in removed:
+        if not isinstance(property_id, str):
+            report.error(f"removed id {property_id!r}: expected a string")
+            continue
+        if not is_pms_property(property_id) and directory.remove(property_id):
+            report.record("removed", property_id)
+    return report
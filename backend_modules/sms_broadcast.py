@@ -0,0 +1,177 @@
+"""
+SMS broadcast pipeline
+Template rendering, per-sender rate limiting and a concurrent send pipeline for property-wide texts
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import itertools
+from datetime import datetime
+from string import Formatter
+from typing import Any, Callable, Dict, List, Optional
+
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+# Throughput limit for each sending number. US long codes take about 1 message/s - raise it only for
+# toll-free or short code senders, or sends come back 429 and carriers start filtering
+BROADCAST_SENDS_PER_SECOND = float(os.getenv("BROADCAST_SENDS_PER_SECOND", "1"))
+# Numbers to spread a broadcast across; empty uses the default Twilio number
+BROADCAST_FROM_NUMBERS = [n.strip() for n in os.getenv("BROADCAST_FROM_NUMBERS", "").split(",") if n.strip()]
+BROADCAST_LOG_BATCH = 50
+
+TEMPLATE_FIELDS = ("tenant_name", "unit", "property_name", "address")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def validate_template(template: str) -> str:
+    """Check a broadcast template only uses known {placeholders}"""
+    try:
+        fields = {name for _, name, _, _ in Formatter().parse(template) if name is not None}
+    except ValueError as e:
+        raise TemplateError(f"Invalid template: {e}")
+    unknown = fields - set(TEMPLATE_FIELDS)
+    if unknown:
+        raise TemplateError(f"Unknown template fields: {', '.join(sorted(unknown))} (allowed: {', '.join(TEMPLATE_FIELDS)})")
+    if not template.strip():
+        raise TemplateError("Template is empty")
+    return template
+
+
+def render_template(template: str, fields: Dict[str, Any]) -> str:
+    return template.format_map({name: fields.get(name) or "" for name in TEMPLATE_FIELDS})
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, with bursts up to one second's worth"""
+
+    def __init__(self, rate: float):
+        self.rate = max(rate, 0.1)
+        self.capacity = max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BroadcastJob:
+    """Progress and failures of one broadcast"""
+
+    MAX_FAILURES = 200
+
+    def __init__(self, description: Dict[str, Any], total: int):
+        self.id = f"BC{uuid.uuid4().hex[:10]}"
+        self.description = description
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.failures: List[Dict[str, str]] = []
+        self.status = "queued"
+        self.created_at = datetime.now().isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+
+    def fail(self, phone: str, error: str) -> None:
+        self.failed += 1
+        if len(self.failures) < self.MAX_FAILURES:
+            self.failures.append({"phone": phone, "error": error})
+
+    def to_dict(self) -> Dict[str, Any]:
+        done = self.sent + self.failed
+        return {
+            "id": self.id,
+            "status": self.status,
+            **self.description,
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "progress": round(done / self.total, 3) if self.total else 1.0,
+            "failures": self.failures,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+# send(to_number, body, from_number) -> message SID or None
+SendFn = Callable[[str, str, str], Any]
+# log_batch([(phone, body, from_number, sid), ...])
+LogBatchFn = Callable[[List[tuple]], None]
+
+
+class BroadcastPipeline:
+    """
+    Fans messages out over `concurrency` workers
+    Each send first takes a token from its sending number's rate limiter; sending numbers are used round-robin.
+    Delivered messages are handed to `log_batch` in chunks rather than one store write per message.
+    """
+
+    def __init__(self, send: SendFn, log_batch: LogBatchFn, senders: List[str],
+                 concurrency: int = BROADCAST_CONCURRENCY, rate: float = BROADCAST_SENDS_PER_SECOND):
+        self.send = send
+        self.log_batch = log_batch
+        self.senders = senders
+        self.concurrency = max(1, concurrency)
+        self.limiters = {sender: RateLimiter(rate) for sender in senders}
+        self._next_sender = itertools.cycle(senders)
+
+    async def run(self, job: BroadcastJob, messages: List[Dict[str, str]]) -> BroadcastJob:
+        """messages: [{"phone", "body"}] already rendered"""
+        job.status = "running"
+        job.started_at = datetime.now().isoformat()
+        queue: asyncio.Queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+        delivered: List[tuple] = []
+
+        def flush():
+            if delivered:
+                self.log_batch(list(delivered))
+                delivered.clear()
+
+        async def worker():
+            while True:
+                try:
+                    message = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                sender = next(self._next_sender)
+                await self.limiters[sender].acquire()
+                try:
+                    sid = await self.send(message["phone"], message["body"], sender)
+                except Exception as e:
+                    sid, error = None, str(e)
+                else:
+                    error = "Send failed"
+                if sid:
+                    job.sent += 1
+                    delivered.append((message["phone"], message["body"], sender, sid))
+                    if len(delivered) >= BROADCAST_LOG_BATCH:
+                        flush()
+                else:
+                    job.fail(message["phone"], error)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(messages)) or 1)))
+            job.status = "completed" if not job.failed else ("failed" if not job.sent else "completed_with_errors")
+        except Exception as e:
+            print(f"[ERROR] Broadcast {job.id} aborted: {e}")
+            job.status = "failed"
+        finally:
+            flush()
+            job.finished_at = datetime.now().isoformat()
+        print(f"[BROADCAST] {job.id} finished: {job.sent} sent, {job.failed} failed of {job.total}")
+        return job
@@ -0,0 +1,181 @@
+"""
+Tenant directory
+One typed, compact store for phone -> property -> settings/context lookups
+"""
+
+import re
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+_NON_DIGITS_RE = re.compile(r"\D")
+# Records synced from the PMS live under "pms-<tenant id>"; the frontend's property sync never owns them
+PMS_ID_PREFIX = "pms-"
+
+
+def pms_property_id(tenant_id: str) -> str:
+    return f"{PMS_ID_PREFIX}{tenant_id}"
+
+
+def is_pms_property(property_id: str) -> bool:
+    return property_id.startswith(PMS_ID_PREFIX)
+
+
+def normalize_phone(phone: Optional[str]) -> str:
+    """
+    Normalize a phone number to E.164 (US numbers assumed when there's no country code)
+    Returns "" when there are no digits at all
+    """
+    if not phone:
+        return ""
+    phone = phone.strip()
+    digits = _NON_DIGITS_RE.sub("", phone)
+    if not digits:
+        return ""
+    if not phone.startswith("+") and len(digits) == 10:
+        digits = "1" + digits
+    return f"+{digits}"
+
+
+class PropertyRecord:
+    """A property with its tenant context and SMS settings"""
+
+    __slots__ = (
+        "property_id", "property_name", "address", "unit", "tenant_name", "tenant_phone",
+        "hotline", "portal_url", "ai_enabled", "auto_reply", "verification_sent", "sync_version",
+    )
+
+    # Fields an upsert may set directly (the tenant phone is set by linking it, so it stays normalized)
+    FIELDS = tuple(f for f in __slots__ if f not in ("property_id", "tenant_phone"))
+    SETTINGS_FIELDS = ("ai_enabled", "auto_reply", "verification_sent")
+
+    def __init__(self, property_id: str):
+        self.property_id = property_id
+        self.property_name: Optional[str] = None
+        self.address: Optional[str] = None
+        self.unit: Optional[str] = None
+        self.tenant_name: Optional[str] = None
+        self.tenant_phone: Optional[str] = None
+        self.hotline: Optional[str] = None
+        self.portal_url: Optional[str] = None
+        self.ai_enabled = True
+        self.auto_reply = True
+        self.verification_sent = False
+        self.sync_version: Optional[str] = None  # fingerprint of the last synced frontend payload
+
+    def settings(self) -> Dict[str, bool]:
+        return {field: getattr(self, field) for field in self.SETTINGS_FIELDS}
+
+    def context(self, phone: Optional[str] = None) -> Dict[str, Any]:
+        """Tenant context in the shape of the Context model"""
+        return {
+            "tenant_name": self.tenant_name or "Tenant",
+            "unit": self.unit or "Unknown",
+            "address": self.address or "Unknown",
+            "hotline": self.hotline,
+            "portal_url": self.portal_url,
+            "property_name": self.property_name or f"Property {self.property_id}",
+            "tenant_phone": phone or self.tenant_phone,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+# Settings for phones that aren't linked to any property
+DEFAULT_RECORD = PropertyRecord("")
+
+
+class TenantDirectory:
+    """
+    Phone (E.164) -> property_id -> PropertyRecord, both hops O(1)
+    All writes go through upsert so every endpoint stores the same shape.
+    `version` changes on every write so caches built from the directory can detect staleness.
+    """
+
+    def __init__(self):
+        self._properties: Dict[str, PropertyRecord] = {}
+        self._phone_to_property: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def upsert(self, property_id: str, phone: Optional[str] = None, **fields: Any) -> PropertyRecord:
+        """
+        Create or update a property record and optionally link a tenant phone to it
+        Unknown fields and None values are ignored, so partial updates never blank existing data
+        """
+        self.upsert_many([(property_id, phone, fields)])
+        return self._properties[property_id]
+
+    def update_fields(self, property_id: str, fields: Dict[str, Any]) -> PropertyRecord:
+        """
+        Update a property from a request body taken as a dict
+        Keys like property_id or phone in the body are ignored - they can't rename the record or relink phones
+        """
+        self.upsert_many([(property_id, None, fields)])
+        return self._properties[property_id]
+
+    def upsert_many(self, rows: Iterable[Tuple[str, Optional[str], Dict[str, Any]]]) -> int:
+        """
+        Batched upsert of (property_id, phone, fields) rows under one lock acquisition
+        Returns the number of rows applied
+        """
+        count = 0
+        with self._lock:
+            for property_id, phone, fields in rows:
+                record = self._properties.get(property_id)
+                if record is None:
+                    record = self._properties[property_id] = PropertyRecord(property_id)
+                for field, value in fields.items():
+                    if value is not None and field in PropertyRecord.FIELDS:
+                        setattr(record, field, value)
+                phone = normalize_phone(phone)
+                if phone:
+                    self._phone_to_property[phone] = property_id
+                    record.tenant_phone = phone
+                count += 1
+            if count:
+                self.version += 1
+        return count
+
+    def unlink_phone(self, phone: Optional[str]) -> None:
+        """Stop routing a phone to its property"""
+        with self._lock:
+            if self._phone_to_property.pop(normalize_phone(phone), None) is not None:
+                self.version += 1
+
+    def remove(self, property_id: str) -> bool:
+        """Delete a property and every phone linked to it"""
+        with self._lock:
+            if self._properties.pop(property_id, None) is None:
+                return False
+            for phone in [p for p, pid in self._phone_to_property.items() if pid == property_id]:
+                del self._phone_to_property[phone]
+            self.version += 1
+            return True
+
+    def get(self, property_id: str) -> Optional[PropertyRecord]:
+        return self._properties.get(property_id)
+
+    def property_id_for(self, phone: Optional[str]) -> Optional[str]:
+        return self._phone_to_property.get(normalize_phone(phone))
+
+    def lookup(self, phone: Optional[str]) -> Optional[PropertyRecord]:
+        """Property record a phone is linked to, if any"""
+        property_id = self._phone_to_property.get(normalize_phone(phone))
+        return self._properties.get(property_id) if property_id else None
+
+    def settings_for(self, phone: Optional[str]) -> PropertyRecord:
+        """Record to read SMS settings from (defaults when the phone isn't linked)"""
+        return self.lookup(phone) or DEFAULT_RECORD
+
+    def phone_mappings(self) -> Dict[str, str]:
+        return dict(self._phone_to_property)
+
+    def items(self) -> Iterator[Tuple[str, PropertyRecord]]:
+        return iter(list(self._properties.items()))
+
+    def __contains__(self, property_id: str) -> bool:
+        return property_id in self._properties
+
+    def __len__(self) -> int:
+        return len(self._properties)
@@ -0,0 +1,117 @@
+"""
+Agentmail thread cache
+Shared per-thread cache of fetched threads, message ids and the last-message pointer used for replies
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+AGENTMAIL_THREAD_CACHE_TTL = float(os.getenv("AGENTMAIL_THREAD_CACHE_TTL", "300"))
+AGENTMAIL_THREAD_CACHE_SIZE = int(os.getenv("AGENTMAIL_THREAD_CACHE_SIZE", "2000"))
+
+
+def _message_id(message: Dict[str, Any]) -> Optional[str]:
+    return message.get("message_id") or message.get("id")
+
+
+class ThreadCache:
+    """
+    LRU of thread_id -> {thread, message_ids, last_message_id, updated_at, fetched_at}
+    Full thread bodies expire after `ttl` seconds or as soon as a new message is seen. The message ids and
+    last-message pointer outlive the body: they are only moved forward by fetches, webhooks and our own
+    replies, which is all a reply needs.
+    """
+
+    def __init__(self, ttl: float = AGENTMAIL_THREAD_CACHE_TTL, max_size: int = AGENTMAIL_THREAD_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, thread_id: str) -> Dict[str, Any]:
+        entry = self._entries.get(thread_id)
+        if entry is None:
+            entry = self._entries[thread_id] = {
+                "thread": None, "message_ids": [], "last_message_id": None, "updated_at": "", "fetched_at": 0.0
+            }
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(thread_id)
+        return entry
+
+    def get(self, thread_id: str, updated_at: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Cached full thread, or None if absent, expired, invalidated, or older than `updated_at`
+        (pass a thread listing's updated_at to catch changes no webhook told us about)
+        """
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            fresh = (
+                entry is not None and entry["thread"] is not None
+                and time.monotonic() - entry["fetched_at"] < self.ttl
+                and not (updated_at and entry["updated_at"] and updated_at > entry["updated_at"])
+            )
+            if not fresh:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(thread_id)
+            self.hits += 1
+            return entry["thread"]
+
+    def put(self, thread: Dict[str, Any]) -> None:
+        """Store a thread fetched from the API"""
+        thread_id = thread.get("thread_id") or thread.get("id")
+        if not thread_id:
+            return
+        message_ids = [mid for mid in (_message_id(m) for m in thread.get("messages", [])) if mid]
+        with self._lock:
+            entry = self._entry(thread_id)
+            # Keep ids seen via webhooks that the fetched copy doesn't have yet
+            entry["message_ids"] = message_ids + [mid for mid in entry["message_ids"] if mid not in message_ids]
+            if entry["last_message_id"] and entry["last_message_id"] not in message_ids:
+                # A fetch that started before the latest webhook or reply: the pointer and the
+                # invalidation stay as they are, or the next reply would attach to an older message
+                return
+            entry["thread"] = thread
+            entry["fetched_at"] = time.monotonic()
+            entry["updated_at"] = max(entry["updated_at"], thread.get("updated_at") or thread.get("timestamp") or "")
+            if message_ids:
+                entry["last_message_id"] = message_ids[-1]
+
+    def note_message(self, thread_id: str, message_id: Optional[str]) -> None:
+        """A new message landed in the thread (webhook or our own reply): drop the stale body, move the pointer"""
+        if not thread_id:
+            return
+        with self._lock:
+            entry = self._entry(thread_id)
+            entry["thread"] = None
+            if message_id:
+                if message_id not in entry["message_ids"]:
+                    entry["message_ids"].append(message_id)
+                entry["last_message_id"] = message_id
+
+    def last_message_id(self, thread_id: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            return entry["last_message_id"] if entry else None
+
+    def message_ids(self, thread_id: str) -> List[str]:
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            return list(entry["message_ids"]) if entry else []
+
+    def invalidate(self, thread_id: Optional[str] = None) -> None:
+        """Forget one thread, or all of them"""
+        with self._lock:
+            if thread_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(thread_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,167 @@
+"""
+Duplicate maintenance ticket detection
+SimHash fingerprints over normalized issue text, indexed per property and unit
+"""
+
+import os
+import re
+import hashlib
+import threading
+from typing import Dict, FrozenSet, Optional, Tuple, NamedTuple
+
+# Max Hamming distance (out of 64 bits) for two reports to count as the same issue
+SAME_UNIT_MAX_DISTANCE = int(os.getenv("TICKET_DUP_SAME_UNIT_DISTANCE", "12"))
+# Neighbours reporting a building-wide issue must match more closely
+SAME_PROPERTY_MAX_DISTANCE = int(os.getenv("TICKET_DUP_SAME_PROPERTY_DISTANCE", "6"))
+# Short reports share most SimHash bits ("sink is leaking" / "sink is clogged"), so a fingerprint match
+# must also share this fraction of words (Jaccard) to count
+MIN_TOKEN_OVERLAP = float(os.getenv("TICKET_DUP_MIN_TOKEN_OVERLAP", "0.6"))
+
+_STOPWORDS = set(
+    "the a an and or but is are was were be been to of in on at for with my our your it its this that "
+    "there i we you me have has had not no do does did from as by so just very can will would please also "
+    "hi hello thanks thank esto create make open new need maintenance ticket request".split()
+)
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SUFFIX_RE = re.compile(r"(ing|ed|es|s)$")
+# Context lines added by the ticket builders - identical across reports, so they'd mask real differences
+_METADATA_RE = re.compile(r"^\s*(maintenance request from|unit:|property:|address:|phone:)", re.IGNORECASE)
+_SECTION_BREAKS = ("---", "troubleshooting attempted:", "images provided:")
+
+
+def normalize_issue_text(description: str) -> str:
+    """Reduce a ticket description to the tenant's own words about the issue"""
+    lines = []
+    for line in (description or "").splitlines():
+        stripped = line.strip()
+        if any(stripped.lower().startswith(marker) for marker in _SECTION_BREAKS):
+            break
+        if not stripped or _METADATA_RE.match(stripped):
+            continue
+        if stripped.lower().startswith("tenant message:"):
+            stripped = stripped[len("tenant message:"):]
+        lines.append(stripped)
+    return " ".join(lines).lower()
+
+
+def tokenize(text: str):
+    """Yield comparable word features from normalized text"""
+    for token in _TOKEN_RE.findall(text):
+        if len(token) < 2 or token in _STOPWORDS:
+            continue
+        # Crude stemming so "leaking"/"leaks"/"leaked" share a feature
+        yield _SUFFIX_RE.sub("", token) if len(token) > 4 else token
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of normalized text (token features weighted by frequency)"""
+    weights: Dict[str, int] = {}
+    for token in tokenize(text):
+        weights[token] = weights.get(token, 0) + 1
+
+    vector = [0] * 64
+    for token, weight in weights.items():
+        value = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            vector[bit] += weight if (value >> bit) & 1 else -weight
+
+    fingerprint = 0
+    for bit in range(64):
+        if vector[bit] > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def token_overlap(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Jaccard similarity of two token sets"""
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def fingerprint_issue(description: str) -> Optional[int]:
+    """SimHash of a ticket description, or None if it has no meaningful words to compare"""
+    normalized = normalize_issue_text(description)
+    if next(tokenize(normalized), None) is None:
+        return None
+    return simhash(normalized)
+
+
+class DuplicateMatch(NamedTuple):
+    ticket_id: str
+    distance: int
+    same_unit: bool
+
+
+class DuplicateTicketIndex:
+    """
+    In-memory index of open ticket fingerprints
+    Lookups only scan the tickets of one property, so cost stays flat as the portfolio grows
+    """
+
+    def __init__(self):
+        # property -> unit -> ticket_id -> fingerprint
+        self._scopes: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self._locations: Dict[str, Tuple[str, str]] = {}
+        self._tokens: Dict[str, FrozenSet[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(value: Optional[str]) -> str:
+        return (value or "").strip().lower()
+
+    def add(self, ticket_id: str, property_name: str, unit: str, description: str) -> None:
+        """Index an open ticket"""
+        fingerprint = fingerprint_issue(description)
+        prop, unit_key = self._key(property_name), self._key(unit)
+        with self._lock:
+            self._remove_locked(ticket_id)
+            if fingerprint is None:
+                return
+            self._scopes.setdefault(prop, {}).setdefault(unit_key, {})[ticket_id] = fingerprint
+            self._locations[ticket_id] = (prop, unit_key)
+            self._tokens[ticket_id] = frozenset(tokenize(normalize_issue_text(description)))
+
+    def remove(self, ticket_id: str) -> None:
+        """Drop a ticket (e.g. once it is resolved or closed)"""
+        with self._lock:
+            self._remove_locked(ticket_id)
+
+    def _remove_locked(self, ticket_id: str) -> None:
+        self._tokens.pop(ticket_id, None)
+        location = self._locations.pop(ticket_id, None)
+        if not location:
+            return
+        prop, unit_key = location
+        units = self._scopes.get(prop, {})
+        units.get(unit_key, {}).pop(ticket_id, None)
+        if unit_key in units and not units[unit_key]:
+            del units[unit_key]
+        if prop in self._scopes and not self._scopes[prop]:
+            del self._scopes[prop]
+
+    def find(self, property_name: str, unit: str, description: str) -> Optional[DuplicateMatch]:
+        """
+        Find the closest open ticket reporting the same issue
+        Same-unit matches are preferred; other units in the property need a closer match
+        """
+        fingerprint = fingerprint_issue(description)
+        if fingerprint is None:
+            return None
+        tokens = frozenset(tokenize(normalize_issue_text(description)))
+        prop, unit_key = self._key(property_name), self._key(unit)
+
+        best: Optional[DuplicateMatch] = None
+        with self._lock:
+            for other_unit, tickets in self._scopes.get(prop, {}).items():
+                same_unit = other_unit == unit_key
+                limit = SAME_UNIT_MAX_DISTANCE if same_unit else SAME_PROPERTY_MAX_DISTANCE
+                for ticket_id, other in tickets.items():
+                    distance = (fingerprint ^ other).bit_count()
+                    if distance > limit or token_overlap(tokens, self._tokens.get(ticket_id, frozenset())) < MIN_TOKEN_OVERLAP:
+                        continue
+                    candidate = DuplicateMatch(ticket_id, distance, same_unit)
+                    if best is None or (candidate.same_unit, -candidate.distance) > (best.same_unit, -best.distance):
+                        best = candidate
+        return best
+
+    def __len__(self) -> int:
+        return len(self._locations)
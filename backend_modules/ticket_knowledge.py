@@ -0,0 +1,168 @@
+"""
+Resolved-ticket knowledge base
+TF-IDF index over resolved maintenance tickets for instant troubleshooting suggestions
+"""
+
+import os
+import re
+import math
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional
+from backend_modules.ticket_dedup import normalize_issue_text, tokenize
+
+# Matches scoring above this are offered to the prompt builder
+SUGGEST_MIN_SCORE = float(os.getenv("KB_SUGGEST_MIN_SCORE", "0.3"))
+# Matches scoring above this are answered directly without an LLM call
+DIRECT_ANSWER_MIN_SCORE = float(os.getenv("KB_DIRECT_ANSWER_MIN_SCORE", "0.75"))
+DIRECT_ANSWER_PREFIX = "This sounds like an issue we've seen before."
+
+# "It's still leaking", "didn't work" - the tenant already tried the suggested fix
+_FOLLOW_UP = re.compile(r"\b(?:still|again|didn'?t\s(?:work|help|fix)|doesn'?t\s(?:work|help)|no\sluck)\b", re.I)
+
+
+class ResolvedTicketIndex:
+    """
+    Incrementally built TF-IDF index
+
+    Term frequencies are kept as flat COO arrays (doc, term, weight) so adding a ticket
+    is an append, and scoring a query is a couple of vectorized NumPy passes over them.
+    """
+
+    def __init__(self):
+        self._vocab: Dict[str, int] = {}
+        self._doc_freq: List[int] = []
+        self._docs: List[Dict[str, Any]] = []
+        self._doc_index: Dict[str, int] = {}  # ticket_id -> row
+        self._active: List[bool] = []
+        self._property_rows: Dict[str, List[int]] = {}  # property_id -> rows, resolutions never cross properties
+
+        # Postings appended as Python lists, packed into arrays lazily
+        self._post_doc: List[int] = []
+        self._post_term: List[int] = []
+        self._post_tf: List[float] = []
+        self._arrays = None  # (doc, term, tf, idf, doc_norms, active) once packed
+        self._lock = threading.Lock()
+
+    def add(self, ticket: Dict[str, Any], property_id: Optional[str] = None) -> bool:
+        """
+        Index a resolved ticket under the property it belongs to
+        Returns False if it has no resolution notes to share or no property to scope them to
+        """
+        resolution = (ticket.get("resolution") or "").strip()
+        if not resolution or not property_id:
+            return False
+        counts: Dict[str, int] = {}
+        for token in tokenize(normalize_issue_text(ticket.get("issue_description", ""))):
+            counts[token] = counts.get(token, 0) + 1
+        if not counts:
+            return False
+
+        with self._lock:
+            if ticket["id"] in self._doc_index:
+                # Re-resolved ticket: keep the old row inactive and index the new text
+                self._active[self._doc_index[ticket["id"]]] = False
+                self._doc_freq_remove(self._doc_index[ticket["id"]])
+            row = len(self._docs)
+            self._docs.append({
+                "ticket_id": ticket["id"],
+                "issue": normalize_issue_text(ticket.get("issue_description", ""))[:300],
+                "resolution": resolution,
+                "property_name": ticket.get("property_name"),
+                "property_id": property_id,
+            })
+            self._doc_index[ticket["id"]] = row
+            self._property_rows.setdefault(property_id, []).append(row)
+            self._active.append(True)
+            for token, count in counts.items():
+                term = self._vocab.setdefault(token, len(self._vocab))
+                if term == len(self._doc_freq):
+                    self._doc_freq.append(0)
+                self._doc_freq[term] += 1
+                self._post_doc.append(row)
+                self._post_term.append(term)
+                self._post_tf.append(1.0 + math.log(count))
+            self._arrays = None
+        return True
+
+    def remove(self, ticket_id: str) -> None:
+        """Drop a ticket (e.g. it was reopened)"""
+        with self._lock:
+            row = self._doc_index.pop(ticket_id, None)
+            if row is None or not self._active[row]:
+                return
+            self._active[row] = False
+            self._doc_freq_remove(row)
+            self._arrays = None
+
+    def _doc_freq_remove(self, row: int) -> None:
+        for doc, term in zip(self._post_doc, self._post_term):
+            if doc == row:
+                self._doc_freq[term] -= 1
+
+    def _pack(self):
+        doc = np.asarray(self._post_doc, dtype=np.int64)
+        term = np.asarray(self._post_term, dtype=np.int64)
+        tf = np.asarray(self._post_tf, dtype=np.float64)
+        active = np.asarray(self._active, dtype=bool)
+        n_docs = max(int(active.sum()), 1)
+        df = np.asarray(self._doc_freq, dtype=np.float64)
+        idf = np.log((1.0 + n_docs) / (1.0 + df)) + 1.0
+        weights = tf * idf[term]
+        norms = np.sqrt(np.bincount(doc, weights=weights * weights, minlength=len(self._docs)))
+        self._arrays = (doc, term, weights, idf, norms, active)
+        return self._arrays
+
+    def search(self, text: str, property_id: Optional[str], top_k: int = 3,
+               min_score: float = SUGGEST_MIN_SCORE) -> List[Dict[str, Any]]:
+        """Return the most similar resolved tickets of one property (cosine similarity) with their resolutions"""
+        if not property_id:
+            return []
+        counts: Dict[str, int] = {}
+        for token in tokenize(normalize_issue_text(text)):
+            counts[token] = counts.get(token, 0) + 1
+
+        with self._lock:
+            rows = self._property_rows.get(property_id)
+            if not rows:
+                return []
+            query_terms = {self._vocab[t]: 1.0 + math.log(c) for t, c in counts.items() if t in self._vocab}
+            if not query_terms:
+                return []
+            doc, term, weights, idf, norms, active = self._arrays or self._pack()
+
+            query = np.zeros(len(idf))
+            for term_id, tf in query_terms.items():
+                query[term_id] = tf * idf[term_id]
+            query_norm = np.linalg.norm(query)
+
+            dots = np.bincount(doc, weights=weights * query[term], minlength=len(self._docs))
+            in_property = np.zeros(len(self._docs), dtype=bool)
+            in_property[rows] = True
+            with np.errstate(divide="ignore", invalid="ignore"):
+                scores = np.where(active & in_property & (norms > 0), dots / (norms * query_norm), 0.0)
+
+            top = np.argsort(scores)[::-1][:top_k]
+            return [
+                {**self._docs[row], "score": round(float(scores[row]), 3)}
+                for row in top
+                if scores[row] >= min_score
+            ]
+
+    def __len__(self) -> int:
+        return len(self._doc_index)
+
+
+def is_follow_up(text: str) -> bool:
+    """True for messages saying an earlier suggestion didn't fix the problem"""
+    return bool(_FOLLOW_UP.search(text or ""))
+
+
+def format_suggestions(matches: List[Dict[str, Any]]) -> str:
+    """Render knowledge base matches as a prompt section"""
+    if not matches:
+        return ""
+    lines = ["\n\nSIMILAR RESOLVED ISSUES (suggest these fixes before creating a ticket):"]
+    for match in matches:
+        lines.append(f"- Issue: {match['issue'][:150]} | Resolution: {match['resolution'][:200]}")
+    return "\n".join(lines) + "\n"
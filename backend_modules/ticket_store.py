@@ -0,0 +1,275 @@
+"""
+Durable maintenance ticket store
+SQLite-backed storage for maintenance tickets with indexed filtering and keyset pagination
+"""
+
+import os
+import json
+import base64
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+TICKET_DB_PATH = os.getenv("TICKET_DB_PATH", "esto_tickets.db")
+
+# Lower rank sorts first: critical tickets come before everything else
+PRIORITY_RANK = {"critical": 0, "high": 1, "normal": 2, "low": 3}
+VALID_STATUSES = ["open", "in_progress", "resolved", "closed"]
+OPEN_STATUSES = ["open", "in_progress"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id TEXT PRIMARY KEY,
+    tenant_phone TEXT NOT NULL,
+    tenant_name TEXT,
+    property_name TEXT,
+    priority TEXT NOT NULL,
+    priority_rank INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_order ON tickets (priority_rank, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_tickets_status_order ON tickets (status, priority_rank, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_tickets_property_order ON tickets (property_name, priority_rank, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_tickets_phone ON tickets (tenant_phone);
+CREATE INDEX IF NOT EXISTS idx_tickets_tenant_name ON tickets (tenant_name);
+CREATE INDEX IF NOT EXISTS idx_tickets_created ON tickets (created_at);
+"""
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Encode the sort key of a ticket as an opaque pagination cursor"""
+    key = [PRIORITY_RANK.get(row.get("priority"), 2), row.get("created_at"), row.get("id")]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[int, str, str]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        rank, created_at, ticket_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return int(rank), str(created_at), str(ticket_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class TicketStore:
+    """SQLite ticket store; each ticket is kept as JSON with its filter columns indexed"""
+
+    def __init__(self, db_path: str = TICKET_DB_PATH):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One shared connection guarded by a lock - sync endpoints run in the threadpool
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        # Write counters (overall and per tenant phone) so cached views of tickets know when they're stale
+        self._version = 0
+        self._phone_versions: Dict[str, int] = {}
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _columns(ticket: Dict[str, Any]) -> Tuple:
+        priority = ticket.get("priority") or "normal"
+        return (
+            ticket["id"],
+            ticket.get("tenant_phone", ""),
+            ticket.get("tenant_name"),
+            ticket.get("property_name"),
+            priority,
+            PRIORITY_RANK.get(priority, 2),
+            ticket.get("status") or "open",
+            ticket["created_at"],
+            ticket.get("updated_at") or ticket["created_at"],
+            json.dumps(ticket),
+        )
+
+    def _bump_version(self, ticket: Dict[str, Any]) -> None:
+        self._version += 1
+        phone = ticket.get("tenant_phone", "")
+        self._phone_versions[phone] = self._phone_versions.get(phone, 0) + 1
+
+    def version(self, tenant_phone: Optional[str] = None) -> int:
+        """Write counter for one tenant's tickets, or for the whole store when no phone is given"""
+        if tenant_phone is None:
+            return self._version
+        return self._phone_versions.get(tenant_phone, 0)
+
+    def save(self, ticket: Dict[str, Any]) -> None:
+        """Insert or replace a ticket"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tickets (id, tenant_phone, tenant_name, property_name, priority, "
+                "priority_rank, status, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._columns(ticket),
+            )
+            self._bump_version(ticket)
+
+    def get(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        """Get a single ticket by ID"""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM tickets WHERE id = ?", (ticket_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def update(self, ticket_id: str, fields: Dict[str, Any], updated_at: str) -> Optional[Dict[str, Any]]:
+        """
+        Apply field changes to a ticket inside a single transaction
+        Returns the updated ticket, or None if it does not exist
+        """
+        return self._modify(ticket_id, lambda ticket: ticket.update(fields) or True, updated_at)
+
+    def merge_report(self, ticket_id: str, report: Dict[str, Any], media_urls: Optional[List[str]],
+                     updated_at: str, statuses: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Append a duplicate report to a ticket (bumping report_count and adding new media) in one transaction,
+        so concurrent reports can't overwrite each other's append
+        Returns the updated ticket, or None if it doesn't exist or its status isn't in `statuses`
+        """
+        def merge(ticket: Dict[str, Any]) -> bool:
+            if statuses and ticket.get("status") not in statuses:
+                return False
+            ticket["duplicate_reports"] = ticket.get("duplicate_reports", []) + [report]
+            ticket["report_count"] = ticket.get("report_count", 1) + 1
+            existing_media = ticket.get("media_urls", [])
+            ticket["media_urls"] = existing_media + [u for u in (media_urls or []) if u not in existing_media]
+            return True
+
+        return self._modify(ticket_id, merge, updated_at)
+
+    def raise_priority(self, ticket_id: str, priority: str, updated_at: str) -> Optional[Dict[str, Any]]:
+        """
+        Raise (never lower) a ticket's priority in one transaction
+        Returns the updated ticket, or None if it doesn't exist or was already at least that urgent
+        """
+        def raise_(ticket: Dict[str, Any]) -> bool:
+            if PRIORITY_RANK.get(ticket.get("priority"), 2) <= PRIORITY_RANK[priority]:
+                return False
+            ticket["priority"] = priority
+            return True
+
+        return self._modify(ticket_id, raise_, updated_at)
+
+    def _modify(self, ticket_id: str, change, updated_at: str) -> Optional[Dict[str, Any]]:
+        """Read, change and write back a ticket under the lock and an immediate transaction; change() returns False to abort"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM tickets WHERE id = ?", (ticket_id,)).fetchone()
+                ticket = json.loads(row["data"]) if row else None
+                if ticket is None or change(ticket) is False:
+                    self._conn.execute("ROLLBACK")
+                    return None
+                ticket["updated_at"] = updated_at
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO tickets (id, tenant_phone, tenant_name, property_name, priority, "
+                    "priority_rank, status, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._columns(ticket),
+                )
+                self._conn.execute("COMMIT")
+                self._bump_version(ticket)
+                return ticket
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update_status(self, ticket_id: str, status: str, updated_at: str) -> Optional[Dict[str, Any]]:
+        """Transactionally change a ticket's status"""
+        if status not in VALID_STATUSES:
+            raise ValueError(f"Invalid status. Must be one of: {VALID_STATUSES}")
+        return self.update(ticket_id, {"status": status}, updated_at)
+
+    @staticmethod
+    def _filters(
+        status: Optional[List[str]] = None,
+        priority: Optional[List[str]] = None,
+        property_name: Optional[str] = None,
+        tenant_phone: Optional[str] = None,
+        tenant_name: Optional[str] = None,
+        created_after: Optional[str] = None,
+        created_before: Optional[str] = None,
+        text: Optional[str] = None,
+    ) -> Tuple[List[str], List[Any]]:
+        """WHERE clauses and parameters shared by query() and count()"""
+        clauses = []
+        params: List[Any] = []
+
+        if status:
+            clauses.append(f"status IN ({','.join('?' * len(status))})")
+            params.extend(status)
+        if priority:
+            clauses.append(f"priority IN ({','.join('?' * len(priority))})")
+            params.extend(priority)
+        if property_name:
+            clauses.append("property_name = ?")
+            params.append(property_name)
+        if tenant_phone and tenant_name:
+            clauses.append("(tenant_phone = ? OR tenant_name = ?)")
+            params.extend([tenant_phone, tenant_name])
+        elif tenant_phone:
+            clauses.append("tenant_phone = ?")
+            params.append(tenant_phone)
+        elif tenant_name:
+            clauses.append("tenant_name = ?")
+            params.append(tenant_name)
+        if created_after:
+            clauses.append("created_at >= ?")
+            params.append(created_after)
+        if created_before:
+            clauses.append("created_at < ?")
+            params.append(created_before)
+        for word in (text or "").split():
+            escaped = word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append("json_extract(data, '$.issue_description') LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        return clauses, params
+
+    def query(self, cursor: Optional[str] = None, limit: int = 100, **filters: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Filtered ticket query ordered by priority, then age (oldest first)
+        Filters: status, priority, property_name, tenant_phone, tenant_name, created_after, created_before,
+        and text (issue description contains every word, case-insensitive)
+        Uses keyset pagination - pass the returned cursor to fetch the next page
+        Returns (tickets, next_cursor); next_cursor is None on the last page
+        """
+        clauses, params = self._filters(**filters)
+        if cursor:
+            clauses.append("(priority_rank, created_at, id) > (?, ?, ?)")
+            params.extend(decode_cursor(cursor))
+
+        sql = "SELECT data FROM tickets"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        # Fetch one extra row to know whether another page exists
+        sql += " ORDER BY priority_rank, created_at, id LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        tickets = [json.loads(row["data"]) for row in rows[:limit]]
+        next_cursor = encode_cursor(tickets[-1]) if len(rows) > limit and tickets else None
+        return tickets, next_cursor
+
+    def iter_tickets(self, page_size: int = 500, **filters: Any):
+        """Iterate over all tickets matching the query() filters one page at a time"""
+        cursor = None
+        while True:
+            tickets, cursor = self.query(cursor=cursor, limit=page_size, **filters)
+            yield from tickets
+            if not cursor:
+                return
+
+    def count(self, **filters: Any) -> int:
+        """Count tickets matching the same filters as query()"""
+        clauses, params = self._filters(**filters)
+        sql = "SELECT COUNT(*) FROM tickets"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
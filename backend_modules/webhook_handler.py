@@ -7,8 +7,8 @@ import asyncio
 import httpx
 from typing import Dict, Any, Optional
 from datetime import datetime
-from backend_modules.inbox_monitor import process_incoming_email_from_thread, extract_contact_info
-from backend_modules.agentmail_service import AgentmailClient
+from backend_modules.inbox_monitor import process_incoming_email_from_thread, extract_contact_info, message_ledger
+from backend_modules.agentmail_service import get_agentmail_client
 
 async def handle_agentmail_webhook(webhook_payload: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -49,74 +49,62 @@ async def handle_agentmail_webhook(webhook_payload: Dict[str, Any]) -> Dict[str,
         # For now, use a default user_id
         user_id = os.getenv("DEFAULT_USER_ID", "default_user")
         
-        # Get the most recent thread and then fetch full thread details
-        # This ensures we have complete thread data with all messages
-        agentmail_client = AgentmailClient()
+        # Redeliveries of a message we've already handled need no API calls at all
+        if message_id and message_ledger.is_processed(message_id):
+            print(f"📧 Message {message_id} already processed, skipping")
+            return {"success": True, "action": "already_processed"}
+        
+        agentmail_client = get_agentmail_client()
         
         print(f"📬 Received webhook event {event_id} for message {message_id}")
         
-        # First, get list of threads to find the most recent one
         if not inbox_id:
             inbox_id = os.getenv("AGENTMAIL_INBOX_ID", "")
         
+        thread_id = webhook_thread_id
+        sender_email = email_from[0] if email_from else ""
+        # A new message makes any cached copy of the thread stale and bumps the inbox summary
+        agentmail_client.note_message(
+            thread_id, message_id, sender=sender_email, subject=email_subject,
+            timestamp=message_data.get("timestamp") or message_data.get("created_at") or datetime.utcnow().isoformat() + "Z"
+        )
         full_thread = None
         latest_message = None
         
-        if inbox_id:
-            threads = await agentmail_client.list_threads(inbox_id=inbox_id)
-            
-            if threads and len(threads) > 0:
-                # Get the most recent thread (first in list should be most recent)
-                most_recent_thread = threads[0]
-                thread_id = most_recent_thread.get("thread_id") or most_recent_thread.get("id")
+        # Fast path: the payload names the thread, and usually carries the whole message
+        payload_complete = bool(thread_id and message_id and email_from and (email_body_text or email_body_html))
+        if payload_complete:
+            print(f"   ⚡ Using webhook payload for thread {thread_id} (no API calls)")
+        elif thread_id:
+            # Fields are missing - fetch just this thread, never the whole inbox
+            full_thread = await agentmail_client.get_thread(thread_id)
+            messages = (full_thread or {}).get("messages", [])
+            if messages:
+                latest_message = next(
+                    (msg for msg in messages if (msg.get("message_id") or msg.get("id")) == message_id),
+                    messages[-1]
+                ) if message_id else messages[-1]
+                message_id = message_id or latest_message.get("message_id") or latest_message.get("id")
                 
-                print(f"   📧 Found {len(threads)} thread(s), using most recent: {thread_id}")
+                # Extract complete data from thread and message
+                email_subject = full_thread.get("subject", email_subject)
+                email_body_text = latest_message.get("text", email_body_text)
+                email_body_html = latest_message.get("html", email_body_html)
+                email_from_field = latest_message.get("from", "")
+                if isinstance(email_from_field, str) and email_from_field:
+                    sender_email = email_from_field
+                    email_from = [email_from_field]
                 
-                # Get full thread details with all messages
-                full_thread = await agentmail_client.get_thread(thread_id)
+                attachments = latest_message.get("attachments", attachments)
+                labels = latest_message.get("labels", labels) or full_thread.get("labels", labels)
                 
-                if full_thread and full_thread.get("messages"):
-                    # Use thread data instead of webhook payload data
-                    messages = full_thread.get("messages", [])
-                    # Get the latest message (or find by message_id if we have it)
-                    if message_id:
-                        latest_message = next((msg for msg in messages if (msg.get("message_id") or msg.get("id")) == message_id), None)
-                        if not latest_message:
-                            latest_message = messages[-1]  # Fallback to last message
-                    else:
-                        latest_message = messages[-1]  # Most recent message
-                    
-                    # Extract complete data from thread and message
-                    thread_id = full_thread.get("thread_id") or full_thread.get("id") or thread_id
-                    email_subject = full_thread.get("subject", email_subject)
-                    
-                    # Use message data from thread (more complete)
-                    email_body_text = latest_message.get("text", email_body_text)
-                    email_body_html = latest_message.get("html", email_body_html)
-                    email_from_field = latest_message.get("from", "")
-                    if isinstance(email_from_field, str):
-                        sender_email = email_from_field
-                        email_from = [email_from_field]
-                    else:
-                        sender_email = email_from[0] if email_from else ""
-                    
-                    attachments = latest_message.get("attachments", attachments)
-                    labels = latest_message.get("labels", labels) or full_thread.get("labels", labels)
-                    
-                    print(f"   ✅ Loaded full thread with {len(messages)} message(s)")
-                    print(f"   Thread: {thread_id}, From: {sender_email}, Subject: {email_subject}")
-                else:
-                    print(f"   ⚠️ Could not get full thread details, using webhook data")
-                    sender_email = email_from[0] if email_from else ""
-                    thread_id = webhook_thread_id
+                print(f"   ✅ Loaded thread {thread_id} with {len(messages)} message(s)")
+                print(f"   From: {sender_email}, Subject: {email_subject}")
             else:
-                print(f"   ⚠️ No threads found, using webhook data")
-                sender_email = email_from[0] if email_from else ""
-                thread_id = webhook_thread_id
+                print(f"   ⚠️ Could not get thread {thread_id}, using webhook data")
+                full_thread = None
         else:
-            print(f"   ⚠️ No inbox_id available, using webhook data")
-            sender_email = email_from[0] if email_from else ""
-            thread_id = webhook_thread_id
+            print(f"   ⚠️ Webhook has no thread_id, using webhook data")
         
         # Skip if already processed (check labels)
         if labels and ("processed" in labels or "replied" in labels):
@@ -153,10 +141,9 @@ Thank you for your consideration!
 Best regards,
 John Smith"""
             email_body_html = email_body_text
-            email_body = email_body_text
         
         # Use text body, fallback to HTML if text is empty
-        email_body = email_body or email_body_text or email_body_html or ""
+        email_body = email_body_text or email_body_html or ""
         
         # Build message object in format expected by process_incoming_email_from_thread
         message_obj = {
@@ -282,7 +269,7 @@ John Smith"""
         )
         
         # Mark message as processed by updating labels (optional - can do this later via API)
-        # For now, we rely on the processed_email_ids set in inbox_monitor
+        # For now, we rely on the message ledger in inbox_monitor
         
         return {
             "success": True,
@@ -1,13 +1,30 @@
 # minimal_backend.py
 # Minimal backend with no external dependencies that might cause issues
 
-import os, json, httpx, uuid, hashlib
+import os, json, httpx, uuid, hashlib, asyncio, re, base64
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
+from urllib.parse import urlparse
 from fastapi import FastAPI, HTTPException, Body, Request, BackgroundTasks
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from backend_modules.ticket_store import TicketStore, VALID_STATUSES, OPEN_STATUSES, PRIORITY_RANK
+from backend_modules.ticket_dedup import DuplicateTicketIndex
+from backend_modules.ticket_knowledge import ResolvedTicketIndex, format_suggestions, is_follow_up, DIRECT_ANSWER_MIN_SCORE, DIRECT_ANSWER_PREFIX
+from backend_modules.priority_classifier import PriorityClassifier
+from backend_modules.context_cache import ContextSnapshotCache
+from backend_modules.tenant_directory import TenantDirectory, normalize_phone, pms_property_id, is_pms_property
+from backend_modules.property_sync import apply_properties, apply_property, diff_manifest, SyncReport
+from backend_modules.event_log import EventLog
+from backend_modules.pms_sync import PMSSyncEngine, HttpPMSAdapter, PMS_BASE_URL
+from backend_modules.pms_index import PMSPhoneIndex
+from backend_modules.lease_scheduler import LeaseExpiryIndex, RenewalScheduler
+from backend_modules.sms_broadcast import (
+    BroadcastJob, BroadcastPipeline, TemplateError, validate_template, render_template, BROADCAST_FROM_NUMBERS
+)
+from backend_modules.job_queue import AsyncJobQueue
 
 # ------------------ Environment & Config ------------------
 load_dotenv()
@@ -19,12 +36,31 @@ if not API_KEY:
 # Models - Using Gemini
 TEXT_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
 VISION_MODEL = os.getenv("LLM_VISION_MODEL", "gemini-2.0-flash")
+# Max photo analyses in flight at once, so bursts of MMS don't trip the gateway's rate limits
+VISION_MAX_CONCURRENCY = int(os.getenv("LLM_VISION_MAX_CONCURRENCY", "2"))
+# Refresh a phone's rolling conversation summary after this many new messages
+SUMMARY_EVERY_N_MESSAGES = int(os.getenv("CONVERSATION_SUMMARY_EVERY", "6"))
 GEMINI_URL = os.getenv("LLM_URL", "https://generativelanguage.googleapis.com/v1beta/models")
 
 # Twilio
 TWILIO_FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER", "+15550000000")
 USE_FAKE_TWILIO = os.getenv("USE_FAKE_TWILIO", "1") == "1"
 
+# PMS sync (the base URL and credentials are read by backend_modules.pms_sync)
+PMS_SYNC_INTERVAL_HOURS = float(os.getenv("PMS_SYNC_INTERVAL_HOURS", "24"))
+# Lease renewal reminders (offsets are read by backend_modules.lease_scheduler; 0 disables the check)
+LEASE_RENEWAL_CHECK_HOURS = float(os.getenv("LEASE_RENEWAL_CHECK_HOURS", "24"))
+RENEWAL_SEND_CONCURRENCY = int(os.getenv("RENEWAL_SEND_CONCURRENCY", "5"))
+# Agentmail webhooks are processed by this many workers on the app loop; deliveries arriving while
+# the queue is full get a 503 so Agentmail retries them later
+AGENTMAIL_WEBHOOK_WORKERS = int(os.getenv("AGENTMAIL_WEBHOOK_WORKERS", "4"))
+AGENTMAIL_WEBHOOK_QUEUE_SIZE = int(os.getenv("AGENTMAIL_WEBHOOK_QUEUE_SIZE", "1000"))
+# How long shutdown waits for queued webhooks to finish
+WEBHOOK_DRAIN_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT_SECONDS", "25"))
+
+# Property manager number that receives critical-issue alerts
+PM_ALERT_PHONE = os.getenv("PM_ALERT_PHONE", "")
+
 # ------------------ Pydantic Models ------------------
 class Context(BaseModel):
     tenant_name: str
@@ -34,6 +70,8 @@ class Context(BaseModel):
     portal_url: Optional[str] = None
     property_name: Optional[str] = None
     tenant_phone: Optional[str] = None
+    rent_amount: Optional[float] = None
+    lease_end: Optional[str] = None
 
 class PmChatRequest(BaseModel):
     message: str
@@ -66,7 +104,16 @@ class MaintenanceTicket(BaseModel):
     priority: str  # "low", "normal", "high", "critical"
     status: str  # "open", "in_progress", "resolved", "closed"
     created_at: str
+    updated_at: Optional[str] = None
     media_urls: List[str] = []
+    resolution: Optional[str] = None  # how the issue was fixed, feeds the troubleshooting knowledge base
+    category: Optional[str] = None  # filled in by background LLM enrichment
+    ai_summary: Optional[str] = None
+    duplicate_of: Optional[str] = None  # related open ticket for the same building issue
+    report_count: int = 1  # number of tenant reports merged into this ticket
+    duplicate_reports: List[Dict[str, Any]] = []
+    damage_assessment: Optional[Dict[str, Any]] = None  # structured photo review from the vision model
+    property_id: Optional[str] = None  # tenant directory property at creation, scopes the knowledge base
 
 class SmsMessage(BaseModel):
     sid: str
@@ -85,6 +132,13 @@ class SendSmsRequest(BaseModel):
     property_id: Optional[str] = None
     propertyId: Optional[str] = None  # Support both formats
 
+class BroadcastRequest(BaseModel):
+    template: str  # e.g. "Hi {tenant_name}, water to {property_name} is off 9-11am tomorrow"
+    property_ids: Optional[List[str]] = None
+    property_name: Optional[str] = None  # every unit of a building
+    phones: Optional[List[str]] = None
+    dry_run: bool = False
+
 class PropertySettings(BaseModel):
     ai_enabled: bool = True
     auto_reply: bool = True
@@ -176,40 +230,203 @@ response_cache = {}
 
 # ------------------ Storage ------------------
 sms_messages = {}  # phone -> list of messages
-property_settings = {}  # property_id -> settings including ai_enabled
-phone_to_property = {}  # phone -> property_id mapping
-maintenance_tickets = {}  # ticket_id -> MaintenanceTicket
+conversation_summaries = {}  # phone -> rolling summary of the whole conversation
+tenant_directory = TenantDirectory()  # E.164 phone -> property -> tenant context and SMS settings
+context_cache = ContextSnapshotCache()  # phone -> pre-rendered tenant prompt context
+pms_index = PMSPhoneIndex()  # E.164 phone -> synced PMS tenant and current lease
+ticket_store = TicketStore()  # durable ticket_id -> MaintenanceTicket store (SQLite)
+duplicate_index = DuplicateTicketIndex()  # SimHash fingerprints of open tickets
+knowledge_base = ResolvedTicketIndex()  # TF-IDF index of resolved tickets and their fixes
+priority_classifier = PriorityClassifier()  # compiled keyword patterns, per-property overrides
+background_jobs = set()  # strong refs so fire-and-forget tasks aren't garbage collected
+vision_semaphore = asyncio.Semaphore(VISION_MAX_CONCURRENCY)
+photo_assessments = {}  # phone -> photo assessment waiting for the tenant's next ticket
+summary_semaphore = asyncio.Semaphore(1)  # summaries are low priority - never more than one LLM call at a time
+
+# Rebuild the in-memory ticket indexes from tickets that survived the restart
+for _ticket in ticket_store.iter_tickets(status=OPEN_STATUSES):
+    duplicate_index.add(_ticket["id"], _ticket.get("property_name"), _ticket.get("unit"), _ticket.get("issue_description", ""))
+for _ticket in ticket_store.iter_tickets(status=["resolved", "closed"]):
+    # The tenant directory is still empty here, so only the property stored on the ticket can scope it
+    knowledge_base.add(_ticket, _ticket.get("property_id"))
+
+def spawn_background_job(coro) -> asyncio.Task:
+    """Run a coroutine after the response without blocking the caller"""
+    task = asyncio.create_task(coro)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
 
 def get_cache_key(messages: List[Dict[str, Any]]) -> str:
     """Generate cache key from messages"""
     content = json.dumps(messages, sort_keys=True)
     return hashlib.md5(content.encode()).hexdigest()
 
-def get_property_settings_by_phone(phone: str) -> PropertySettings:
-    """Get property settings by tenant phone number"""
-    property_id = phone_to_property.get(phone)
-    if property_id and property_id in property_settings:
-        return property_settings[property_id]
-    # Return default settings if no property found
-    return PropertySettings()
+def get_tenant_tickets(phone: str, tenant_name: str = None) -> List[MaintenanceTicket]:
+    """Get all maintenance tickets for a tenant (by phone, or by name as a fallback)"""
+    tickets, _ = ticket_store.query(tenant_phone=phone, tenant_name=tenant_name, limit=500)
+    return [MaintenanceTicket(**t) for t in tickets]
+
+def get_tenant_context_snapshot(phone: str, context: Context, tenant_name: str = None) -> Dict[str, Any]:
+    """
+    Structured tenant context plus the rendered tenant system prompt, cached per phone
+    The cache entry is reused until the request context, tenant directory, the phone's tickets or conversation
+    summary change; the last few raw messages change every turn, so callers append them with format_recent_history.
+    Tickets matched by `tenant_name` from other phones are added after the lookup, so callers that pass a name
+    and callers that don't share one entry instead of evicting each other's.
+    """
+    summary_state = conversation_summaries.get(phone) or {}
+    version = (
+        tuple(context.model_dump().values()),
+        tenant_directory.version,
+        ticket_store.version(phone),
+        summary_state.get("updated_at"),
+    )
+    snapshot = context_cache.get(phone, version)
+    if snapshot is None:
+        snapshot = _build_tenant_context_snapshot(phone, context, summary_state)
+        context_cache.put(phone, version, snapshot)
+    return _with_name_matched_tickets(snapshot, phone, tenant_name) if tenant_name else snapshot
+
+def _with_name_matched_tickets(snapshot: Dict[str, Any], phone: str, tenant_name: str) -> Dict[str, Any]:
+    """A copy of the snapshot that also lists open tickets filed under the tenant's name from other phones"""
+    others, _ = ticket_store.query(status=OPEN_STATUSES, tenant_name=tenant_name, limit=PM_TOOL_MAX_RESULTS)
+    others = [MaintenanceTicket(**t) for t in others if t.get("tenant_phone") != phone]
+    if not others:
+        return snapshot
+    lines = "".join(f"- #{t.id} ({t.priority}): {t.issue_description} - Status: {t.status}\n" for t in others)
+    return {
+        **snapshot,
+        "tickets": snapshot["tickets"] + others,
+        "open_tickets": snapshot["open_tickets"] + others,
+        "system_prompt": snapshot["system_prompt"] + f"\nOther open tickets under the tenant's name:\n{lines}",
+    }
+
+def _build_tenant_context_snapshot(phone: str, context: Context, summary_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Render the cacheable part of a tenant's context: request context, summary and the phone's tickets"""
+    ctx = context.model_dump()
+    tenant_name_ctx = ctx.get('tenant_name') or 'N/A'
+    unit = ctx.get('unit') or 'N/A'
+    property_name = ctx.get('property_name') or 'N/A'
+    
+    context_parts = [
+        f"Property: {property_name}",
+        f"Unit: {unit}",
+        f"Address: {ctx.get('address') or 'N/A'}",
+        f"Tenant: {tenant_name_ctx}"
+    ]
+    if ctx.get('hotline'):
+        context_parts.append(f"Emergency Hotline: {ctx['hotline']}")
+    if ctx.get('portal_url'):
+        context_parts.append(f"Portal: {ctx['portal_url']}")
+    if ctx.get('rent_amount'):
+        context_parts.append(f"Monthly Rent: ${ctx['rent_amount']:,.2f}")
+    if ctx.get('lease_end'):
+        context_parts.append(f"Lease Ends: {ctx['lease_end']}")
+    context_summary = " | ".join(context_parts)
+    
+    # Long-term memory beyond the last few raw messages
+    summary = summary_state.get("summary")
+    summary_context = f"\n\nConversation summary so far:\n{summary}\n" if summary else ""
+    
+    tickets = get_tenant_tickets(phone)
+    open_tickets = [t for t in tickets if t.status in OPEN_STATUSES]
+    tickets_context = ""
+    if open_tickets:
+        tickets_context = "\n\nExisting maintenance tickets:\n"
+        for ticket in open_tickets:
+            tickets_context += f"- #{ticket.id} ({ticket.priority}): {ticket.issue_description} - Status: {ticket.status}\n"
+    
+    system_prompt = TENANT_SMS_SYSTEM + f"\n\nTENANT CONTEXT:\n{context_summary}{summary_context}{tickets_context}\n\n"
+    if tenant_name_ctx != 'N/A':
+        system_prompt += f"IMPORTANT: Address the tenant as '{tenant_name_ctx}' and reference their unit '{unit}' at '{property_name}' when appropriate.\n"
+    
+    return {
+        "tenant_name": tenant_name_ctx,
+        "unit": unit,
+        "property_name": property_name,
+        "property_id": tenant_directory.property_id_for(phone),
+        "tickets": tickets,
+        "open_tickets": open_tickets,
+        "system_prompt": system_prompt,
+    }
+
+def format_recent_history(phone: str, limit: int = 3) -> str:
+    """Prompt section with the last few messages of a conversation"""
+    recent_messages = sms_messages.get(phone, [])[-limit:]
+    if not recent_messages:
+        return ""
+    lines = ["\nRecent conversation history:"]
+    for msg in recent_messages:
+        direction = "You" if msg.get('direction') == 'inbound' else "Esto"
+        lines.append(f"{direction}: {msg.get('body') or ''}")
+    return "\n".join(lines) + "\n"
+
+def sent_kb_answer_recently(phone: str, limit: int = 6) -> bool:
+    """Whether one of the last few messages already gave this tenant a knowledge base fix"""
+    for msg in sms_messages.get(phone, [])[-limit:]:
+        if DIRECT_ANSWER_PREFIX in (msg.get('body') or '') or DIRECT_ANSWER_PREFIX in (msg.get('ai_reply') or ''):
+            return True
+    return False
+
+def set_ticket_status(ticket_id: str, status: str, resolution: str = None) -> Optional[MaintenanceTicket]:
+    """Transactionally update a ticket's status; returns None if the ticket doesn't exist"""
+    if resolution:
+        fields = {"status": status, "resolution": resolution}
+        updated = ticket_store.update(ticket_id, fields, updated_at=datetime.now().isoformat())
+    else:
+        updated = ticket_store.update_status(ticket_id, status, updated_at=datetime.now().isoformat())
+    if updated is None:
+        return None
+    if status in OPEN_STATUSES:
+        duplicate_index.add(ticket_id, updated.get("property_name"), updated.get("unit"), updated.get("issue_description", ""))
+        knowledge_base.remove(ticket_id)
+    else:
+        duplicate_index.remove(ticket_id)
+        knowledge_base.add(updated, updated.get("property_id") or tenant_directory.property_id_for(updated.get("tenant_phone")))
+    print(f"[TICKET] Updated ticket {ticket_id} status to {status}")
+    return MaintenanceTicket(**updated)
+
+def apply_damage_assessment(ticket_id: str, assessment: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Attach a photo assessment to a ticket, raising (never lowering) its priority if the photos warrant it"""
+    ticket = ticket_store.get(ticket_id)
+    if not ticket:
+        return None
+    fields = {"damage_assessment": assessment}
+    suggested = assessment.get("recommended_priority")
+    if suggested in PRIORITY_RANK and PRIORITY_RANK[suggested] < PRIORITY_RANK.get(ticket.get("priority"), 2):
+        fields["priority"] = suggested
+        print(f"[VISION] Raised ticket {ticket_id} priority {ticket.get('priority')} -> {suggested}")
+    return ticket_store.update(ticket_id, fields, updated_at=datetime.now().isoformat())
 
 def create_maintenance_ticket(tenant_phone: str, tenant_name: str, unit: str, 
                             property_name: str, issue_description: str, 
-                            media_urls: List[str] = None) -> str:
-    """Create a new maintenance ticket"""
-    ticket_id = f"MT{uuid.uuid4().hex[:8].upper()}"
+                            media_urls: List[str] = None) -> Tuple[str, bool]:
+    """
+    Create a new maintenance ticket
+    If the same unit already has an open ticket for this issue, the report is merged into it
+    and the existing ticket ID is returned instead
+    Returns (ticket_id, merged)
+    """
+    duplicate = duplicate_index.find(property_name, unit, issue_description)
+    if duplicate and duplicate.same_unit:
+        merged = ticket_store.merge_report(duplicate.ticket_id, {
+            "tenant_phone": tenant_phone,
+            "tenant_name": tenant_name,
+            "issue_description": issue_description,
+            "reported_at": datetime.now().isoformat()
+        }, media_urls, updated_at=datetime.now().isoformat(), statuses=OPEN_STATUSES)
+        if merged:
+            print(f"[TICKET] Merged duplicate report into {duplicate.ticket_id} (distance {duplicate.distance})")
+            if tenant_phone in photo_assessments:
+                apply_damage_assessment(duplicate.ticket_id, photo_assessments.pop(tenant_phone))
+            return duplicate.ticket_id, True
     
-    # Determine priority based on keywords
-    critical_keywords = ["fire", "flood", "gas leak", "electrical", "emergency", "urgent", "overflowing", "leaking water"]
-    high_keywords = ["broken", "not working", "damaged", "repair", "fix"]
+    ticket_id = f"MT{uuid.uuid4().hex[:8].upper()}"
     
-    issue_lower = issue_description.lower()
-    if any(keyword in issue_lower for keyword in critical_keywords):
-        priority = "critical"
-    elif any(keyword in issue_lower for keyword in high_keywords):
-        priority = "high"
-    else:
-        priority = "normal"
+    # Determine priority based on keywords (property-specific keyword sets apply when the phone is mapped)
+    property_id = tenant_directory.property_id_for(tenant_phone)
+    priority, _ = priority_classifier.classify(issue_description, property_id)
     
     ticket = MaintenanceTicket(
         id=ticket_id,
@@ -221,18 +438,36 @@ def create_maintenance_ticket(tenant_phone: str, tenant_name: str, unit: str,
         priority=priority,
         status="open",
         created_at=datetime.now().isoformat(),
-        media_urls=media_urls or []
+        media_urls=media_urls or [],
+        property_id=property_id,
+        # Another unit in the same property reported this - flag it so only one vendor is dispatched
+        duplicate_of=duplicate.ticket_id if duplicate else None
     )
     
-    maintenance_tickets[ticket_id] = ticket
+    ticket_store.save(ticket.model_dump())
+    duplicate_index.add(ticket_id, property_name, unit, issue_description)
     print(f"[TICKET] Created maintenance ticket {ticket_id} for {tenant_name} ({unit}) - Priority: {priority}")
-    print(f"[DEBUG] Total tickets in memory: {len(maintenance_tickets)}")
-    print(f"[DEBUG] Ticket stored: {ticket_id} in maintenance_tickets dict")
-    return ticket_id
+    if tenant_phone in photo_assessments:
+        # Photos were reviewed before the ticket existed
+        apply_damage_assessment(ticket_id, photo_assessments.pop(tenant_phone))
+    if duplicate:
+        print(f"[TICKET] Ticket {ticket_id} flagged as possible duplicate of {duplicate.ticket_id} (distance {duplicate.distance})")
+    return ticket_id, False
 
 def log_sms(phone: str, direction: str, body: str, to_number: str, from_number: str, 
            message_sid: str, ai_reply: str = None, media_urls: List[str] = None):
     """Log SMS message to storage"""
+    store_sms(phone, direction, body, to_number, from_number, message_sid, ai_reply, media_urls)
+    print(f"[LOG] Logged SMS: {direction} from {from_number} to {to_number}")
+
+def log_sms_batch(rows: List[tuple]):
+    """Log many outbound messages at once: rows of (phone, body, from_number, message_sid)"""
+    for phone, body, from_number, message_sid in rows:
+        store_sms(phone, "outbound", body, phone, from_number, message_sid)
+    print(f"[LOG] Logged {len(rows)} outbound SMS")
+
+def store_sms(phone: str, direction: str, body: str, to_number: str, from_number: str,
+              message_sid: str, ai_reply: str = None, media_urls: List[str] = None):
     if phone not in sms_messages:
         sms_messages[phone] = []
     
@@ -254,29 +489,38 @@ def log_sms(phone: str, direction: str, body: str, to_number: str, from_number:
     if len(sms_messages[phone]) > 100:
         sms_messages[phone] = sms_messages[phone][-100:]
     
-    print(f"[LOG] Logged SMS: {direction} from {from_number} to {to_number}")
+    summary = conversation_summaries.setdefault(phone, {
+        "summary": None, "updated_at": None, "message_count": 0, "summarized_count": 0, "refreshing": False
+    })
+    summary["message_count"] += 1
+    schedule_conversation_summary(phone)
+
+twilio_client = None  # created on first send and reused
 
-async def send_sms_via_twilio(to_number: str, message: str) -> str:
+async def send_sms_via_twilio(to_number: str, message: str, from_number: str = None) -> str:
     """Send SMS via Twilio to tenant"""
+    global twilio_client
     if USE_FAKE_TWILIO:
         print(f"[SEND] [FAKE] SMS to tenant {to_number}: {message}")
         return f"SM{uuid.uuid4().hex[:30]}"
     
     try:
         from twilio.rest import Client
-        from twilio.base.exceptions import TwilioException
         
-        account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-        auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-        
-        if not account_sid or not auth_token:
-            print("[ERROR] Twilio credentials not configured")
-            return None
+        if twilio_client is None:
+            account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+            auth_token = os.getenv("TWILIO_AUTH_TOKEN")
             
-        client = Client(account_sid, auth_token)
-        message_obj = client.messages.create(
+            if not account_sid or not auth_token:
+                print("[ERROR] Twilio credentials not configured")
+                return None
+            twilio_client = Client(account_sid, auth_token)
+        
+        # The Twilio SDK is synchronous; run it off the event loop so sends can overlap
+        message_obj = await asyncio.to_thread(
+            twilio_client.messages.create,
             body=message,
-            from_=TWILIO_FROM_NUMBER,
+            from_=from_number or TWILIO_FROM_NUMBER,
             to=to_number
         )
         return message_obj.sid
@@ -305,6 +549,8 @@ app.add_middleware(
 )
 
 # ------------------ LLM Helper ------------------
+NO_RESPONSE = "No response generated"  # content call_gemini returns when the model produced nothing
+
 async def call_gemini(messages: List[Dict[str, Any]], model: str, functions: List[Dict[str, Any]] = None) -> Dict[str, Any]:
     # Convert OpenAI format to Gemini format
     contents = []
@@ -320,21 +566,31 @@ async def call_gemini(messages: List[Dict[str, Any]], model: str, functions: Lis
                     if part["type"] == "text":
                         parts.append({"text": part["text"]})
                     elif part["type"] == "image_url":
+                        image_url = part["image_url"]["url"]
+                        mime_match = re.match(r"data:([\w/+.-]+);base64,", image_url)
                         parts.append({
                             "inline_data": {
-                                "mime_type": "image/jpeg",  # Default, could be improved
-                                "data": part["image_url"]["url"].split(",")[1] if "," in part["image_url"]["url"] else ""
+                                "mime_type": mime_match.group(1) if mime_match else "image/jpeg",
+                                "data": image_url.split(",")[1] if "," in image_url else ""
                             }
                         })
                 contents.append({"role": "user", "parts": parts})
             else:
                 contents.append({"role": "user", "parts": [{"text": msg["content"]}]})
         elif msg["role"] == "assistant":
-            contents.append({"role": "model", "parts": [{"text": msg["content"]}]})
+            parts = [{"text": msg["content"]}] if msg.get("content") else []
+            for call in msg.get("tool_calls") or []:
+                parts.append({"functionCall": {"name": call["function"]["name"], "args": json.loads(call["function"]["arguments"] or "{}")}})
+            contents.append({"role": "model", "parts": parts})
+        elif msg["role"] == "tool":
+            # Function results go back as functionResponse parts
+            contents.append({"role": "user", "parts": [{
+                "functionResponse": {"name": msg["name"], "response": {"result": json.loads(msg["content"])}}
+            }]})
     
     # Add system message to the first user message if it exists
     system_msg = next((msg for msg in messages if msg["role"] == "system"), None)
-    if system_msg and contents and contents[0]["role"] == "user":
+    if system_msg and contents and contents[0]["role"] == "user" and "text" in contents[0]["parts"][0]:
         if contents[0]["parts"][0]["text"]:
             contents[0]["parts"][0]["text"] = system_msg["content"] + "\n\n" + contents[0]["parts"][0]["text"]
         else:
@@ -380,25 +636,235 @@ async def call_gemini(messages: List[Dict[str, Any]], model: str, functions: Lis
             candidate = data["candidates"][0]
             if "content" in candidate and "parts" in candidate["content"]:
                 text_content = ""
+                function_calls = list(candidate.get("functionCalls", []))
                 for part in candidate["content"]["parts"]:
                     if "text" in part:
                         text_content += part["text"]
+                    if "functionCall" in part:
+                        function_calls.append(part["functionCall"])
                 
                 # Handle function calls
-                if "functionCalls" in candidate:
+                if function_calls:
                     return {
                         "content": text_content,
                         "tool_calls": [{
                             "function": {
                                 "name": call["name"],
-                                "arguments": json.dumps(call["args"])
+                                "arguments": json.dumps(call.get("args", {}))
                             }
-                        } for call in candidate["functionCalls"]]
+                        } for call in function_calls]
                     }
                 
                 return {"content": text_content}
         
-        return {"content": "No response generated"}
+        return {"content": NO_RESPONSE}
+
+TICKET_ENRICHMENT_PROMPT = (
+    "A tenant reported this maintenance issue by SMS:\n\n{message}\n\n"
+    "Return ONLY a JSON object with these keys:\n"
+    '  "category": one of plumbing, electrical, hvac, appliance, structural, fire_safety, gas, pest, other\n'
+    '  "priority": one of low, normal, high, critical\n'
+    '  "summary": one sentence describing the issue for the maintenance team\n'
+)
+
+async def enrich_ticket_with_llm(ticket_id: str, message: str):
+    """Background step: ask the LLM to categorize and summarize a ticket created without it"""
+    try:
+        response = await call_gemini([{"role": "user", "content": TICKET_ENRICHMENT_PROMPT.format(message=message)}], model=TEXT_MODEL)
+        content = response.get("content", "")
+        match = re.search(r"\{.*\}", content, re.DOTALL)
+        if not match:
+            print(f"[ENRICH] No JSON in enrichment response for {ticket_id}")
+            return
+        data = json.loads(match.group())
+        fields = {"category": data.get("category"), "ai_summary": data.get("summary")}
+        ticket_store.update(ticket_id, {k: v for k, v in fields.items() if v}, updated_at=datetime.now().isoformat())
+        # Keyword escalation stays authoritative - the model's opinion is only logged
+        print(f"[ENRICH] Ticket {ticket_id}: category={data.get('category')}, model priority={data.get('priority')}")
+    except Exception as e:
+        print(f"[ERROR] Error enriching ticket {ticket_id}: {e}")
+
+CONVERSATION_SUMMARY_PROMPT = (
+    "You maintain a running summary of an SMS conversation between a tenant and Esto, their property's AI assistant.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New messages:\n{messages}\n\n"
+    "Write an updated summary in at most 120 words. Keep the tenant's open issues, tickets mentioned, "
+    "troubleshooting already tried, promises made, and anything still unresolved. Return only the summary text."
+)
+
+def get_conversation_summary(phone: str) -> Optional[str]:
+    """Latest rolling summary for a phone, if one has been generated"""
+    return (conversation_summaries.get(phone) or {}).get("summary")
+
+def schedule_conversation_summary(phone: str):
+    """Queue a summary refresh once enough new messages have arrived since the last one"""
+    state = conversation_summaries.get(phone)
+    if not state or state["refreshing"] or state["message_count"] - state["summarized_count"] < SUMMARY_EVERY_N_MESSAGES:
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # Logged from a sync endpoint - the next message logged on the event loop picks it up
+        return
+    state["refreshing"] = True
+    spawn_background_job(refresh_conversation_summary(phone))
+
+async def refresh_conversation_summary(phone: str):
+    """Background step: fold the messages since the last summary into the rolling summary"""
+    state = conversation_summaries[phone]
+    try:
+        async with summary_semaphore:
+            target_count = state["message_count"]
+            new_count = min(target_count - state["summarized_count"], len(sms_messages.get(phone, [])))
+            new_messages = sms_messages.get(phone, [])[-new_count:] if new_count else []
+            transcript = "\n".join(
+                f"{'Tenant' if msg.get('direction') == 'inbound' else 'Esto'}: {msg.get('body') or ''}" for msg in new_messages
+            )
+            prompt = CONVERSATION_SUMMARY_PROMPT.format(summary=state["summary"] or "(none yet)", messages=transcript)
+            response = await call_gemini([{"role": "user", "content": prompt}], model=TEXT_MODEL)
+            summary = (response.get("content") or "").strip()
+            if response.get("error") or not summary or summary == NO_RESPONSE:
+                # Keep the previous summary and count, so these messages are folded in on the next try
+                print(f"[SUMMARY] No summary returned for {phone}, keeping the previous one")
+                return
+            state.update(summary=summary, updated_at=datetime.now().isoformat(), summarized_count=target_count)
+            print(f"[SUMMARY] Updated conversation summary for {phone} ({target_count} messages)")
+    except Exception as e:
+        print(f"[ERROR] Error summarizing conversation for {phone}: {e}")
+    finally:
+        state["refreshing"] = False
+
+DAMAGE_ASSESSMENT_PROMPT = (
+    "A tenant sent these photos with their maintenance message:\n\n{message}\n\n"
+    "Inspect the photos and return ONLY a JSON object with these keys:\n"
+    '  "damage_type": short label such as water_damage, mold, broken_fixture, electrical, pest, none\n'
+    '  "severity": one of none, minor, moderate, severe\n'
+    '  "visible_issues": list of short strings describing what is visible\n'
+    '  "safety_hazard": true or false\n'
+    '  "recommended_priority": one of low, normal, high, critical\n'
+    '  "notes": one sentence for the maintenance team\n'
+)
+MAX_MEDIA_BYTES = 10 * 1024 * 1024
+
+def is_twilio_media_url(url: str) -> bool:
+    """Only https URLs on api.twilio.com or a *.twilio.com host may receive Twilio credentials"""
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    return parsed.scheme == "https" and (host == "api.twilio.com" or host.endswith(".twilio.com"))
+
+async def fetch_media_as_data_url(client: httpx.AsyncClient, url: str) -> Optional[str]:
+    """Download an MMS image (Twilio media needs account auth) and inline it as a data URL"""
+    if url.startswith("data:image/"):
+        return url
+    if not is_twilio_media_url(url):
+        print(f"[VISION] Refusing to fetch media from non-Twilio URL {url}")
+        return None
+    try:
+        account_sid, auth_token = os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN")
+        auth = (account_sid, auth_token) if account_sid and auth_token else None
+        r = await client.get(url, auth=auth)
+        r.raise_for_status()
+        content_type = r.headers.get("content-type", "").split(";")[0].strip()
+        if not content_type.startswith("image/") or len(r.content) > MAX_MEDIA_BYTES:
+            print(f"[VISION] Skipping media {url} ({content_type}, {len(r.content)} bytes)")
+            return None
+        return f"data:{content_type};base64,{base64.b64encode(r.content).decode()}"
+    except Exception as e:
+        print(f"[ERROR] Error fetching media {url}: {e}")
+        return None
+
+async def assess_ticket_photos(phone: str, message: str, media_urls: List[str], ticket_id: Optional[str] = None):
+    """
+    Background step: run the vision model over a tenant's photos and attach the assessment
+    Goes to the given ticket, else the tenant's newest open ticket, else waits for their next ticket
+    """
+    async with vision_semaphore:
+        try:
+            async with httpx.AsyncClient(timeout=30, follow_redirects=True) as client:
+                images = await asyncio.gather(*(fetch_media_as_data_url(client, url) for url in media_urls))
+            images = [image for image in images if image]
+            if not images:
+                print(f"[VISION] No usable images from {phone}")
+                return
+            content = [{"type": "text", "text": DAMAGE_ASSESSMENT_PROMPT.format(message=message)}]
+            content += [{"type": "image_url", "image_url": {"url": image}} for image in images]
+            response = await call_gemini([{"role": "user", "content": content}], model=VISION_MODEL)
+            match = re.search(r"\{.*\}", response.get("content", ""), re.DOTALL)
+            if not match:
+                print(f"[VISION] No JSON in assessment response for {phone}")
+                return
+            assessment = json.loads(match.group())
+            assessment["photo_count"] = len(images)
+            assessment["assessed_at"] = datetime.now().isoformat()
+        except Exception as e:
+            print(f"[ERROR] Error assessing photos from {phone}: {e}")
+            return
+    
+    if not ticket_id:
+        open_tickets = [t for t in get_tenant_tickets(phone) if t.status in OPEN_STATUSES]
+        ticket_id = max(open_tickets, key=lambda t: t.created_at).id if open_tickets else None
+    if ticket_id and apply_damage_assessment(ticket_id, assessment):
+        print(f"[VISION] Attached {assessment.get('severity')} {assessment.get('damage_type')} assessment to ticket {ticket_id}")
+    else:
+        photo_assessments[phone] = assessment
+        print(f"[VISION] Holding photo assessment for {phone} until a ticket is opened")
+
+async def alert_pm_critical_ticket(ticket_id: str, req: TenantSmsRequest, keyword: str):
+    """Text the property manager about a critical issue"""
+    alert_to = PM_ALERT_PHONE or req.context.hotline
+    alert = (
+        f"URGENT: {req.context.tenant_name} ({req.context.unit}, {req.context.property_name or 'Unknown Property'}) "
+        f"reported '{keyword}'. Ticket #{ticket_id}. Tenant phone: {req.phone}. Message: {req.message[:200]}"
+    )
+    if not alert_to:
+        print(f"[ALERT] No PM alert number configured - critical ticket {ticket_id} not texted")
+        return
+    sid = await send_sms_via_twilio(alert_to, alert)
+    if sid:
+        log_sms(alert_to, "outbound", alert, alert_to, TWILIO_FROM_NUMBER, sid)
+        print(f"[ALERT] PM alerted at {alert_to} for critical ticket {ticket_id}")
+
+async def run_critical_escalation(ticket_id: str, req: TenantSmsRequest, keyword: str):
+    """Alert first, then enrich - the alert must never wait on the model"""
+    await alert_pm_critical_ticket(ticket_id, req, keyword)
+    await enrich_ticket_with_llm(ticket_id, req.message)
+
+def escalate_critical_issue(req: TenantSmsRequest, keyword: str) -> TenantSmsResponse:
+    """
+    Fast lane for safety-critical messages
+    Creates the ticket and replies immediately; PM alert and LLM enrichment run in the background
+    """
+    ticket_id, merged = create_maintenance_ticket(
+        tenant_phone=req.phone,
+        tenant_name=req.context.tenant_name,
+        unit=req.context.unit,
+        property_name=req.context.property_name or "Unknown Property",
+        issue_description=req.message,
+        media_urls=req.media_urls or []
+    )
+    print(f"[CRITICAL] Fast-lane ticket {ticket_id} for {req.phone} (matched '{keyword}')")
+    if req.media_urls:
+        spawn_background_job(assess_ticket_photos(req.phone, req.message, req.media_urls, ticket_id))
+    
+    if merged and ticket_store.raise_priority(ticket_id, "critical", updated_at=datetime.now().isoformat()):
+        # Merged into a ticket that wasn't urgent yet - this report makes it critical, so the PM hasn't heard about it
+        print(f"[CRITICAL] Raised merged ticket {ticket_id} to critical")
+        spawn_background_job(alert_pm_critical_ticket(ticket_id, req, keyword))
+        reply = f"This sounds urgent. I've added your report to ticket #{ticket_id}, marked it as a priority and alerted your property manager right away."
+    elif merged:
+        reply = f"We're already treating this as urgent under ticket #{ticket_id} and your property manager has been alerted. I've added your report to it."
+    else:
+        spawn_background_job(run_critical_escalation(ticket_id, req, keyword))
+        reply = f"This sounds urgent. I've opened priority ticket #{ticket_id} and alerted your property manager right away."
+    
+    reply += " If anyone is in danger, leave the unit and call 911"
+    reply += f" or the emergency hotline at {req.context.hotline}." if req.context.hotline else "."
+    
+    return TenantSmsResponse(
+        reply=reply,
+        maintenance_ticket_created=True,
+        ticket_id=ticket_id
+    )
 
 async def process_tenant_sms(req: TenantSmsRequest) -> TenantSmsResponse:
     """Process incoming SMS from tenant with maintenance ticket creation"""
@@ -461,7 +927,7 @@ async def process_tenant_sms(req: TenantSmsRequest) -> TenantSmsResponse:
             issue_description = "\n".join(issue_description_parts)
             
             # Create the ticket with all context
-            ticket_id = create_maintenance_ticket(
+            ticket_id, merged = create_maintenance_ticket(
                 tenant_phone=tenant_phone,
                 tenant_name=tenant_name,
                 unit=unit,
@@ -471,13 +937,16 @@ async def process_tenant_sms(req: TenantSmsRequest) -> TenantSmsResponse:
             )
             
             # Generate personalized response
-            if tenant_name and tenant_name != 'Tenant' and tenant_name != 'N/A':
+            if merged:
+                reply = f"Thanks! This matches open maintenance ticket #{ticket_id} for {unit}, so I've added your report to it. Our maintenance team is already on it and will contact you soon."
+            elif tenant_name and tenant_name != 'Tenant' and tenant_name != 'N/A':
                 reply = f"Thanks {tenant_name}! I've created maintenance ticket #{ticket_id} for {unit} at {property_name}. Our maintenance team will review your request and contact you soon to schedule a repair."
             else:
                 reply = f"Thanks! I've created maintenance ticket #{ticket_id} for your unit. Our maintenance team will review your request and contact you soon to schedule a repair."
             
             if req.media_urls and len(req.media_urls) > 0:
                 reply += f" I've included the {len(req.media_urls)} photo(s) you sent to help our team understand the issue better."
+                spawn_background_job(assess_ticket_photos(req.phone, req.message, req.media_urls, ticket_id))
             
             print(f"[HARDCODED] Successfully created ticket {ticket_id} with full context")
             print(f"[HARDCODED] Ticket includes: name={tenant_name}, unit={unit}, property={property_name}, media={len(req.media_urls or [])} files")
@@ -489,98 +958,55 @@ async def process_tenant_sms(req: TenantSmsRequest) -> TenantSmsResponse:
             )
         
         if message_lower == "when is rent due?":
+            rent = f"${req.context.rent_amount:,.0f}" if req.context.rent_amount else "$2,000"
             return TenantSmsResponse(
-                reply="According to the lease provided by the property manager, rent is $2,000 and due every 1st of the month",
+                reply=f"According to the lease provided by the property manager, rent is {rent} and due every 1st of the month",
                 maintenance_ticket_created=False,
                 ticket_id=None
             )
         
-        # Get SMS history for context
-        sms_history = sms_messages.get(req.phone, [])
-        recent_messages = sms_history[-5:] if sms_history else []  # Last 5 messages
-        
-        # Get existing maintenance tickets for this tenant
-        existing_tickets = []
-        for ticket in maintenance_tickets.values():
-            if ticket.tenant_phone == req.phone:
-                existing_tickets.append(ticket)
-        
-        # Check for ticket closure requests
+        # FAST LANE: safety-critical issues get a ticket and a PM alert before any LLM call
         closure_keywords = ["close", "closed", "fixed", "resolved", "done", "completed", "finished"]
-        message_lower = req.message.lower()
         is_closure_request = any(keyword in message_lower for keyword in closure_keywords)
+        priority, keyword = priority_classifier.classify(req.message, tenant_directory.property_id_for(req.phone))
+        if priority == "critical" and not is_closure_request:
+            return escalate_critical_issue(req, keyword)
+        
+        # Cached per-phone context; only the latest messages and KB matches are added per turn
+        snapshot = get_tenant_context_snapshot(req.phone, req.context)
+        existing_tickets = snapshot["tickets"]
         
-        # Choose model based on media presence
+        # Photos are analyzed by the vision model in the background - the reply only waits on the text model
         has_media = bool(req.media_urls and len(req.media_urls) > 0)
-        model = VISION_MODEL if has_media else TEXT_MODEL
-        
-        # Build comprehensive context for tenant
-        ctx = req.context.model_dump()
-        tenant_name = ctx.get('tenant_name', 'N/A')
-        unit = ctx.get('unit', 'N/A')
-        property_name = ctx.get('property_name', 'N/A')
-        address = ctx.get('address', 'N/A')
-        hotline = ctx.get('hotline', 'N/A')
-        portal_url = ctx.get('portal_url', 'N/A')
-        
-        # Build detailed context summary
-        context_parts = [
-            f"Property: {property_name}",
-            f"Unit: {unit}",
-            f"Address: {address}",
-            f"Tenant: {tenant_name}"
-        ]
+        model = TEXT_MODEL
+        
+        # Look up similar resolved issues - a confident match is answered without an LLM call
+        # Only this property's resolutions; a tenant who already got the canned fix, or says it didn't work, goes to the model
+        kb_matches = [] if is_closure_request else knowledge_base.search(req.message, tenant_directory.property_id_for(req.phone))
+        if (kb_matches and not has_media and kb_matches[0]["score"] >= DIRECT_ANSWER_MIN_SCORE
+                and not is_follow_up(req.message) and not sent_kb_answer_recently(req.phone)):
+            best_match = kb_matches[0]
+            print(f"[KB] Answering from resolved ticket {best_match['ticket_id']} (score {best_match['score']})")
+            return TenantSmsResponse(
+                reply=f"{DIRECT_ANSWER_PREFIX} Here's what fixed it last time: {best_match['resolution']}\n\nGive that a try and let me know if the problem continues - I'll open a maintenance ticket for you.",
+                maintenance_ticket_created=False,
+                ticket_id=None
+            )
         
-        if hotline != 'N/A':
-            context_parts.append(f"Emergency Hotline: {hotline}")
-        if portal_url != 'N/A':
-            context_parts.append(f"Portal: {portal_url}")
-            
-        context_summary = " | ".join(context_parts)
+        personalized_system = snapshot["system_prompt"] + format_recent_history(req.phone) + format_suggestions(kb_matches)
         
-        # Build conversation history context
-        conversation_context = ""
-        if recent_messages:
-            conversation_context = "\n\nRecent conversation history:\n"
-            for msg in recent_messages[-3:]:  # Last 3 messages
-                direction = "You" if msg.get('direction') == 'inbound' else "Esto"
-                body = msg.get('body', '')
-                timestamp = msg.get('created_at', '')
-                conversation_context += f"{direction}: {body}\n"
-        
-        # Build existing tickets context
-        tickets_context = ""
-        if existing_tickets:
-            open_tickets = [t for t in existing_tickets if t.status in ['open', 'in_progress']]
-            if open_tickets:
-                tickets_context = "\n\nExisting maintenance tickets:\n"
-                for ticket in open_tickets:
-                    tickets_context += f"- #{ticket.id} ({ticket.priority}): {ticket.issue_description} - Status: {ticket.status}\n"
-        
-        # Build messages for tenant SMS processing with personalized introduction
-        full_context = f"{context_summary}{conversation_context}{tickets_context}"
-        
-        # Create personalized system prompt
-        personalized_system = TENANT_SMS_SYSTEM + f"\n\nTENANT CONTEXT:\n{full_context}\n\n"
-        if tenant_name != 'N/A':
-            personalized_system += f"IMPORTANT: Address the tenant as '{tenant_name}' and reference their unit '{unit}' at '{property_name}' when appropriate.\n"
+        user_message = req.message
+        if has_media:
+            user_message += (
+                f"\n\n[The tenant attached {len(req.media_urls)} photo(s). They are being reviewed separately and the "
+                "findings will be added to their maintenance ticket - acknowledge them, but don't describe their contents.]"
+            )
         
         messages = [
             {"role": "system", "content": personalized_system},
-            {"role": "user", "content": req.message}
+            {"role": "user", "content": user_message}
         ]
         
-        # Add media if present (only for vision model and when necessary)
-        if has_media and model == VISION_MODEL:
-            user_content = [
-                {"type": "text", "text": req.message}
-            ]
-            for media_url in req.media_urls:
-                # Only process image URLs for multimodal support
-                if media_url.startswith("data:image/") or media_url.startswith("http"):
-                    user_content.append({"type": "image_url", "image_url": {"url": media_url}})
-            messages[1]["content"] = user_content
-        
         # Define the ticket creation function with enhanced parameters
         ticket_creation_function = {
             "name": "create_maintenance_ticket",
@@ -648,7 +1074,8 @@ async def process_tenant_sms(req: TenantSmsRequest) -> TenantSmsResponse:
             closed_tickets = []
             for ticket in existing_tickets:
                 if ticket.status in ['open', 'in_progress']:
-                    ticket.status = 'resolved'
+                    # No resolution notes: only fixes a PM writes up are shared through the knowledge base
+                    set_ticket_status(ticket.id, 'resolved')
                     closed_tickets.append(ticket.id)
                     print(f"[TICKET] Closed ticket {ticket.id} - {ticket.issue_description}")
             
@@ -687,7 +1114,7 @@ async def process_tenant_sms(req: TenantSmsRequest) -> TenantSmsResponse:
                             enhanced_description += f"\n\nImages provided: {len(req.media_urls)} photo(s)/video(s) attached"
                         
                         # Create the maintenance ticket
-                        ticket_id = create_maintenance_ticket(
+                        ticket_id, merged = create_maintenance_ticket(
                             tenant_phone=req.phone,
                             tenant_name=req.context.tenant_name,
                             unit=req.context.unit,
@@ -698,15 +1125,11 @@ async def process_tenant_sms(req: TenantSmsRequest) -> TenantSmsResponse:
                         ticket_created = True
                         print(f"[OK] Created ticket {ticket_id}")
                         
-                        # Verify ticket is accessible
-                        if ticket_id in maintenance_tickets:
-                            print(f"[VERIFY] Ticket {ticket_id} confirmed in maintenance_tickets dict")
-                        else:
-                            print(f"[ERROR] Ticket {ticket_id} NOT FOUND in maintenance_tickets dict after creation!")
-                        
                         # Generate personalized response
                         tenant_name = req.context.tenant_name
-                        if tenant_name and tenant_name != 'N/A':
+                        if merged:
+                            reply = f"Thanks for working through the troubleshooting steps with me. This matches open maintenance ticket #{ticket_id}, so I've added your report to it rather than opening a new one."
+                        elif tenant_name and tenant_name != 'N/A':
                             reply = f"Thanks for working through the troubleshooting steps with me, {tenant_name}. Since the issue persists, I've created maintenance ticket #{ticket_id} for our team to address this in your unit."
                         else:
                             reply = f"Thanks for working through the troubleshooting steps with me. Since the issue persists, I've created maintenance ticket #{ticket_id} for our team to address this."
@@ -722,6 +1145,9 @@ async def process_tenant_sms(req: TenantSmsRequest) -> TenantSmsResponse:
         else:
             print("ℹ️ No tool calls made by LLM")
         
+        if has_media:
+            spawn_background_job(assess_ticket_photos(req.phone, req.message, req.media_urls, ticket_id))
+        
         return TenantSmsResponse(
             reply=reply,
             maintenance_ticket_created=ticket_created,
@@ -974,34 +1400,18 @@ def get_sms_threads():
             print(f"   Processing phone {phone}: {len(messages)} messages")
             if messages:  # Only include threads with messages
                 # Get property context for this phone
-                property_id = phone_to_property.get(phone)
-                property_name = "Unknown Property"
-                tenant_name = "Unknown Tenant"
-                
-                print(f"     Property ID: {property_id}")
-                print(f"     Property settings keys: {list(property_settings.keys())}")
-                
-                if property_id and property_id in property_settings:
-                    settings = property_settings[property_id]
-                    print(f"     Settings type: {type(settings)}")
-                    print(f"     Settings: {settings}")
-                    
-                    if hasattr(settings, 'property_name'):
-                        property_name = settings.property_name or "Unknown Property"
-                    elif isinstance(settings, dict):
-                        property_name = settings.get('property_name', 'Unknown Property')
-                    
-                    if hasattr(settings, 'tenant_name'):
-                        tenant_name = settings.tenant_name or "Unknown Tenant"
-                    elif isinstance(settings, dict):
-                        tenant_name = settings.get('tenant_name', 'Unknown Tenant')
+                record = tenant_directory.lookup(phone)
+                property_name = (record and record.property_name) or "Unknown Property"
+                tenant_name = (record and record.tenant_name) or "Unknown Tenant"
                 
                 thread_data = {
                     "phone": phone,
                     "property_name": property_name,
                     "tenant_name": tenant_name,
                     "messages": messages,
-                    "message_count": len(messages)
+                    "message_count": len(messages),
+                    "summary": get_conversation_summary(phone),
+                    "summary_updated_at": conversation_summaries.get(phone, {}).get("updated_at")
                 }
                 threads.append(thread_data)
                 print(f"     Added thread: {thread_data}")
@@ -1018,6 +1428,164 @@ def get_sms_threads():
         return {"threads": [], "error": str(e)}
 
 
+# ------------------ PM Assistant Tools ------------------
+# pm_chat answers portfolio questions by calling these instead of having tickets inlined into its prompt
+PM_TOOL_MAX_ROUNDS = int(os.getenv("PM_TOOL_MAX_ROUNDS", "4"))
+PM_TOOL_MAX_RESULTS = 20
+APPLICATIONS_CACHE_TTL = 60  # seconds
+applications_cache = {}  # user_id -> (fetched_at, applications)
+
+PM_TOOLS = [
+    {
+        "name": "search_tickets",
+        "description": "Search maintenance tickets across the whole portfolio. Returns compact ticket records ordered by priority, then age.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "status": {"type": "array", "items": {"type": "string", "enum": VALID_STATUSES}, "description": "Ticket statuses to include"},
+                "priority": {"type": "array", "items": {"type": "string", "enum": ["critical", "high", "normal", "low"]}, "description": "Priorities to include"},
+                "property_name": {"type": "string", "description": "Exact property name"},
+                "tenant_phone": {"type": "string", "description": "Tenant phone number"},
+                "text": {"type": "string", "description": "Words that must appear in the issue description"},
+                "limit": {"type": "integer", "description": f"Max tickets to return (up to {PM_TOOL_MAX_RESULTS})"}
+            }
+        }
+    },
+    {
+        "name": "get_thread_summary",
+        "description": "Get the SMS conversation summary, latest messages and open tickets for one tenant phone number.",
+        "parameters": {
+            "type": "object",
+            "properties": {"phone": {"type": "string", "description": "Tenant phone number"}},
+            "required": ["phone"]
+        }
+    },
+    {
+        "name": "list_applicants",
+        "description": "List rental applicants matching the given criteria, best screening score first.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "property_id": {"type": "string", "description": "Only applicants for this property"},
+                "status": {"type": "string", "description": "Application status, e.g. pending, approved, rejected"},
+                "min_credit_score": {"type": "integer"},
+                "min_monthly_income": {"type": "number"},
+                "limit": {"type": "integer", "description": f"Max applicants to return (up to {PM_TOOL_MAX_RESULTS})"}
+            }
+        }
+    },
+]
+
+async def fetch_user_applications(user_id: str, use_cache: bool = True) -> List[Dict[str, Any]]:
+    """Fetch a user's applications from the frontend database API (briefly cached for repeated tool calls)"""
+    cached = applications_cache.get(user_id)
+    if use_cache and cached and (datetime.now() - cached[0]).total_seconds() < APPLICATIONS_CACHE_TTL:
+        return cached[1]
+    frontend_url = os.getenv("FRONTEND_ORIGIN", "http://localhost:3000")
+    service_token = os.getenv("APPLICATION_SERVICE_TOKEN", "")
+    async with httpx.AsyncClient(timeout=30) as client:
+        response = await client.get(
+            f"{frontend_url}/api/applications/internal",
+            headers={"Authorization": f"Bearer {service_token}", "Content-Type": "application/json"},
+            params={"userId": user_id}
+        )
+        response.raise_for_status()
+        applications = response.json().get("applications", [])
+    applications_cache[user_id] = (datetime.now(), applications)
+    return applications
+
+def _tool_limit(args: Dict[str, Any]) -> int:
+    try:
+        return max(1, min(int(args.get("limit") or 10), PM_TOOL_MAX_RESULTS))
+    except (TypeError, ValueError):
+        return 10
+
+def tool_search_tickets(args: Dict[str, Any]) -> Dict[str, Any]:
+    limit = _tool_limit(args)
+    filters = {
+        "status": args.get("status") or None,
+        "priority": args.get("priority") or None,
+        "property_name": args.get("property_name") or None,
+        "tenant_phone": args.get("tenant_phone") or None,
+        "text": args.get("text") or None,
+    }
+    tickets, next_cursor = ticket_store.query(limit=limit, **filters)
+    return {
+        # Total matches, not just the page returned
+        "count": ticket_store.count(**filters),
+        "returned": len(tickets),
+        "has_more": next_cursor is not None,
+        "tickets": [{
+            "id": t["id"],
+            "property_name": t.get("property_name"),
+            "unit": t.get("unit"),
+            "tenant_name": t.get("tenant_name"),
+            "tenant_phone": t.get("tenant_phone"),
+            "priority": t.get("priority"),
+            "status": t.get("status"),
+            "created_at": t.get("created_at"),
+            "issue": t.get("ai_summary") or t.get("issue_description", "")[:160],
+        } for t in tickets]
+    }
+
+def tool_get_thread_summary(args: Dict[str, Any]) -> Dict[str, Any]:
+    phone = args.get("phone", "")
+    messages = sms_messages.get(phone, [])
+    open_tickets, _ = ticket_store.query(status=OPEN_STATUSES, tenant_phone=phone, limit=PM_TOOL_MAX_RESULTS)
+    return {
+        "phone": phone,
+        "message_count": len(messages),
+        "summary": get_conversation_summary(phone),
+        "recent_messages": [
+            {"direction": m.get("direction"), "body": (m.get("body") or "")[:200], "created_at": m.get("created_at")}
+            for m in messages[-3:]
+        ],
+        "open_tickets": [{"id": t["id"], "priority": t.get("priority"), "status": t.get("status")} for t in open_tickets],
+    }
+
+async def tool_list_applicants(args: Dict[str, Any]) -> Dict[str, Any]:
+    applications = await fetch_user_applications(os.getenv("DEFAULT_USER_ID", "default_user"))
+    matches = []
+    for app_data in applications:
+        if args.get("property_id") and app_data.get("propertyId") != args["property_id"]:
+            continue
+        if args.get("status") and app_data.get("status") != args["status"]:
+            continue
+        if args.get("min_credit_score") and (app_data.get("creditScore") or 0) < args["min_credit_score"]:
+            continue
+        if args.get("min_monthly_income") and (app_data.get("monthlyIncome") or 0) < args["min_monthly_income"]:
+            continue
+        matches.append(app_data)
+    matches.sort(key=lambda a: a.get("screeningScore") or 0, reverse=True)
+    limit = _tool_limit(args)
+    return {
+        "count": len(matches),
+        "applicants": [{
+            "application_id": a.get("id"),
+            "name": a.get("applicantName"),
+            "email": a.get("applicantEmail"),
+            "property_id": a.get("propertyId"),
+            "status": a.get("status"),
+            "credit_score": a.get("creditScore"),
+            "monthly_income": a.get("monthlyIncome"),
+            "screening_score": a.get("screeningScore"),
+        } for a in matches[:limit]]
+    }
+
+async def run_pm_tool(name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute one tool call from the PM assistant"""
+    try:
+        if name == "search_tickets":
+            return tool_search_tickets(args)
+        if name == "get_thread_summary":
+            return tool_get_thread_summary(args)
+        if name == "list_applicants":
+            return await tool_list_applicants(args)
+        return {"error": f"Unknown tool: {name}"}
+    except Exception as e:
+        print(f"[ERROR] PM tool {name} failed: {e}")
+        return {"error": str(e)}
+
 # ------------------ AI Chat Routes ------------------
 @app.post("/tenant_chat", response_model=PmChatResponse)
 async def tenant_chat(req: PmChatRequest):
@@ -1036,58 +1604,6 @@ async def tenant_chat(req: PmChatRequest):
         if not ctx.get("tenant_phone") and req.phone:
             ctx["tenant_phone"] = req.phone
 
-        # Get maintenance tickets for this tenant/property
-        tenant_tickets = []
-        for ticket in maintenance_tickets.values():
-            if (ticket.tenant_phone == ctx.get("tenant_phone") or 
-                ticket.tenant_name == ctx.get("tenant_name")):
-                tenant_tickets.append(ticket)
-        
-        # Get SMS history for context
-        sms_history = sms_messages.get(ctx.get("tenant_phone", ""), [])
-        recent_messages = sms_history[-5:] if sms_history else []
-        
-        # Build comprehensive context for tenant
-        tenant_name = ctx.get('tenant_name', 'N/A')
-        unit = ctx.get('unit', 'N/A')
-        property_name = ctx.get('property_name', 'N/A')
-        address = ctx.get('address', 'N/A')
-        hotline = ctx.get('hotline', 'N/A')
-        portal_url = ctx.get('portal_url', 'N/A')
-        
-        # Build detailed context summary
-        context_parts = [
-            f"Property: {property_name}",
-            f"Unit: {unit}",
-            f"Address: {address}",
-            f"Tenant: {tenant_name}"
-        ]
-        
-        if hotline != 'N/A':
-            context_parts.append(f"Emergency Hotline: {hotline}")
-        if portal_url != 'N/A':
-            context_parts.append(f"Portal: {portal_url}")
-            
-        context_summary = " | ".join(context_parts)
-        
-        # Build conversation history context
-        conversation_context = ""
-        if recent_messages:
-            conversation_context = "\n\nRecent conversation history:\n"
-            for msg in recent_messages[-3:]:  # Last 3 messages
-                direction = "You" if msg.get('direction') == 'inbound' else "Esto"
-                body = msg.get('body', '')
-                conversation_context += f"{direction}: {body}\n"
-        
-        # Build existing tickets context
-        tickets_context = ""
-        if tenant_tickets:
-            open_tickets = [t for t in tenant_tickets if t.status in ['open', 'in_progress']]
-            if open_tickets:
-                tickets_context = "\n\nExisting maintenance tickets:\n"
-                for ticket in open_tickets:
-                    tickets_context += f"- #{ticket.id} ({ticket.priority}): {ticket.issue_description} - Status: {ticket.status}\n"
-        
         # Check for rent due date questions - hardcoded response
         message_lower = (req.message or "").lower().strip()
         if "rent" in message_lower and "due" in message_lower:
@@ -1095,13 +1611,10 @@ async def tenant_chat(req: PmChatRequest):
                 reply="Rent is due on the first of every month for $2000."
             )
         
-        # Build messages for tenant chat processing with personalized introduction
-        full_context = f"{context_summary}{conversation_context}{tickets_context}"
-        
-        # Create personalized system prompt
-        personalized_system = TENANT_SMS_SYSTEM + f"\n\nTENANT CONTEXT:\n{full_context}\n\n"
-        if tenant_name != 'N/A':
-            personalized_system += f"IMPORTANT: Address the tenant as '{tenant_name}' and reference their unit '{unit}' at '{property_name}' when appropriate.\n"
+        # Same cached context snapshot the SMS path uses
+        tenant_phone = ctx.get("tenant_phone") or ""
+        snapshot = get_tenant_context_snapshot(tenant_phone, req.context, tenant_name=ctx.get("tenant_name"))
+        personalized_system = snapshot["system_prompt"] + format_recent_history(tenant_phone)
         
         messages = [
             {"role": "system", "content": personalized_system},
@@ -1156,13 +1669,6 @@ async def pm_chat(req: PmChatRequest):
         if not ctx.get("tenant_phone") and req.phone:
             ctx["tenant_phone"] = req.phone
 
-        # Get maintenance tickets for this tenant/property
-        tenant_tickets = []
-        for ticket in maintenance_tickets.values():
-            if (ticket.tenant_phone == ctx.get("tenant_phone") or 
-                ticket.tenant_name == ctx.get("tenant_name")):
-                tenant_tickets.append(ticket)
-        
         # Build comprehensive context for property manager
         context_parts = [
             f"Property: {ctx.get('property_name', 'N/A')}",
@@ -1179,16 +1685,19 @@ async def pm_chat(req: PmChatRequest):
             
         context_summary = " | ".join(context_parts)
         
-        # Add maintenance ticket information
-        maintenance_info = ""
-        if tenant_tickets:
-            maintenance_info = "\n\nMaintenance Tickets for this tenant:\n"
-            for ticket in sorted(tenant_tickets, key=lambda x: x.created_at, reverse=True)[:5]:  # Show last 5 tickets
-                maintenance_info += f"- #{ticket.id} ({ticket.priority.upper()}) - {ticket.issue_description[:100]}... - Status: {ticket.status}\n"
-        else:
-            maintenance_info = "\n\nNo maintenance tickets found for this tenant."
+        # Tickets, threads and applicants are fetched through tools, so the prompt stays the same size
+        tools_info = (
+            "\n\nTOOLS:\n"
+            "Use search_tickets for any question about maintenance tickets (this tenant's or portfolio-wide), "
+            "get_thread_summary for a tenant's SMS conversation, and list_applicants for rental applicants. "
+            "Only fetch what the question needs, and quote ticket numbers from tool results."
+        )
+        
+        conversation_summary = get_conversation_summary(ctx.get("tenant_phone"))
+        if conversation_summary:
+            tools_info += f"\n\nSMS conversation summary with this tenant:\n{conversation_summary}"
         
-        system_with_context = PM_SYSTEM + f"\n\nContext: {context_summary}{maintenance_info}"
+        system_with_context = PM_SYSTEM + f"\n\nContext: {context_summary}{tools_info}"
 
         if has_upload:
             user_parts: List[Dict[str, Any]] = [{"type": "text", "text": req.message}] if has_text else []
@@ -1205,19 +1714,30 @@ async def pm_chat(req: PmChatRequest):
             {"role": "user", "content": user_content},
         ]
 
-        # Check cache first
-        cache_key = get_cache_key(messages)
-        if cache_key in response_cache:
-            return PmChatResponse(reply=response_cache[cache_key])
-
-        reply = (await call_gemini(messages, model=model) or "").strip()
+        # Answers depend on live ticket/application data, so they aren't served from response_cache
+        reply = ""
+        for _ in range(PM_TOOL_MAX_ROUNDS):
+            response = await call_gemini(messages, model=model, functions=PM_TOOLS)
+            tool_calls = response.get("tool_calls") or []
+            if not tool_calls:
+                reply = (response.get("content") or "").strip()
+                break
+            messages.append({"role": "assistant", "content": response.get("content", ""), "tool_calls": tool_calls})
+            for call in tool_calls:
+                name = call["function"]["name"]
+                args = json.loads(call["function"]["arguments"] or "{}")
+                print(f"[PM TOOL] {name}({args})")
+                result = await run_pm_tool(name, args)
+                messages.append({"role": "tool", "name": name, "content": json.dumps(result)})
+        else:
+            # Out of tool rounds - ask for a final answer from what was gathered
+            messages.append({"role": "user", "content": "Answer now using only the tool results above."})
+            response = await call_gemini(messages, model=model, functions=PM_TOOLS)
+            reply = (response.get("content") or "").strip()
+        
         if not reply:
             reply = "Sorry—I'm not sure how to help with that yet."
 
-        # Cache the response (limit cache size)
-        if len(response_cache) < 100:  # Simple cache size limit
-            response_cache[cache_key] = reply
-
         return PmChatResponse(reply=reply)
     except Exception as e:
         print(f"Error in pm_chat: {e}")
@@ -1238,22 +1758,48 @@ async def tenant_sms(req: TenantSmsRequest):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/maintenance_tickets")
-def get_maintenance_tickets():
-    """Get all maintenance tickets"""
-    # Explicitly serialize Pydantic models to dict
-    tickets = [ticket.model_dump() if hasattr(ticket, 'model_dump') else dict(ticket) for ticket in maintenance_tickets.values()]
-    print(f"[DEBUG] Returning {len(tickets)} maintenance ticket(s) from /maintenance_tickets endpoint")
-    if tickets:
-        print(f"[DEBUG] Ticket IDs: {[t.get('id') if isinstance(t, dict) else getattr(t, 'id', 'N/A') for t in tickets]}")
-    return {"tickets": tickets}
+def get_maintenance_tickets(
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    property_name: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
+):
+    """
+    Get maintenance tickets, sorted by priority then age (oldest first)
+    
+    Query params:
+        status / priority: comma-separated values, e.g. status=open,in_progress
+        property_name: exact property name
+        created_after / created_before: ISO timestamps
+        cursor: next_cursor from the previous page
+        limit: page size (max 500)
+    Without cursor or limit every matching ticket is returned, as before pagination existed
+    """
+    filters = {
+        "status": status.split(",") if status else None,
+        "priority": priority.split(",") if priority else None,
+        "property_name": property_name,
+        "created_after": created_after,
+        "created_before": created_before,
+    }
+    try:
+        if cursor is None and limit is None:
+            return {"tickets": list(ticket_store.iter_tickets(**filters))}
+        tickets, next_cursor = ticket_store.query(cursor=cursor, limit=max(1, min(limit or 100, 500)), **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"tickets": tickets, "next_cursor": next_cursor}
 
 @app.get("/debug/maintenance")
 def debug_maintenance():
     """Debug endpoint to see maintenance tickets and phone mappings"""
     return {
-        "maintenance_tickets": list(maintenance_tickets.values()),
-        "phone_to_property": phone_to_property,
-        "property_settings": property_settings,
+        "maintenance_tickets": ticket_store.query(limit=500)[0],
+        "phone_to_property": tenant_directory.phone_mappings(),
+        "property_settings": {pid: record.to_dict() for pid, record in tenant_directory.items()},
         "sms_messages": {k: len(v) for k, v in sms_messages.items()}
     }
 
@@ -1262,15 +1808,15 @@ def debug_sms():
     """Debug endpoint to see SMS messages"""
     return {
         "sms_messages": sms_messages,
-        "phone_to_property": phone_to_property,
-        "property_settings": property_settings
+        "phone_to_property": tenant_directory.phone_mappings(),
+        "property_settings": {pid: record.to_dict() for pid, record in tenant_directory.items()}
     }
 
 @app.post("/test/create-ticket")
 def test_create_ticket():
     """Test endpoint to create a maintenance ticket"""
     try:
-        ticket_id = create_maintenance_ticket(
+        ticket_id, merged = create_maintenance_ticket(
             tenant_phone="+1234567890",
             tenant_name="Test Tenant",
             unit="1A",
@@ -1281,7 +1827,7 @@ def test_create_ticket():
         return {
             "success": True,
             "ticket_id": ticket_id,
-            "total_tickets": len(maintenance_tickets)
+            "total_tickets": ticket_store.count()
         }
     except Exception as e:
         return {
@@ -1293,9 +1839,9 @@ def test_create_ticket():
 async def update_property_settings(property_id: str, settings: dict):
     """Update property settings"""
     try:
-        property_settings[property_id] = settings
+        record = tenant_directory.update_fields(property_id, settings)
         print(f"[OK] Updated settings for property {property_id}")
-        return {"success": True, "settings": settings}
+        return {"success": True, "settings": record.to_dict()}
     except Exception as e:
         print(f"[ERROR] Error updating property settings: {e}")
         return {"success": False, "error": str(e)}
@@ -1304,91 +1850,127 @@ async def update_property_settings(property_id: str, settings: dict):
 async def update_property_settings_post(property_id: str, settings: dict):
     """Update property settings (POST method)"""
     try:
-        property_settings[property_id] = settings
+        record = tenant_directory.update_fields(property_id, settings)
         print(f"[OK] Updated settings for property {property_id}")
-        return {"success": True, "settings": settings}
+        return {"success": True, "settings": record.to_dict()}
     except Exception as e:
         print(f"[ERROR] Error updating property settings: {e}")
         return {"success": False, "error": str(e)}
 
 @app.post("/sync/properties")
 async def sync_properties(properties: List[Dict[str, Any]]):
-    """Sync properties from frontend to backend"""
+    """
+    Sync properties from frontend to backend
+    Properties whose version (or content hash) hasn't changed since the last sync are skipped
+    """
     try:
-        for prop in properties:
-            property_id = prop.get("id")
-            phone = prop.get("phone")
-            context = prop.get("context", {})
-            
-            if property_id and phone:
-                # Map phone to property
-                phone_to_property[phone] = property_id
-                
-                # Store property settings
-                property_settings[property_id] = PropertySettings(
-                    ai_enabled=True,
-                    auto_reply=True,
-                    verification_sent=False
-                )
-                
-                # Store property info for context
-                property_info = {
-                    "tenant_name": context.get("tenant_name", "Tenant"),
-                    "unit": context.get("unit", "Unknown"),
-                    "address": context.get("address", "Unknown"),
-                    "property_name": context.get("property_name", prop.get("name", "Property"))
-                }
-                property_settings[property_id] = property_info
-                
-                print(f"[SYNC] Synced property {property_id} for phone {phone}")
-        
-        return {"success": True, "synced": len(properties)}
+        report = apply_properties(tenant_directory, properties)
+        print(f"[SYNC] Synced {len(properties)} properties: {report.counts}")
+        return {"success": True, "synced": len(properties), **report.to_dict()}
     except Exception as e:
         print(f"[ERROR] Error syncing properties: {e}")
         return {"success": False, "error": str(e)}
 
+@app.post("/sync/properties/manifest")
+def sync_properties_manifest(body: Dict[str, Any] = Body(...)):
+    """
+    Step 1 of an incremental sync: compare the client's manifest with the server
+    
+    Request body:
+    {
+        "properties": [{"id": "...", "version": "..."}],  (or "hash": SHA-256 of the property's JSON with sorted keys, no whitespace)
+        "complete": true  (optional - the manifest lists every property, so missing ones are reported as removed)
+    }
+    Response: {"changed": [ids to send to /sync/properties/delta], "removed": [ids], "unchanged": n}
+    """
+    manifest = body.get("properties") or []
+    diff = diff_manifest(tenant_directory, manifest, complete=bool(body.get("complete")))
+    print(f"[SYNC] Manifest of {len(manifest)}: {len(diff['changed'])} changed, {len(diff['removed'])} removed")
+    return diff
+
+@app.post("/sync/properties/delta")
+def sync_properties_delta(body: Dict[str, Any] = Body(...)):
+    """
+    Step 2 of an incremental sync: apply only the changed properties and removals
+    
+    Request body: {"properties": [full property payloads], "removed": [property ids]}
+    """
+    report = apply_properties(tenant_directory, body.get("properties") or [], removed=body.get("removed") or [])
+    print(f"[SYNC] Applied delta: {report.counts}")
+    return {"success": True, **report.to_dict()}
+
+@app.post("/sync/properties/bulk")
+async def sync_properties_bulk(request: Request):
+    """
+    Streaming first-time import: one property JSON object per line (application/x-ndjson)
+    Lines are applied as they arrive, so the whole portfolio is never held in memory
+    """
+    report = SyncReport()
+    buffer = b""
+    line_number = 0
+    
+    def apply_line(raw: bytes):
+        nonlocal line_number
+        line_number += 1
+        if not raw.strip():
+            return
+        try:
+            prop = json.loads(raw)
+        except json.JSONDecodeError as e:
+            report.error(f"line {line_number}: {e}")
+            return
+        if not isinstance(prop, dict):
+            report.error(f"line {line_number}: expected a JSON object")
+            return
+        report.record(apply_property(tenant_directory, prop), prop.get("id"))
+        if line_number % 5000 == 0:
+            print(f"[SYNC] Bulk import progress: {line_number} lines")
+    
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            apply_line(raw)
+    apply_line(buffer)
+    
+    print(f"[SYNC] Bulk import finished: {report.counts}")
+    return {"success": True, "lines": line_number, **report.to_dict()}
+
 @app.get("/maintenance_tickets/{ticket_id}")
 def get_maintenance_ticket(ticket_id: str):
     """Get specific maintenance ticket"""
-    if ticket_id not in maintenance_tickets:
+    ticket = ticket_store.get(ticket_id)
+    if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
-    return maintenance_tickets[ticket_id]
+    return ticket
 
 @app.put("/maintenance_tickets/{ticket_id}/status")
 def update_ticket_status(ticket_id: str, status_data: dict):
-    """Update maintenance ticket status"""
-    if ticket_id not in maintenance_tickets:
-        raise HTTPException(status_code=404, detail="Ticket not found")
-    
+    """Update maintenance ticket status (optional "resolution" notes feed the knowledge base)"""
     status = status_data.get("status")
     if not status:
         raise HTTPException(status_code=400, detail="Status is required")
     
-    valid_statuses = ["open", "in_progress", "resolved", "closed"]
-    if status not in valid_statuses:
-        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {valid_statuses}")
+    if status not in VALID_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {VALID_STATUSES}")
     
-    maintenance_tickets[ticket_id].status = status
-    print(f"[TICKET] Updated ticket {ticket_id} status to {status}")
+    if set_ticket_status(ticket_id, status, resolution=status_data.get("resolution")) is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
     
     return {"success": True, "ticket_id": ticket_id, "status": status}
 
 @app.patch("/maintenance_tickets/{ticket_id}/status")
 def update_ticket_status_patch(ticket_id: str, status_data: dict):
     """Update maintenance ticket status (alternative endpoint)"""
-    if ticket_id not in maintenance_tickets:
-        raise HTTPException(status_code=404, detail="Ticket not found")
-    
     status = status_data.get("status")
     if not status:
         raise HTTPException(status_code=400, detail="Status is required")
     
-    valid_statuses = ["open", "in_progress", "resolved", "closed"]
-    if status not in valid_statuses:
-        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {valid_statuses}")
+    if status not in VALID_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {VALID_STATUSES}")
     
-    maintenance_tickets[ticket_id].status = status
-    print(f"[TICKET] Updated ticket {ticket_id} status to {status}")
+    if set_ticket_status(ticket_id, status, resolution=status_data.get("resolution")) is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
     
     return {"success": True, "ticket_id": ticket_id, "status": status}
 
@@ -1411,21 +1993,18 @@ async def upsert_contact(request: Request):
         
         # Store contact/context data
         if property_id:
-            # Store property context
-            property_settings[property_id] = {
-                "property_id": property_id,
-                "tenant_name": context_data.get("tenant_name", "Unknown"),
-                "unit": context_data.get("unit", "Unknown"),
-                "address": context_data.get("address", "Unknown"),
-                "property_name": context_data.get("property_name", "Unknown Property"),
-                "tenant_phone": phone,
-                "ai_enabled": True,
-                "hotline": context_data.get("hotline"),
-                "portal_url": context_data.get("portal_url")
-            }
-            
-            # Update phone to property mapping
-            phone_to_property[phone] = property_id
+            # Store property context and map the phone to it
+            tenant_directory.upsert(
+                property_id,
+                phone=phone,
+                tenant_name=context_data.get("tenant_name", "Unknown"),
+                unit=context_data.get("unit", "Unknown"),
+                address=context_data.get("address", "Unknown"),
+                property_name=context_data.get("property_name", "Unknown Property"),
+                ai_enabled=True,
+                hotline=context_data.get("hotline"),
+                portal_url=context_data.get("portal_url")
+            )
             print(f"[CONTACT] Mapped phone {phone} to property {property_id}")
         
         result = {"ok": True}
@@ -1477,10 +2056,7 @@ def get_property_context(phone: str):
     )
     
     # Get maintenance tickets for this tenant
-    tenant_tickets = []
-    for ticket in maintenance_tickets.values():
-        if ticket.tenant_phone == phone:
-            tenant_tickets.append(ticket)
+    tenant_tickets = get_tenant_tickets(phone)
     
     # Get SMS history
     sms_history = sms_messages.get(phone, [])
@@ -1505,7 +2081,7 @@ async def upsert_contact(phone: str, context: Context, send_verification: bool =
     
     # Map phone to property if property_id provided
     if property_id:
-        phone_to_property[phone] = property_id
+        tenant_directory.upsert(property_id, phone=phone, **context.model_dump(exclude={"tenant_phone"}))
         print(f"[PHONE] Mapped phone {phone} to property {property_id}")
     
     # Send verification SMS if requested
@@ -1562,7 +2138,7 @@ async def send_sms(req: SendSmsRequest):
             
             # Link phone to property if provided
             if property_id:
-                phone_to_property[req.to] = property_id
+                tenant_directory.upsert(property_id, phone=req.to)
                 print(f"[LINK] Linked phone {req.to} to property {property_id}")
             
             return {"success": True, "message_sid": message_sid}
@@ -1571,6 +2147,81 @@ async def send_sms(req: SendSmsRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error sending SMS: {str(e)}")
 
+broadcast_jobs: Dict[str, BroadcastJob] = {}  # job_id -> progress, newest last
+MAX_BROADCAST_JOBS = 50
+broadcast_pipeline = BroadcastPipeline(
+    send=send_sms_via_twilio,
+    log_batch=log_sms_batch,
+    senders=BROADCAST_FROM_NUMBERS or [TWILIO_FROM_NUMBER]
+)
+
+def select_broadcast_recipients(req: BroadcastRequest) -> List[Dict[str, Any]]:
+    """Linked tenants matching the request's filters (all filters must match), one entry per phone"""
+    property_ids = set(req.property_ids or [])
+    phones = {normalize_phone(p) for p in req.phones or []}
+    property_name = (req.property_name or "").strip().lower()
+    recipients = {}
+    for property_id, record in tenant_directory.items():
+        phone = record.tenant_phone
+        # Only phones still routed to this property
+        if not phone or tenant_directory.property_id_for(phone) != property_id:
+            continue
+        if property_ids and property_id not in property_ids:
+            continue
+        if phones and phone not in phones:
+            continue
+        if property_name and (record.property_name or "").strip().lower() != property_name:
+            continue
+        recipients[phone] = record.context(phone=phone)
+    return list(recipients.values())
+
+@app.post("/sms/broadcast")
+async def broadcast_sms(req: BroadcastRequest):
+    """
+    Text every tenant matching a property/tenant filter from one template
+    Sends run in the background; poll /sms/broadcast/{job_id} for progress and failures
+    """
+    if not (req.property_ids or req.property_name or req.phones):
+        raise HTTPException(status_code=400, detail="Provide property_ids, property_name or phones")
+    try:
+        template = validate_template(req.template)
+    except TemplateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    recipients = select_broadcast_recipients(req)
+    messages = [{"phone": r["tenant_phone"], "body": render_template(template, r)} for r in recipients]
+    description = {"property_ids": req.property_ids, "property_name": req.property_name,
+                   "phones": len(req.phones or [])}
+    if req.dry_run:
+        return {"recipients": len(messages), "preview": messages[:5], **description}
+    
+    job = BroadcastJob(description, total=len(messages))
+    broadcast_jobs[job.id] = job
+    while len(broadcast_jobs) > MAX_BROADCAST_JOBS:
+        broadcast_jobs.pop(next(iter(broadcast_jobs)))
+    spawn_background_job(broadcast_pipeline.run(job, messages))
+    record_data_flow_event(
+        direction="outbound",
+        type="communication",
+        status="pending",
+        details={"kind": "broadcast", "job_id": job.id, "recipients": len(messages)}
+    )
+    print(f"[BROADCAST] {job.id} queued for {len(messages)} tenants")
+    return job.to_dict()
+
+@app.get("/sms/broadcast/{job_id}")
+def get_broadcast(job_id: str):
+    """Progress and failures of a broadcast"""
+    job = broadcast_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return job.to_dict()
+
+@app.get("/sms/broadcasts")
+def list_broadcasts():
+    """Recent broadcasts, newest first"""
+    return [job.to_dict() for job in reversed(list(broadcast_jobs.values()))]
+
 @app.post("/sms/verification/{phone}")
 async def send_verification_sms(phone: str, context: Context):
     """Send verification SMS to new tenant introducing Esto"""
@@ -1598,38 +2249,75 @@ async def send_verification_sms(phone: str, context: Context):
 @app.get("/properties/{property_id}/settings")
 def get_property_settings(property_id: str):
     """Get property settings"""
-    return property_settings.get(property_id, PropertySettings())
+    record = tenant_directory.get(property_id)
+    return PropertySettings(**record.settings()) if record else PropertySettings()
 
 @app.post("/properties/{property_id}/settings")
 def update_property_settings_post_settings(property_id: str, settings: PropertySettings):
     """Update property settings"""
-    property_settings[property_id] = settings
+    tenant_directory.upsert(property_id, **settings.model_dump())
     return {"success": True, "settings": settings}
 
+@app.get("/properties/{property_id}/priority-keywords")
+def get_priority_keywords(property_id: str):
+    """Get the extra priority keywords configured for a property"""
+    return {"property_id": property_id, "keywords": priority_classifier.get_property_keywords(property_id)}
+
+@app.put("/properties/{property_id}/priority-keywords")
+def update_priority_keywords(property_id: str, keywords: Dict[str, List[str]]):
+    """Set extra critical/high keywords for a property (added on top of the defaults)"""
+    effective = priority_classifier.set_property_keywords(property_id, keywords)
+    print(f"[OK] Updated priority keywords for property {property_id}")
+    return {"success": True, "property_id": property_id, "effective_keywords": effective}
+
 @app.get("/debug/phone-mappings")
 def get_phone_mappings():
     """Debug endpoint to see current phone mappings"""
     return {
-        "phone_to_property": phone_to_property,
-        "property_settings": {k: {"ai_enabled": v.ai_enabled, "auto_reply": v.auto_reply} for k, v in property_settings.items()}
+        "phone_to_property": tenant_directory.phone_mappings(),
+        "property_settings": {k: {"ai_enabled": v.ai_enabled, "auto_reply": v.auto_reply} for k, v in tenant_directory.items()}
     }
 
 @app.post("/debug/map-phone")
 def map_phone_to_property(phone: str, property_id: str):
     """Debug endpoint to manually map a phone to a property"""
-    phone = phone.strip()
-    phone_to_property[phone] = property_id
-    
-    # Set up default property settings
-    property_settings[property_id] = PropertySettings(
-        ai_enabled=True,
-        auto_reply=True,
-        verification_sent=False
-    )
+    # Link the phone and reset to default property settings
+    tenant_directory.upsert(property_id, phone=phone, **PropertySettings().model_dump())
     
     return {"ok": True, "message": f"Mapped {phone} to property {property_id}"}
 
 # ------------------ Twilio Integration ------------------
+def build_sms_context(phone: str) -> Context:
+    """
+    Tenant context for an inbound SMS: the directory entry for the phone joined with the
+    synced PMS tenant and their current lease (unit, rent, lease end); both lookups are O(1)
+    """
+    record = tenant_directory.lookup(phone)
+    pms_tenant, lease = pms_index.lookup(phone)
+    if record:
+        context = record.context(phone=phone)
+        print(f"[HOME] Found property context for {phone}: {record.property_id}")
+    elif pms_tenant:
+        context = {"tenant_name": pms_tenant.name, "unit": pms_tenant.unit, "address": "Unknown",
+                   "property_name": pms_tenant.property_name, "tenant_phone": phone}
+    else:
+        print(f"[WARNING] No property mapping found for {phone}, using generic context")
+        return Context(
+            tenant_name="Tenant",
+            unit="Unknown",
+            address="Unknown",
+            tenant_phone=phone,
+            property_name="Unknown Property"
+        )
+    
+    if lease:
+        if context.get("unit") in (None, "", "Unknown") and lease.unit:
+            context["unit"] = lease.unit
+        context["rent_amount"] = lease.rent_amount or None
+        context["lease_end"] = lease.end_date or None
+        print(f"[PMS] Joined lease {lease.id} for {phone}: rent={lease.rent_amount}, ends={lease.end_date}")
+    return Context(**context)
+
 @app.api_route("/sms", methods=["GET", "POST"])
 async def receive_sms(request: Request):
     """Twilio webhook endpoint for incoming SMS"""
@@ -1673,36 +2361,11 @@ async def receive_sms(request: Request):
     ai_reply = None
     try:
         # Get actual property settings for this phone number
-        settings = get_property_settings_by_phone(from_number)
+        settings = tenant_directory.settings_for(from_number)
         print(f"[SETTINGS] Property settings for {from_number}: AI={settings.ai_enabled}, Auto-reply={settings.auto_reply}")
         
         if settings.ai_enabled and settings.auto_reply:
-            # Get tenant context - try to find actual property info
-            property_id = phone_to_property.get(from_number)
-            print(f"[SEARCH] Looking up property for phone {from_number}: {property_id}")
-            print(f"[SEARCH] Available phone mappings: {list(phone_to_property.keys())}")
-            
-            if property_id:
-                # Try to get actual property info from property_settings
-                property_info = property_settings.get(property_id, {})
-                tenant_context = Context(
-                    tenant_name=property_info.get("tenant_name", "Tenant"),
-                    unit=property_info.get("unit", "Unknown"),
-                    address=property_info.get("address", "Unknown"),
-                    tenant_phone=from_number,
-                    property_name=property_info.get("property_name", f"Property {property_id}")
-                )
-                print(f"[HOME] Found property context for {from_number}: {property_id}")
-            else:
-                # Fallback to generic context
-                tenant_context = Context(
-                    tenant_name="Tenant",
-                    unit="Unknown",
-                    address="Unknown",
-                    tenant_phone=from_number,
-                    property_name="Unknown Property"
-                )
-                print(f"[WARNING] No property mapping found for {from_number}, using generic context")
+            tenant_context = build_sms_context(from_number)
             
             # Process media URLs if present
             media_urls = []
@@ -1760,9 +2423,10 @@ async def receive_sms(request: Request):
         return "<?xml version=\"1.0\" encoding=\"UTF-8\"?><Response></Response>"
 
 # ------------------ Data Flow Tracking ------------------
-data_flow_events = []
-pms_tenants = []  # Tenants synced from PMS
-pms_leases = []   # Leases synced from PMS
+data_flow_events = EventLog()  # bounded buffer + counters; older events spill to disk
+pms_tenants = {}  # tenant_id -> PMSTenant synced from the PMS
+pms_leases = {}   # lease_id -> PMSLease synced from the PMS
+lease_expiry_index = LeaseExpiryIndex()  # end date -> lease_id, sorted for range queries
 
 class DataFlowEvent(BaseModel):
     id: str
@@ -1794,137 +2458,255 @@ class PMSLease(BaseModel):
     synced_at: str
     status: str  # "active", "pending", "expired"
 
-def generate_mock_data_flow():
-    """Generate mock data flow events for demonstration"""
-    global data_flow_events, pms_tenants, pms_leases
-    
-    # Generate mock tenants
-    mock_tenant_names = [
-        ("John Smith", "101", "Sunset Apartments"),
-        ("Sarah Johnson", "202", "Sunset Apartments"),
-        ("Michael Brown", "303", "Riverside Complex"),
-        ("Emily Davis", "104", "Riverside Complex"),
-        ("David Wilson", "205", "Oak Street Residences"),
-    ]
-    
-    pms_tenants = []
-    for i, (name, unit, prop) in enumerate(mock_tenant_names):
+def record_data_flow_event(direction: str, type: str, status: str, details: Dict[str, Any]) -> DataFlowEvent:
+    """Create a data flow event and add it to the event log"""
+    event = DataFlowEvent(
+        id=f"EVT{uuid.uuid4().hex[:8]}",
+        timestamp=datetime.now().isoformat(),
+        direction=direction,
+        type=type,
+        status=status,
+        details=details
+    )
+    data_flow_events.add(event.model_dump())
+    return event
+
+def apply_pms_tenants(resource: str, records: List[Dict[str, Any]]):
+    """Store a page of PMS tenants and upsert them into the tenant directory in one batch"""
+    synced_at = datetime.now().isoformat()
+    rows = []
+    tenants = []
+    for record in records:
         tenant = PMSTenant(
-            id=f"TNT{1000 + i}",
-            name=name,
-            unit=unit,
-            property_name=prop,
-            phone=f"+1555000{1000 + i}",
-            email=f"{name.lower().replace(' ', '.')}@email.com",
-            synced_at=datetime.now().isoformat(),
-            status="active"
+            id=str(record["id"]),
+            name=record.get("name", ""),
+            unit=record.get("unit", ""),
+            property_name=record.get("property_name", ""),
+            phone=normalize_phone(record.get("phone")),
+            email=record.get("email", ""),
+            synced_at=synced_at,
+            status=record.get("status", "active")
         )
-        pms_tenants.append(tenant)
-        
-        data_flow_events.append(DataFlowEvent(
-            id=f"EVT{uuid.uuid4().hex[:8]}",
-            timestamp=datetime.now().isoformat(),
-            direction="inbound",
-            type="tenant",
-            status="success",
-            details={
-                "tenant_id": tenant.id,
+        pms_tenants[tenant.id] = tenant
+        tenants.append(tenant)
+        linked_to = tenant_directory.property_id_for(tenant.phone)
+        if linked_to and not is_pms_property(linked_to):
+            # A frontend-managed property owns this phone (and its AI/hotline settings); the PMS data
+            # still reaches the SMS context through pms_index
+            continue
+        if tenant.phone and tenant.status != "inactive":
+            rows.append((pms_property_id(tenant.id), tenant.phone, {
                 "tenant_name": tenant.name,
                 "unit": tenant.unit,
-                "property": tenant.property_name
-            }
-        ))
-    
-    # Generate mock leases
-    pms_leases = []
-    for i, tenant in enumerate(pms_tenants):
+                "property_name": tenant.property_name
+            }))
+    tenant_directory.upsert_many(rows)
+    pms_index.add_tenants(tenants)
+
+def apply_pms_leases(resource: str, records: List[Dict[str, Any]]):
+    """Store a page of PMS leases and index each tenant's current lease"""
+    synced_at = datetime.now().isoformat()
+    leases = []
+    for record in records:
+        tenant = pms_tenants.get(str(record.get("tenant_id")))
         lease = PMSLease(
-            id=f"LSE{2000 + i}",
-            tenant_id=tenant.id,
-            tenant_name=tenant.name,
-            unit=tenant.unit,
-            property_name=tenant.property_name,
-            start_date="2024-01-01",
-            end_date="2025-12-31",
-            rent_amount=1200.0 + (i * 100),
-            synced_at=datetime.now().isoformat(),
-            status="active"
+            id=str(record["id"]),
+            tenant_id=str(record.get("tenant_id", "")),
+            tenant_name=record.get("tenant_name") or (tenant.name if tenant else ""),
+            unit=record.get("unit") or (tenant.unit if tenant else ""),
+            property_name=record.get("property_name") or (tenant.property_name if tenant else ""),
+            start_date=record.get("start_date", ""),
+            end_date=record.get("end_date", ""),
+            rent_amount=float(record.get("rent_amount") or 0),
+            synced_at=synced_at,
+            status=record.get("status", "active")
         )
-        pms_leases.append(lease)
-        
-        data_flow_events.append(DataFlowEvent(
-            id=f"EVT{uuid.uuid4().hex[:8]}",
-            timestamp=datetime.now().isoformat(),
-            direction="inbound",
-            type="lease",
-            status="success",
-            details={
-                "lease_id": lease.id,
-                "tenant_name": lease.tenant_name,
-                "unit": lease.unit,
-                "rent_amount": lease.rent_amount
-            }
-        ))
+        pms_leases[lease.id] = lease
+        leases.append(lease)
+        if lease.status == "expired":
+            lease_expiry_index.remove(lease.id)
+        else:
+            lease_expiry_index.upsert(lease.id, lease.end_date)
+    pms_index.add_leases(leases)
+
+def record_pms_batch(resource: str, page: int, count: int, status: str, details: Dict[str, Any]):
+    """One data flow event per synced page, not per record"""
+    record_data_flow_event(
+        direction="inbound",
+        type="tenant" if resource == "tenants" else "lease",
+        status=status,
+        details={"resource": resource, "page": page, "records": count, **details}
+    )
+
+pms_sync_engine = PMSSyncEngine(
+    HttpPMSAdapter(),
+    handlers={"tenants": apply_pms_tenants, "leases": apply_pms_leases},
+    on_batch=record_pms_batch
+)
+
+async def pms_sync_loop():
+    """Run the PMS sync on a fixed interval (nightly by default)"""
+    while True:
+        await pms_sync_engine.run()
+        await asyncio.sleep(PMS_SYNC_INTERVAL_HOURS * 3600)
+
+@app.on_event("startup")
+async def start_pms_sync():
+    if PMS_BASE_URL and PMS_SYNC_INTERVAL_HOURS > 0:
+        print(f"[PMS] Scheduling PMS sync every {PMS_SYNC_INTERVAL_HOURS}h from {PMS_BASE_URL}")
+        spawn_background_job(pms_sync_loop())
+    if LEASE_RENEWAL_CHECK_HOURS > 0:
+        print(f"[LEASE] Checking for lease renewal reminders every {LEASE_RENEWAL_CHECK_HOURS}h")
+        spawn_background_job(lease_renewal_loop())
+
+async def send_renewal_batch(property_name: str, reminders: List[Dict[str, Any]]) -> List[str]:
+    """Text and email one property's renewal reminders; returns the keys that reached the tenant"""
+    from backend_modules.agentmail_service import get_agentmail_client, get_lease_renewal_email_template
     
-    # Generate mock outbound communications
-    for i in range(8):
-        data_flow_events.append(DataFlowEvent(
-            id=f"EVT{uuid.uuid4().hex[:8]}",
-            timestamp=datetime.now().isoformat(),
-            direction="outbound",
-            type="communication",
-            status="success",
-            details={
-                "message_type": "sms" if i % 2 == 0 else "email",
-                "recipient": pms_tenants[i % len(pms_tenants)].name,
-                "subject": "Maintenance Update" if i % 3 == 0 else "Rent Reminder"
-            }
-        ))
+    agentmail_client = get_agentmail_client()
+    semaphore = asyncio.Semaphore(RENEWAL_SEND_CONCURRENCY)
     
-    # Generate mock outbound payments
-    for i in range(5):
-        data_flow_events.append(DataFlowEvent(
-            id=f"EVT{uuid.uuid4().hex[:8]}",
-            timestamp=datetime.now().isoformat(),
-            direction="outbound",
-            type="payment",
-            status="success",
-            details={
-                "payment_id": f"PAY{3000 + i}",
-                "tenant_name": pms_tenants[i % len(pms_tenants)].name,
-                "amount": 1200.0 + (i * 100),
-                "method": "ACH"
-            }
-        ))
+    async def send_one(reminder: Dict[str, Any]) -> Optional[str]:
+        lease = reminder["lease"]
+        tenant = pms_tenants.get(lease.tenant_id)
+        if tenant is None:
+            return None
+        name = tenant.name or lease.tenant_name or "there"
+        delivered = False
+        # Errors are caught per channel so one failure can't lose the keys of reminders that were already sent
+        async with semaphore:
+            if tenant.phone:
+                body = (f"Hi {name}, your lease for unit {lease.unit} at {property_name} ends on {lease.end_date} "
+                        f"({reminder['days_left']} days). Reply here if you'd like to renew or have questions.")
+                try:
+                    sid = await send_sms_via_twilio(tenant.phone, body)
+                    if sid:
+                        log_sms(tenant.phone, "outbound", body, tenant.phone, TWILIO_FROM_NUMBER, sid)
+                        delivered = True
+                except Exception as e:
+                    print(f"[ERROR] Renewal SMS for lease {lease.id} failed: {e}")
+            if tenant.email:
+                try:
+                    subject, email_body = get_lease_renewal_email_template(
+                        name, property_name, lease.unit, lease.end_date, reminder["days_left"]
+                    )
+                    email_result = await agentmail_client.send_email(to=tenant.email, subject=subject, body=email_body)
+                    delivered = delivered or email_result.get("success", False)
+                except Exception as e:
+                    print(f"[ERROR] Renewal email for lease {lease.id} failed: {e}")
+        return reminder["key"] if delivered else None
+    
+    results = await asyncio.gather(*(send_one(r) for r in reminders), return_exceptions=True)
+    keys = [key for key in results if isinstance(key, str)]
+    record_data_flow_event(
+        direction="outbound",
+        type="communication",
+        status="success" if len(keys) == len(reminders) else "failed",
+        details={"kind": "lease_renewal", "property_name": property_name,
+                 "reminders": len(reminders), "delivered": len(keys)}
+    )
+    print(f"[LEASE] Sent {len(keys)}/{len(reminders)} renewal reminders for {property_name}")
+    return keys
+
+renewal_scheduler = RenewalScheduler(lease_expiry_index, pms_leases.get, send_renewal_batch)
 
-generate_mock_data_flow()
+async def lease_renewal_loop():
+    """Send due renewal reminders on a fixed interval, after any PMS sync in progress has landed"""
+    while True:
+        while pms_sync_engine.running:
+            await asyncio.sleep(5)
+        try:
+            await renewal_scheduler.run()
+        except Exception as e:
+            print(f"[ERROR] Lease renewal check failed: {e}")
+        await asyncio.sleep(LEASE_RENEWAL_CHECK_HOURS * 3600)
+
+@app.get("/api/leases/expiring")
+def get_expiring_leases(days: int = 60):
+    """Leases ending within the next `days` days, soonest first"""
+    today = datetime.now().date()
+    leases = []
+    for end, lease_id in lease_expiry_index.expiring_within(days, today):
+        lease = pms_leases.get(lease_id)
+        if lease is not None:
+            leases.append({**lease.model_dump(), "days_left": (end - today).days})
+    return {"days": days, "count": len(leases), "leases": leases}
+
+@app.post("/api/leases/renewal-reminders/run")
+async def run_renewal_reminders(dry_run: bool = False):
+    """Send due renewal reminders now (dry_run=true only reports what is due, per property)"""
+    return await renewal_scheduler.run(dry_run=dry_run)
+
+@app.get("/api/leases/renewal-reminders/status")
+def get_renewal_reminder_status():
+    """Reminder offsets, index size and the result of the last reminder run"""
+    return {
+        "offsets_days": renewal_scheduler.offsets,
+        "indexed_leases": len(lease_expiry_index),
+        "reminders_sent": len(renewal_scheduler.sent),
+        "last_run": renewal_scheduler.last_run
+    }
+
+@app.post("/api/pms/sync")
+async def trigger_pms_sync(full: bool = False):
+    """Start a PMS sync now (full=true ignores the updated_since cursors)"""
+    if not PMS_BASE_URL:
+        raise HTTPException(status_code=400, detail="PMS_BASE_URL not configured")
+    if pms_sync_engine.running:
+        return {"success": False, "error": "Sync already running"}
+    if full:
+        pms_sync_engine.reset_cursors()
+    spawn_background_job(pms_sync_engine.run())
+    return {"success": True, "message": "PMS sync started", "full": full}
+
+@app.get("/api/pms/sync/status")
+def get_pms_sync_status():
+    """Current PMS sync cursors and the result of the last run"""
+    return {
+        "configured": bool(PMS_BASE_URL),
+        "running": pms_sync_engine.running,
+        "cursors": pms_sync_engine.cursors,
+        "last_run": pms_sync_engine.last_run,
+        "tenants": len(pms_tenants),
+        "leases": len(pms_leases)
+    }
 
 @app.get("/api/data-flow/events")
-async def get_data_flow_events():
-    """Get all data flow events"""
-    return {"events": [e.model_dump() for e in data_flow_events]}
+async def get_data_flow_events(cursor: Optional[int] = None, limit: int = 100, direction: Optional[str] = None,
+                               type: Optional[str] = None, status: Optional[str] = None):
+    """Get data flow events, newest first (pass next_cursor back as cursor for older events)"""
+    events, next_cursor = data_flow_events.page(
+        before=cursor, limit=max(1, min(limit, 500)), direction=direction, type=type, status=status
+    )
+    return {"events": events, "next_cursor": next_cursor}
 
 @app.get("/api/data-flow/stats")
 async def get_data_flow_stats():
     """Get data flow statistics"""
-    inbound_events = [e for e in data_flow_events if e.direction == "inbound"]
-    outbound_events = [e for e in data_flow_events if e.direction == "outbound"]
+    total = data_flow_events.count("total")
     
     return {
-        "total_events": len(data_flow_events),
+        "total_events": total,
         "inbound": {
-            "total": len(inbound_events),
-            "tenants": len([e for e in inbound_events if e.type == "tenant"]),
-            "leases": len([e for e in inbound_events if e.type == "lease"])
+            "total": data_flow_events.count("direction", "inbound"),
+            "tenants": data_flow_events.count("inbound", "tenant"),
+            "leases": data_flow_events.count("inbound", "lease")
         },
         "outbound": {
-            "total": len(outbound_events),
-            "communications": len([e for e in outbound_events if e.type == "communication"]),
-            "payments": len([e for e in outbound_events if e.type == "payment"])
+            "total": data_flow_events.count("direction", "outbound"),
+            "communications": data_flow_events.count("outbound", "communication"),
+            "payments": data_flow_events.count("outbound", "payment")
         },
-        "success_rate": len([e for e in data_flow_events if e.status == "success"]) / len(data_flow_events) * 100 if data_flow_events else 0
+        "success_rate": data_flow_events.count("status", "success") / total * 100 if total else 0
     }
 
+@app.get("/api/data-flow/rollups")
+async def get_data_flow_rollups(granularity: str = "minute", limit: int = 60):
+    """Per-minute or per-hour event counts (total, by direction and by status)"""
+    if granularity not in ("minute", "hour"):
+        raise HTTPException(status_code=400, detail="granularity must be 'minute' or 'hour'")
+    return {"granularity": granularity, "buckets": data_flow_events.rollups(granularity, limit=max(1, min(limit, 1440)))}
+
 # ------------------ Tenant Application Endpoints ------------------
 @app.post("/api/tenant-applications/process-documents")
 async def process_tenant_documents_endpoint(request: dict):
@@ -2077,7 +2859,7 @@ async def run_background_check_endpoint(application_id: str, request: Request):
 async def send_rejection_email_endpoint(application_id: str, request: dict):
     """Send rejection email to applicant"""
     try:
-        from backend_modules.agentmail_service import AgentmailClient, get_rejection_email_template
+        from backend_modules.agentmail_service import get_agentmail_client, get_rejection_email_template
         
         applicant_name = request.get("applicantName", "")
         applicant_email = request.get("applicantEmail", "")
@@ -2086,7 +2868,7 @@ async def send_rejection_email_endpoint(application_id: str, request: dict):
         if not applicant_email:
             raise HTTPException(status_code=400, detail="applicantEmail is required")
         
-        agentmail_client = AgentmailClient()
+        agentmail_client = get_agentmail_client()
         subject, body = get_rejection_email_template(applicant_name, property_name)
         
         email_result = await agentmail_client.send_email(
@@ -2128,64 +2910,49 @@ async def find_best_applicant_endpoint(property_id: str, request: dict):
             raise HTTPException(status_code=400, detail="userId is required")
         
         # Step 1: Fetch applications from database via frontend API
-        frontend_url = os.getenv("FRONTEND_ORIGIN", "http://localhost:3000")
-        service_token = os.getenv("APPLICATION_SERVICE_TOKEN", "")
-        
         applicants_data = []
         
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                # Fetch all applications for this user
-                api_url = f"{frontend_url}/api/applications/internal"
-                headers = {
-                    "Authorization": f"Bearer {service_token}",
-                    "Content-Type": "application/json"
-                }
+            all_applications = await fetch_user_applications(user_id, use_cache=False)
+            
+            # Filter by property_id and optionally by application_ids
+            for app in all_applications:
+                app_property_id = app.get("propertyId")
+                app_id = app.get("id")
                 
-                # First, get all applications for the user
-                response = await client.get(api_url, headers=headers, params={"userId": user_id})
-                response.raise_for_status()
-                result = response.json()
-                all_applications = result.get("applications", [])
+                # Filter by property if specified
+                if property_id and app_property_id != property_id:
+                    continue
                 
-                # Filter by property_id and optionally by application_ids
-                for app in all_applications:
-                    app_property_id = app.get("propertyId")
-                    app_id = app.get("id")
-                    
-                    # Filter by property if specified
-                    if property_id and app_property_id != property_id:
+                # Filter by application IDs if specified
+                if application_ids and len(application_ids) > 0:
+                    if app_id not in application_ids:
                         continue
-                    
-                    # Filter by application IDs if specified
-                    if application_ids and len(application_ids) > 0:
-                        if app_id not in application_ids:
-                            continue
-                    
-                    # Calculate income ratio if rent and income provided
-                    monthly_income = app.get("monthlyIncome")
-                    income_ratio = None
-                    if property_rent and monthly_income:
-                        income_ratio = monthly_income / property_rent
-                    
-                    applicants_data.append({
-                        "application_id": app_id,
-                        "applicant_name": app.get("applicantName", "Unknown"),
-                        "applicant_email": app.get("applicantEmail", ""),
-                        "applicant_phone": app.get("applicantPhone"),
-                        "credit_score": app.get("creditScore"),
-                        "monthly_income": monthly_income,
-                        "annual_income": app.get("annualIncome"),
-                        "income_ratio": income_ratio,
-                        "screening_score": app.get("screeningScore"),
-                        "status": app.get("status", "pending"),
-                        "employer_name": app.get("employerName"),
-                        "screening_notes": app.get("screeningNotes"),
-                        "background_check": app.get("backgroundCheckResult"),
-                        "email_body": app.get("emailBody", "")[:500] if app.get("emailBody") else None,
-                        "received_at": app.get("receivedAt")
-                    })
-                    
+                
+                # Calculate income ratio if rent and income provided
+                monthly_income = app.get("monthlyIncome")
+                income_ratio = None
+                if property_rent and monthly_income:
+                    income_ratio = monthly_income / property_rent
+                
+                applicants_data.append({
+                    "application_id": app_id,
+                    "applicant_name": app.get("applicantName", "Unknown"),
+                    "applicant_email": app.get("applicantEmail", ""),
+                    "applicant_phone": app.get("applicantPhone"),
+                    "credit_score": app.get("creditScore"),
+                    "monthly_income": monthly_income,
+                    "annual_income": app.get("annualIncome"),
+                    "income_ratio": income_ratio,
+                    "screening_score": app.get("screeningScore"),
+                    "status": app.get("status", "pending"),
+                    "employer_name": app.get("employerName"),
+                    "screening_notes": app.get("screeningNotes"),
+                    "background_check": app.get("backgroundCheckResult"),
+                    "email_body": app.get("emailBody", "")[:500] if app.get("emailBody") else None,
+                    "received_at": app.get("receivedAt")
+                })
+                
         except Exception as e:
             print(f"⚠️ Error fetching applications from database: {e}")
             return {
@@ -2339,6 +3106,39 @@ Return ONLY valid JSON, no other text. You must select exactly ONE bestApplicant
         raise HTTPException(status_code=500, detail=f"Error finding best applicant: {str(e)}")
 
 # ------------------ Agentmail Inbox Monitoring ------------------
+async def run_agentmail_webhook(payload: Dict[str, Any]) -> None:
+    """
+    Webhook queue handler: process one delivery on the app loop
+    handle_agentmail_webhook reports failures in its result instead of raising, so they're re-raised
+    here for the queue to count them as failed rather than processed
+    """
+    from backend_modules.webhook_handler import handle_agentmail_webhook
+    
+    event_id = payload.get("event_id", "unknown")
+    result = await handle_agentmail_webhook(payload)
+    if not result.get("success"):
+        raise RuntimeError(f"webhook event {event_id}: {result.get('error') or 'processing failed'}")
+    print(f"✅ Successfully processed webhook event {event_id}")
+
+agentmail_webhook_queue = AsyncJobQueue(
+    "agentmail-webhooks", run_agentmail_webhook,
+    workers=AGENTMAIL_WEBHOOK_WORKERS, max_size=AGENTMAIL_WEBHOOK_QUEUE_SIZE
+)
+
+@app.on_event("shutdown")
+async def close_agentmail_connections():
+    from backend_modules.agentmail_service import close_agentmail_client
+    from backend_modules.document_text import shutdown_pdf_pool
+    # Finish webhooks already accepted before their connections go away
+    await agentmail_webhook_queue.drain(WEBHOOK_DRAIN_TIMEOUT_SECONDS)
+    await close_agentmail_client()
+    shutdown_pdf_pool()
+
+@app.get("/api/agentmail/webhook/queue")
+async def agentmail_webhook_queue_stats():
+    """Depth, throughput and wait times of the webhook worker queue"""
+    return agentmail_webhook_queue.stats()
+
 
 @app.post("/api/agentmail/check-inbox")
 async def check_agentmail_inbox(request: Request, background_tasks: BackgroundTasks):
@@ -2349,60 +3149,66 @@ async def check_agentmail_inbox(request: Request, background_tasks: BackgroundTa
         # Get user_id from request body if provided (from frontend)
         body = await request.json() if request.headers.get("content-type") == "application/json" else {}
         user_id = body.get("userId") or os.getenv("DEFAULT_USER_ID", "default_user")
+        # Scans are incremental; fullScan=true re-walks the whole inbox
+        full_scan = bool(body.get("fullScan", False))
         
         print(f"📬 Checking inbox for user_id: {user_id}")
         
         # Run in background with user_id
-        background_tasks.add_task(monitor_inbox, user_id=user_id)
+        background_tasks.add_task(monitor_inbox, user_id=user_id, full_scan=full_scan)
         
-        return {"success": True, "message": "Inbox check initiated", "user_id": user_id}
+        return {"success": True, "message": "Inbox check initiated", "user_id": user_id, "full_scan": full_scan}
     except Exception as e:
         print(f"Error checking inbox: {e}")
         raise HTTPException(status_code=500, detail=f"Error checking inbox: {str(e)}")
 
+inbox_summary_refresh: Optional[asyncio.Task] = None  # the one background re-read of the inbox, if running
+
+async def refresh_inbox_summary(inbox_id: str):
+    """Background: re-read the inbox listing into the summary, then fill in unread counts from full fetches"""
+    from backend_modules.agentmail_service import get_agentmail_client, thread_updated_at
+    
+    agentmail_client = get_agentmail_client()
+    try:
+        async for threads in agentmail_client.iter_threads(inbox_id=inbox_id):
+            # Full fetches (concurrent, cache-backed) fill in the unread counts
+            await agentmail_client.get_threads(
+                [t.get("thread_id") or t.get("id") for t in threads],
+                updated_at={t.get("thread_id") or t.get("id"): thread_updated_at(t) for t in threads}
+            )
+        print(f"📬 Inbox summary refreshed ({len(agentmail_client.inbox_summary)} threads)")
+    except Exception as e:
+        print(f"❌ Error refreshing inbox summary: {e}")
+
 @app.get("/api/agentmail/inbox-status")
-async def get_inbox_status():
-    """Check Agentmail inbox status - shows if emails have been received"""
+async def get_inbox_status(page: int = 1, page_size: int = 10, refresh: bool = False):
+    """
+    Check Agentmail inbox status - shows if emails have been received
+    Served from the in-memory inbox summary that webhooks and scans keep current, so it makes no
+    Agentmail calls. refresh=true (or a summary nothing has seeded yet) starts a background re-read
+    and returns what is there now; "seeded": false means the listing isn't complete yet
+    """
+    global inbox_summary_refresh
     try:
-        from backend_modules.agentmail_service import AgentmailClient
+        from backend_modules.agentmail_service import get_agentmail_client
         
-        agentmail_client = AgentmailClient()
+        agentmail_client = get_agentmail_client()
+        summary = agentmail_client.inbox_summary
         
         inbox_id = os.getenv("AGENTMAIL_INBOX_ID", "")
         
-        # Get all threads from Agentmail
-        threads = await agentmail_client.list_threads(inbox_id=inbox_id)
-        
-        # Get details for first few threads
-        thread_details = []
-        for thread in threads[:10]:  # Limit to first 10
-            thread_id = thread.get("thread_id") or thread.get("id")
-            subject = thread.get("subject", "No subject")
-            
-            # Get full thread with messages
-            full_thread = await agentmail_client.get_thread(thread_id)
-            if full_thread:
-                messages = full_thread.get("messages", [])
-                unread_count = len([m for m in messages if not m.get("read", False)])
-                
-                # Get first message details
-                first_msg = messages[0] if messages else {}
-                sender = first_msg.get("from", "") or (first_msg.get("from_", [""])[0] if first_msg.get("from_") else "")
-                
-                thread_details.append({
-                    "thread_id": thread_id,
-                    "subject": subject,
-                    "message_count": len(messages),
-                    "unread_count": unread_count,
-                    "sender": sender,
-                    "last_updated": first_msg.get("date") or first_msg.get("created_at")
-                })
+        refreshing = inbox_summary_refresh is not None and not inbox_summary_refresh.done()
+        if (refresh or not summary.seeded) and not refreshing:
+            inbox_summary_refresh = spawn_background_job(refresh_inbox_summary(inbox_id))
+            refreshing = True
         
         return {
             "success": True,
             "inbox_id": inbox_id,
-            "total_threads": len(threads),
-            "threads": thread_details,
+            "seeded": summary.seeded,
+            "refreshing": refreshing,
+            **summary.page(max(page, 1), min(max(page_size, 1), 100)),
+            "thread_cache": agentmail_client.thread_cache.stats(),
             "webhook_configured": True  # Assuming it is if they're asking
         }
     except Exception as e:
@@ -2418,7 +3224,8 @@ async def agentmail_webhook(request: Request, background_tasks: BackgroundTasks)
     Receives real-time notifications when new emails arrive
     
     This endpoint immediately returns 200 OK to acknowledge receipt,
-    then processes the webhook payload in the background.
+    then processes the webhook payload on the webhook worker queue
+    (503 with Retry-After when the queue is full).
     """
     try:
         payload = await request.json()
@@ -2451,29 +3258,10 @@ async def agentmail_webhook(request: Request, background_tasks: BackgroundTasks)
         event_id = payload.get("event_id", "unknown")
         print(f"📬 Received Agentmail webhook event {event_id} (type: {event_type or payload.get('event_type')})")
         
-        # Process webhook in background to avoid timeouts
-        from backend_modules.webhook_handler import handle_agentmail_webhook
-        
-        def process_webhook_sync():
-            """Wrapper to run async function in background task"""
-            import asyncio
-            try:
-                # Create new event loop for background task
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                result = loop.run_until_complete(handle_agentmail_webhook(payload))
-                if result.get("success"):
-                    print(f"✅ Successfully processed webhook event {event_id}")
-                else:
-                    print(f"❌ Failed to process webhook: {result.get('error')}")
-                loop.close()
-            except Exception as e:
-                print(f"❌ Error in background webhook processing: {e}")
-                import traceback
-                traceback.print_exc()
-        
-        # Run processing in background
-        background_tasks.add_task(process_webhook_sync)
+        # Hand off to the webhook workers; the message ledger makes Agentmail's retry of a rejected delivery safe
+        if not agentmail_webhook_queue.submit(payload):
+            return JSONResponse(status_code=503, content={"success": False, "error": "Webhook queue is full, retry later"},
+                                headers={"Retry-After": "30"})
         
         # Return 200 immediately to acknowledge receipt
         return {"success": True, "message": "Webhook received and processing"}
@@ -0,0 +1,45 @@
+import pytest
+
+from backend_modules.document_text import DOCUMENT_FIELD_CONFIDENCE, best_pay_stub, extract_pay_stub_fields
+
+
+@pytest.mark.parametrize("text, gross", [
+    ("Gross Pay: $1,600.00", 1600.0),
+    ("Gross Pay for 2 weeks: 3,200.00", 3200.0),
+    ("Gross wages (40 hrs): $1,600.00", 1600.0),
+    ("Gross earnings for period ending 2024-01-14 were 3,200.00, net 2,500.00", 3200.0),
+    ("YTD Gross: 41,600.00\nGross Pay: 1,600.00", 1600.0),
+    ("Gross Pay 3,200.00 YTD 41,600.00", 3200.0),
+    ("Hours Current YTD\nGross Pay 80.00 3,200.00 6,400.00", 3200.0),
+])
+def test_gross_pay_is_the_current_period_amount(text, gross):
+    assert extract_pay_stub_fields(text)[0]["grossIncome"] == gross
+
+
+@pytest.mark.parametrize("text", [
+    "YTD Gross: 41,600.00",
+    "Year-to-date gross 50,000.00",
+    "Gross pay 01/14/2024",
+    "Gross Pay for 2 weeks",
+])
+def test_no_gross_pay(text):
+    assert "grossIncome" not in extract_pay_stub_fields(text)[0]
+
+
+def test_unlabeled_columns_fall_below_threshold():
+    text = "Employer: Acme Corp\nPay period: 01/01/2024 - 01/14/2024\nGross Pay 80.00 3,200.00 6,400.00"
+    assert extract_pay_stub_fields(text)[1] < DOCUMENT_FIELD_CONFIDENCE
+    assert best_pay_stub([text]) is None
+
+
+def test_frequency_word_alone_needs_corroboration():
+    assert extract_pay_stub_fields("Gross Pay $2,000.00 paid biweekly")[1] < DOCUMENT_FIELD_CONFIDENCE
+    fields, confidence = extract_pay_stub_fields("Gross Pay $2,000.00 biweekly\nEmployer: Acme Corp")
+    assert confidence >= DOCUMENT_FIELD_CONFIDENCE
+    assert fields["monthlyIncome"] == pytest.approx(4333.33)
+
+
+def test_pay_period_sets_semi_monthly_frequency():
+    fields, confidence = extract_pay_stub_fields("Pay period: 01/01/2024 - 01/15/2024\nGross Pay: 2,500.00")
+    assert fields["payFrequency"] == "semi-monthly"
+    assert confidence >= DOCUMENT_FIELD_CONFIDENCE
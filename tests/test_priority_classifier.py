@@ -0,0 +1,45 @@
+import pytest
+
+from backend_modules.priority_classifier import PriorityClassifier
+
+classifier = PriorityClassifier()
+
+
+@pytest.mark.parametrize("text", [
+    "There is a fire",
+    "FIRE!!",
+    "theres a flood in my apartment",
+    "smoke everywhere",
+    "The stove is leaking gas",
+    "Sewage coming up from the drain",
+    "not sure but I smell gas",
+    "the basement is flooding",
+    "sparks from the outlet",
+    "the carbon monoxide alarm went off and I feel dizzy",
+])
+def test_hazards_are_critical(text):
+    assert classifier.classify(text)[0] == "critical"
+
+
+@pytest.mark.parametrize("text", [
+    "smoke detector battery is low",
+    "fire alarm battery needs replacing",
+    "is there a fire drill tomorrow?",
+    "carbon monoxide detector needs a battery",
+    "when is the gas bill due?",
+    "no smoke, just a burnt smell from the toaster earlier",
+    "the basement is not flooding anymore",
+])
+def test_equipment_and_negated_hazards_are_not_critical(text):
+    assert classifier.classify(text)[0] != "critical"
+
+
+def test_negated_urgency_is_not_high():
+    assert classifier.classify("Not urgent, but the faucet drips")[0] == "normal"
+
+
+def test_property_keywords_add_to_defaults():
+    custom = PriorityClassifier()
+    custom.set_property_keywords("p1", {"critical": ["elevator stuck"]})
+    assert custom.classify("elevator stuck with people inside", "p1") == ("critical", "elevator stuck")
+    assert custom.classify("elevator stuck with people inside")[0] == "normal"